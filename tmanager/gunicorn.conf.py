@@ -0,0 +1,10 @@
+import os
+
+
+def child_exit(server, worker):
+    # Живые значения gauge умершего воркера больше не учитываются в /metrics,
+    # счетчики и гистограммы остаются в сумме.
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,4 +1,7 @@
 #!/bin/bash
 
+# Метрики всех процессов (gunicorn, воркеры celery) собираются из общего каталога.
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 
-cd tmanager && celery -A tmanager beat --loglevel=info & cd tmanager && celery -A tmanager worker --loglevel=info & cd tmanager && gunicorn --workers=7 tmanager.wsgi --access-logfile '-' --bind 0.0.0.0:8000
+cd tmanager && celery -A tmanager beat --loglevel=info & cd tmanager && celery -A tmanager worker -Q notifications -n notifications@%h --concurrency=${CELERY_NOTIFICATIONS_CONCURRENCY:-4} --loglevel=info & cd tmanager && celery -A tmanager worker -Q digest -n digest@%h --concurrency=${CELERY_DIGEST_CONCURRENCY:-2} --loglevel=info & cd tmanager && celery -A tmanager worker -Q maintenance -n maintenance@%h --concurrency=1 --loglevel=info & cd tmanager && gunicorn -c gunicorn.conf.py --workers=7 tmanager.wsgi --access-logfile '-' --bind 0.0.0.0:8000
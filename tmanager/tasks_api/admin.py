@@ -10,6 +10,9 @@ class AdminTask(admin.ModelAdmin):
     list_filter = ['status', 'priority', 'created_at', 'due_to']
     list_editable = ['status', 'priority', 'due_to']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('status', 'priority').prefetch_related('tags')
+
     def get_tags(self, obj):
         return ", ".join([str(tag) for tag in obj.tags.all()])
 
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class TasksApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tasks_api'
+
+    def ready(self):
+        # Подключает обработчики сигналов задач (история, счетчики бордов) и проверки настроек.
+        from . import checks, signals  # noqa: F401
+        from .search import install_search_index
+
+        post_migrate.connect(install_search_index, sender=self, dispatch_uid='tasks_api_search_index')
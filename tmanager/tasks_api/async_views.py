@@ -0,0 +1,170 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound, ValidationError
+
+from .authentication import AsyncJWTAuthentication
+from .filters import TaskFilterSet
+from .lookups import statuses
+from .mixins import SparseFieldsMixin
+from .models import Board, BoardStatusCounter, Task
+from .pagination import ApiViewCursorPaginator
+from .renderers import FastJSONRenderer
+from .response_cache import TASK_DEPENDENCIES, response_cache
+from .rows import TaskRowSerializer
+from .serializers import BoardSerializer, TaskSerializer
+
+
+class AsyncApiView(SparseFieldsMixin, View):
+    """
+    Read-only API view running on the event loop when served by an ASGI server
+    (see run_asgi.sh). The database is accessed with the async ORM, so one
+    process serves many concurrent (e.g. polling) clients.
+
+    Responses are the same as those of the DRF read views: JWT authentication,
+    IsAuthenticated permission, DRF error bodies, the same JSON and ETags.
+    Cached representations are shared with the DRF views.
+    """
+
+    authentication_class = AsyncJWTAuthentication
+    renderer_class = FastJSONRenderer
+    serializer_class = None
+    http_method_names = ['get', 'options']
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            authentication = self.authentication_class()
+            result = await authentication.aauthenticate(request)
+            if result is None:
+                raise NotAuthenticated()
+            request.user, request.auth = result
+            return await super().dispatch(request, *args, **kwargs)
+        except ObjectDoesNotExist:
+            return self.handle_exception(NotFound())
+        except APIException as exc:
+            return self.handle_exception(exc)
+
+    def handle_exception(self, exc):
+        # Как rest_framework.views.exception_handler.
+        headers = {}
+        if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+            headers['WWW-Authenticate'] = self.authentication_class().authenticate_header(self.request)
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        return self.render(data, exc.status_code, headers)
+
+    def render(self, data, status_code=status.HTTP_200_OK, headers=None):
+        content = self.renderer_class().render(data) if data is not None else b''
+        return HttpResponse(content, content_type='application/json', status=status_code, headers=headers)
+
+    async def cached_response(self, model, pk, compute, dependencies=()):
+        """
+        Returns cached representation of object with ETag, 304 if it matches If-None-Match.
+            :param compute: coroutine function building representation.
+        """
+        fields = self.get_requested_fields()
+        entry = await response_cache.aget_or_set(
+            model,
+            pk,
+            compute,
+            dependencies=dependencies,
+            salt=self.renderer_class.format,
+            variant=','.join(sorted(fields)) if fields is not None else '',
+        )
+
+        if response_cache.etag_matches(self.request, entry.etag):
+            return self.render(None, status.HTTP_304_NOT_MODIFIED, {'ETag': entry.etag})
+
+        return self.render(entry.data, headers={'ETag': entry.etag})
+
+
+class AsyncBoardApiView(AsyncApiView):
+
+    serializer_class = BoardSerializer
+
+    async def get(self, request, pk):
+        """
+        Get board by its unique identifier, async variant of board view.
+            :param request: HTTP GET request.
+            :returns HttpResponse: JSON response with ETag.
+        """
+        return await self.cached_response(Board, pk, lambda: self.serialize(pk))
+
+    async def serialize(self, pk):
+        names = self.get_requested_fields() or list(self.serializer_class().fields)
+        board = await self.only_requested_fields(Board.objects.all()).aget(pk=pk)
+
+        # Счетчики читаются отдельно: SerializerMethodField обращается к базе синхронно.
+        data = dict(self.serializer_class(board, fields=[name for name in names if name != 'status_counters']).data)
+        if 'status_counters' in names:
+            counts = {
+                status_id: count async for status_id, count in
+                BoardStatusCounter.objects.filter(board_id=pk).values_list('status_id', 'count')
+            }
+            data['status_counters'] = {obj.status: counts.get(obj.pk, 0) for obj in await statuses.aall()}
+        return data
+
+
+class AsyncTaskApiView(AsyncApiView):
+
+    serializer_class = TaskSerializer
+
+    async def get(self, request, pk):
+        """
+        Get task by its unique identifier, async variant of task view.
+            :param request: HTTP GET request.
+            :returns HttpResponse: JSON response with ETag.
+        """
+        return await self.cached_response(Task, pk, lambda: self.serialize(pk), dependencies=TASK_DEPENDENCIES)
+
+    async def serialize(self, pk):
+        serializer = TaskRowSerializer(self.get_requested_fields())
+        row = await serializer.get_queryset(Task.objects.filter(pk=pk)).afirst()
+        if row is None:
+            raise NotFound()
+        return (await serializer.aserialize([row]))[0]
+
+
+class AsyncBoardTasksApiView(AsyncApiView):
+
+    serializer_class = TaskSerializer
+    pagination_class = ApiViewCursorPaginator
+
+    async def get(self, request, pk):
+        """
+        Retrieves tasks of board, async variant of board tasks view. Accepts
+        the same filters; pagination is always keyset (?cursor=).
+            :param request: HTTP GET request.
+            :returns HttpResponse: JSON response.
+        """
+        if not await Board.objects.filter(pk=pk).aexists():
+            raise NotFound()
+
+        fields = self.get_requested_fields()
+        queryset = Task.objects.filter(board_id=pk)
+
+        filterset = TaskFilterSet(request.GET, queryset=queryset, request=request)
+        # Варианты фильтров берутся из LookupCache, который может обратиться к базе синхронно.
+        if not await sync_to_async(filterset.is_valid)():
+            raise ValidationError(filterset.errors)
+        queryset = filterset.qs
+
+        start = request.GET.get('start')
+        end = request.GET.get('end')
+        if start:
+            queryset = queryset.filter(created_at__gte=start)
+        if end:
+            queryset = queryset.filter(created_at__lte=end)
+
+        serializer = TaskRowSerializer(fields)
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(serializer.get_queryset(queryset, extra=paginator.ordering), request)
+        return self.render(paginator.get_paginated_data(await serializer.aserialize(page)))
+
+
+__all__ = [
+    'AsyncBoardApiView',
+    'AsyncTaskApiView',
+    'AsyncBoardTasksApiView',
+]
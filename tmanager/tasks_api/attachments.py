@@ -0,0 +1,256 @@
+import hashlib
+import os
+import re
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AttachmentUpload, Task
+
+BUFFER_SIZE = 1024 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UploadOffsetMismatch(Exception):
+
+    def __init__(self, offset):
+        super().__init__('Expected offset %s.' % offset)
+        self.offset = offset
+
+
+class UnsatisfiableRange(Exception):
+    pass
+
+
+def upload_dir():
+    return getattr(settings, 'ATTACHMENT_UPLOAD_DIR', None) or default_storage.path('uploads')
+
+
+def part_path(upload):
+    return os.path.join(upload_dir(), '%s.part' % upload.pk)
+
+
+def blob_name(sha256):
+    # Содержимое адресуется хэшем: одинаковые файлы хранятся один раз.
+    return 'attachments/%s/%s/%s' % (sha256[:2], sha256[2:4], sha256)
+
+
+def create_upload(task, user, filename, size):
+    upload = AttachmentUpload.objects.create(task=task, user=user, filename=os.path.basename(filename), size=size)
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def append_chunk(upload_id, offset, stream, length):
+    """
+    Appends next part of upload read from stream in small buffers.
+        :param upload_id: AttachmentUpload id.
+        :param offset: offset of the part given by client, must equal received size.
+        :param stream: file-like object to read the part from.
+        :param length: part length in bytes.
+        :returns AttachmentUpload: upload with new offset (completed when all bytes are received).
+        :raises UploadOffsetMismatch: if offset differs from received size.
+        :raises ValueError: if part exceeds declared file size or stream ends early.
+    """
+    with transaction.atomic():
+        # Блокировка строки: части одной загрузки записываются строго по очереди.
+        upload = AttachmentUpload.objects.select_for_update().get(pk=upload_id)
+        if upload.completed_at is not None or offset != upload.offset:
+            raise UploadOffsetMismatch(upload.offset)
+        if offset + length > upload.size:
+            raise ValueError('Part exceeds declared file size.')
+
+        with open(part_path(upload), 'r+b') as part:
+            part.seek(offset)
+            remaining = length
+            while remaining:
+                buffer = stream.read(min(BUFFER_SIZE, remaining))
+                if not buffer:
+                    break
+                part.write(buffer)
+                remaining -= len(buffer)
+            part.truncate()
+
+        if remaining:
+            raise ValueError('Request body is shorter than Content-Length.')
+
+        upload.offset += length
+        upload.save(update_fields=['offset'])
+
+    if upload.offset == upload.size:
+        # Файл собран и больше не меняется: хэшируется без блокировки строки.
+        upload = complete_upload(upload)
+
+    return upload
+
+
+def complete_upload(upload):
+    """
+    Hashes assembled file, puts it into content-addressed storage and attaches
+    it to the task. The stored file exists before the task refers to it; the
+    uploaded part is deleted after the transaction is committed.
+        :returns AttachmentUpload: completed upload.
+    """
+    path = part_path(upload)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for buffer in iter(lambda: part.read(BUFFER_SIZE), b''):
+            digest.update(buffer)
+    sha256 = digest.hexdigest()
+    name = blob_name(sha256)
+    store_blob(path, name)
+
+    with transaction.atomic():
+        upload = AttachmentUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.completed_at is not None:
+            return upload
+
+        upload.sha256 = sha256
+        upload.completed_at = timezone.now()
+        upload.save(update_fields=['sha256', 'completed_at'])
+
+        task = Task.objects.get(pk=upload.task_id)
+        task.attachment.name = name
+        task.save()
+
+        # При откате транзакции часть остается, и загрузку можно завершить повторно.
+        transaction.on_commit(lambda: remove_part(path))
+
+    return upload
+
+
+def store_blob(path, name):
+    """
+    Puts a copy of the file into storage under its content-addressed name.
+    Repeating it is harmless: a file with the same name has the same content.
+        :param path: path of the assembled upload, left in place.
+        :param name: storage name of the blob.
+    """
+    target = default_storage.path(name)
+    if os.path.exists(target):
+        return
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Файл появляется под своим именем только целиком: через временное имя и rename.
+    temporary = '%s.%s.tmp' % (target, uuid.uuid4().hex)
+    try:
+        os.link(path, temporary)
+    except OSError:
+        # Каталог загрузок на другой файловой системе: жесткая ссылка невозможна.
+        shutil.copyfile(path, temporary)
+    os.replace(temporary, target)
+
+
+def remove_part(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def is_blob_name(name):
+    return name.startswith('attachments/') and re.fullmatch(r'[0-9a-f]{64}', os.path.basename(name)) is not None
+
+
+def get_attachment_filename(task):
+    name = task.attachment.name
+    sha256 = os.path.basename(name)
+    upload = task.uploads.filter(sha256=sha256).exclude(completed_at=None).order_by('-completed_at').first()
+    return upload.filename if upload is not None else sha256
+
+
+def get_attachment_etag(name, stat=None):
+    """
+    Returns ETag of attachment file. Content-addressed files are tagged by
+    their hash; files attached before (named by the client) may be replaced
+    under the same name and are tagged by size and modification time.
+        :param name: storage name of attachment.
+        :param stat: os.stat_result of the file, read by name if not given.
+        :returns str: quoted ETag.
+        :raises FileNotFoundError: if a file with legacy name does not exist.
+    """
+    if is_blob_name(name):
+        return '"%s"' % os.path.basename(name)
+
+    if stat is None:
+        stat = os.stat(default_storage.path(name))
+    return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+
+def parse_range(header, size):
+    """
+    Parses single byte range of Range header.
+        :returns tuple: (start, end) inclusive, or None to serve whole file.
+        :raises UnsatisfiableRange: if range starts beyond the end of file.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        # Несколько диапазонов и другие единицы не поддерживаются: отдается весь файл.
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if not length:
+            raise UnsatisfiableRange()
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        raise UnsatisfiableRange()
+    if end < start:
+        return None
+    return start, end
+
+
+class RangeFile:
+    """
+    File-like view of a byte range. Exposes fileno() and tell() of the real
+    file, so gunicorn sends the range with sendfile(); other servers read it
+    in blocks.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def close(self):
+        self.file.close()
+
+
+__all__ = [
+    'UploadOffsetMismatch',
+    'UnsatisfiableRange',
+    'RangeFile',
+    'append_chunk',
+    'create_upload',
+    'get_attachment_etag',
+    'get_attachment_filename',
+    'parse_range',
+]
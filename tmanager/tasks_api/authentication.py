@@ -0,0 +1,166 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+# Утверждения о пользователе в токене (см. ClaimsTokenObtainPairSerializer).
+USER_CLAIMS = ('username', 'is_staff')
+
+USER_STATE_KEY = 'tasks_api:auth:user:%s'
+
+
+def get_user_state_timeout():
+    # Сколько секунд состояние пользователя используется без повторного чтения из базы.
+    return getattr(settings, 'AUTH_USER_STATE_TIMEOUT', 300)
+
+
+def make_user_state(user):
+    if user is None:
+        # Удаленный пользователь.
+        return {'username': None, 'is_staff': False, 'is_active': False}
+    return {
+        'username': user.username,
+        'is_staff': user.is_staff,
+        'is_active': user.is_active,
+    }
+
+
+def make_user_claims(user):
+    return {claim: getattr(user, claim) for claim in USER_CLAIMS}
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication which does not read the user row on every request.
+
+    Request user is built from user state (username, is_staff, is_active)
+    kept in the cache for AUTH_USER_STATE_TIMEOUT seconds. A missing state is
+    read from the database and cached; changing or deleting a user replaces
+    its state, so a deactivated or demoted user loses access on the next
+    request. Claims of the token are never trusted for permissions. With
+    CHECK_REVOKE_TOKEN the user is read from the database on every request.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+
+        user_id = self.get_user_id(validated_token)
+        key = USER_STATE_KEY % user_id
+        state = cache.get(key)
+        if state is None:
+            state = make_user_state(self.get_user_queryset(user_id).first())
+            cache.set(key, state, get_user_state_timeout())
+        return self.build_user(user_id, state)
+
+    @staticmethod
+    def get_user_id(validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def get_user_queryset(self, user_id):
+        return self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+
+    def build_user(self, user_id, state):
+        """
+        Returns user built from its state without reading the user row.
+            :raises AuthenticationFailed: if user is inactive or deleted.
+        """
+        if not state['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        user = self.user_model(
+            **{api_settings.USER_ID_FIELD: user_id},
+            username=state['username'],
+            is_staff=state['is_staff'],
+            is_active=True,
+        )
+        # Пользователь не загружался, но существует в базе (например, для внешних ключей).
+        user._state.adding = False
+        user._state.db = 'default'
+        return user
+
+
+class AsyncJWTAuthentication(ClaimsJWTAuthentication):
+    """
+    ClaimsJWTAuthentication for async views: the cache and the user row are
+    read with async APIs.
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+
+        if not api_settings.CHECK_REVOKE_TOKEN:
+            key = USER_STATE_KEY % user_id
+            state = await cache.aget(key)
+            if state is None:
+                state = make_user_state(await self.get_user_queryset(user_id).afirst())
+                await cache.aset(key, state, get_user_state_timeout())
+            return self.build_user(user_id, state)
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        return self.check_user(user, validated_token)
+
+    @staticmethod
+    def check_user(user, validated_token):
+        # Те же проверки, что и в JWTAuthentication.get_user().
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
+
+
+def store_user_state(sender, instance, created=False, **kwargs):
+    # Состояние нового пользователя будет прочитано из базы при первом запросе.
+    if created:
+        return
+    key = USER_STATE_KEY % instance.pk
+    state = make_user_state(instance)
+    transaction.on_commit(lambda: cache.set(key, state, get_user_state_timeout()))
+
+
+def store_deleted_user_state(sender, instance, **kwargs):
+    key = USER_STATE_KEY % instance.pk
+    state = dict(make_user_state(instance), is_active=False)
+    transaction.on_commit(lambda: cache.set(key, state, get_user_state_timeout()))
+
+
+post_save.connect(store_user_state, sender=get_user_model(), dispatch_uid='auth_user_state_save')
+post_delete.connect(store_deleted_user_state, sender=get_user_model(), dispatch_uid='auth_user_state_delete')
+
+
+__all__ = [
+    'make_user_claims',
+    'ClaimsJWTAuthentication',
+    'AsyncJWTAuthentication',
+]
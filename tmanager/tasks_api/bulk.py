@@ -0,0 +1,182 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .membership import membership
+from .models import Board, BoardStatusCounter, Task, TaskHistory
+from .notifications import notify, status_notification
+from .response_cache import response_cache
+from .serializers import TaskSerializer
+
+
+def error_result(index, errors, task_id=None):
+    result = {'index': index, 'status': 'error', 'errors': errors}
+    if task_id is not None:
+        result['id'] = task_id
+    return result
+
+
+def bulk_create_tasks(items):
+    """
+    Validates tasks one by one and creates the valid ones with a single INSERT.
+        :param items: list of task payloads.
+        :returns list: per-item results in the order of items.
+    """
+    results = [None] * len(items)
+    valid = []
+
+    for index, item in enumerate(items):
+        serializer = TaskSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, Task(**serializer.validated_data)))
+        else:
+            results[index] = error_result(index, serializer.errors)
+
+    deltas = Counter((task.board_id_id, task.status_id) for _, task in valid)
+
+    with transaction.atomic():
+        tasks = Task.objects.bulk_create([task for _, task in valid])
+        BoardStatusCounter.objects.apply_deltas(deltas)
+        response_cache.invalidate(Board, {board_id for board_id, _ in deltas})
+
+    for (index, _), task in zip(valid, tasks):
+        results[index] = {'index': index, 'status': 'created', 'id': task.pk}
+
+    return results
+
+
+def bulk_update_tasks(items, user, allowed_fields=None):
+    """
+    Validates partial updates against the current state of each task (including
+    the status transition table of TaskSerializer) and writes them with one
+    bulk UPDATE. Tasks are read locked, in the transaction of the write. Status changes produce TaskHistory rows in the same transaction
+    and their notifications are handed to notify() at once.
+        :param items: list of payloads, each with task `id`.
+        :param user: user performing update.
+        :param allowed_fields: if given, only these fields may be updated.
+        :returns list: per-item results in the order of items.
+    """
+    results = [None] * len(items)
+
+    ids = [item.get('id') for item in items if isinstance(item, dict)]
+    ids = [task_id for task_id in ids if isinstance(task_id, int)]
+
+    with transaction.atomic():
+        # Строки блокируются до конца транзакции в порядке pk, чтобы параллельные
+        # запросы не блокировали друг друга взаимно: переходы статусов, счетчики
+        # и история считаются от сохраненных значений, а не от устаревшего снимка.
+        tasks = {
+            task.pk: task for task in
+            Task.objects.select_related('status').select_for_update(of=('self',)).filter(pk__in=ids).order_by('pk')
+        }
+
+        if user.is_staff:
+            member_task_ids = None
+        else:
+            member_task_ids = membership.filter_member_tasks(tasks, user.id)
+
+        updated = []
+        transitions = []
+        deltas = Counter()
+        update_fields = set()
+        seen_ids = set()
+
+        for index, item in enumerate(items):
+            task_id = item.get('id') if isinstance(item, dict) else None
+
+            if not isinstance(task_id, int):
+                results[index] = error_result(index, {'id': ['This field is required.']})
+                continue
+            if task_id in seen_ids:
+                results[index] = error_result(index, {'id': ['Task is listed more than once.']}, task_id)
+                continue
+            seen_ids.add(task_id)
+
+            task = tasks.get(task_id)
+            if task is None:
+                results[index] = error_result(index, {'id': ['Task not found.']}, task_id)
+                continue
+            if member_task_ids is not None and task_id not in member_task_ids:
+                results[index] = error_result(index, {'error': 'Only participants or staff can change task status.'}, task_id)
+                continue
+
+            data = {key: value for key, value in item.items() if key != 'id'}
+            if allowed_fields is not None and set(data) - set(allowed_fields):
+                results[index] = error_result(
+                    index,
+                    {field: ['This field can not be updated here.'] for field in set(data) - set(allowed_fields)},
+                    task_id,
+                )
+                continue
+
+            serializer = TaskSerializer(task, data=data, partial=True)
+            if not serializer.is_valid():
+                results[index] = error_result(index, serializer.errors, task_id)
+                continue
+
+            previous_status = task.status
+            for attr, value in serializer.validated_data.items():
+                setattr(task, attr, value)
+
+            dirty_fields = task.get_dirty_fields()
+            if 'status_id' in dirty_fields:
+                task.previous_status_id = previous_status.pk
+                dirty_fields.append('previous_status_id')
+                transitions.append((task, previous_status))
+
+            deltas.update(task.get_counter_deltas((task.get_loaded_value('board_id_id'), previous_status.pk)))
+            update_fields.update(dirty_fields)
+            updated.append(task)
+            results[index] = {'index': index, 'status': 'updated', 'id': task_id}
+
+            if update_fields:
+                Task.objects.bulk_update(updated, sorted(update_fields))
+                response_cache.invalidate(Task, [task.pk for task in updated])
+            BoardStatusCounter.objects.apply_deltas(deltas)
+            response_cache.invalidate(Board, {board_id for board_id, _ in deltas})
+            TaskHistory.objects.bulk_create([
+                TaskHistory(
+                    user=user,
+                    task=task,
+                    previous_status=previous_status.status,
+                    current_status=task.status.status,
+                ) for task, previous_status in transitions
+            ])
+            if transitions:
+                notify(build_status_notifications(transitions, user))
+
+    for task in updated:
+        task._reset_loaded_values()
+
+    return results
+
+
+def build_status_notifications(transitions, user):
+    """
+    Builds status change notifications for many tasks at once.
+        :param transitions: list of (task, previous status).
+        :param user: user who changed statuses.
+        :returns list: (subject, text, recipients) for tasks having recipients.
+    """
+    recipients = defaultdict(set)
+    emails = Task.participants.through.objects.filter(
+        task_id__in=[task.pk for task, _ in transitions],
+    ).values_list('task_id', 'user__email')
+    for task_id, email in emails:
+        if email:
+            recipients[task_id].add(email)
+
+    messages = []
+    for task, previous_status in transitions:
+        if not recipients[task.pk]:
+            continue
+        subject, text = status_notification(task.title, user, previous_status, task.status)
+        messages.append((subject, text, recipients[task.pk]))
+
+    return messages
+
+
+__all__ = [
+    'bulk_create_tasks',
+    'bulk_update_tasks',
+]
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Кэши, которые не видны другим процессам (воркерам celery).
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches)
+def check_notification_cache(app_configs, **kwargs):
+    """
+    Coalesced notifications keep scheduled flushes and their counters in the
+    default cache, which web processes and workers must share.
+        :returns list: errors found.
+    """
+    if not getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 0):
+        return []
+
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+
+    return [
+        Error(
+            'NOTIFICATION_COALESCE_WINDOW requires a cache shared between processes.',
+            hint='Configure a shared default cache (Redis, Memcached, database) or set the window to 0.',
+            obj='settings.NOTIFICATION_COALESCE_WINDOW',
+            id='tasks_api.E001',
+        ),
+    ]
+
+
+__all__ = [
+    'check_notification_cache',
+]
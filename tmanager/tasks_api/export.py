@@ -0,0 +1,70 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_COLUMNS = [
+    'id', 'board_id', 'title', 'description', 'status', 'priority',
+    'participants', 'tags', 'attachment', 'created_at', 'due_to',
+]
+
+
+class Echo:
+    """
+    File-like object returning what is written, so csv.writer can encode one row at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_task_rows(queryset):
+    """
+    Yields tasks as dicts of EXPORT_COLUMNS. Rows are read with a chunked
+    (server-side on PostgreSQL) cursor, participants and tags are prefetched
+    per chunk, so memory does not depend on the number of tasks.
+        :param queryset: tasks queryset built with Task.objects.with_related().
+    """
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    for task in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'id': task.pk,
+            'board_id': task.board_id_id,
+            'title': task.title,
+            'description': task.description,
+            'status': str(task.status),
+            'priority': task.priority_id,
+            'participants': [str(user) for user in task.participants.all()],
+            'tags': [str(tag) for tag in task.tags.all()],
+            'attachment': task.attachment.name or None,
+            'created_at': task.created_at,
+            'due_to': task.due_to,
+        }
+
+
+def encode_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def encode_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        row['participants'] = ';'.join(row['participants'])
+        row['tags'] = ';'.join(row['tags'])
+        yield writer.writerow([row[column] for column in EXPORT_COLUMNS])
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', encode_ndjson),
+    'csv': ('text/csv', encode_csv),
+}
+
+
+__all__ = [
+    'EXPORT_COLUMNS',
+    'EXPORT_FORMATS',
+    'iter_task_rows',
+]
@@ -0,0 +1,28 @@
+from django_filters import rest_framework as filters
+
+from .lookups import priorities, statuses
+from .models import Task
+
+
+class LookupChoices:
+    """
+    Lazy choices out of a LookupCache, so filtering by status or priority
+    validates the value without querying the reference table. An iterable
+    rather than a callable: schema generation iterates choices directly.
+    """
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+
+    def __iter__(self):
+        return iter([(obj.pk, str(obj)) for obj in self.lookup.all()])
+
+
+class TaskFilterSet(filters.FilterSet):
+
+    status = filters.ChoiceFilter(choices=LookupChoices(statuses))
+    priority = filters.ChoiceFilter(choices=LookupChoices(priorities))
+
+    class Meta:
+        model = Task
+        fields = ['status', 'priority']
@@ -0,0 +1,343 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+import shutil
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import TaskHistory
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = ['id', 'task_id', 'user_id', 'timestamp', 'previous_status', 'current_status']
+
+
+def month_start(value):
+    return datetime.datetime(value.year, value.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def archive_dir():
+    directory = getattr(settings, 'TASK_HISTORY_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive'))
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def archive_path(month):
+    return os.path.join(archive_dir(), 'taskhistory-%s.ndjson.gz' % month.strftime('%Y-%m'))
+
+
+def write_archive(path, rows, append=False):
+    """
+    Writes rows to gzip-compressed NDJSON archive. Rows go to a temporary file
+    which is renamed to `path` once complete, so an interrupted write never
+    leaves an incomplete archive.
+        :param path: archive file path.
+        :param rows: iterable of tuples in ARCHIVE_COLUMNS order.
+        :param append: keep rows of an existing archive before the new ones.
+        :returns int: number of archived rows.
+    """
+    count = 0
+    target = path + '.tmp'
+    if append and os.path.exists(path):
+        # Дозапись: новые строки добавляются отдельным gzip member, файл остается читаемым.
+        shutil.copyfile(path, target)
+    else:
+        open(target, 'wb').close()
+
+    with gzip.open(target, 'at', encoding='utf-8') as archive:
+        for row in rows:
+            record = dict(zip(ARCHIVE_COLUMNS, row))
+            if isinstance(record['timestamp'], datetime.datetime):
+                record['timestamp'] = record['timestamp'].isoformat()
+            archive.write(json.dumps(record, ensure_ascii=False))
+            archive.write('\n')
+            count += 1
+
+    os.replace(target, path)
+    return count
+
+
+def read_last_id(path):
+    """
+    Returns id of the last row written to archive.
+        :returns int: row id, None if there is no archive or it is empty.
+    """
+    if not os.path.exists(path):
+        return None
+
+    last_line = None
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            if line.strip():
+                last_line = line
+    return json.loads(last_line)['id'] if last_line is not None else None
+
+
+class SingleTableHistoryStorage:
+    """
+    Degraded mode for databases without declarative partitioning (SQLite).
+
+    History stays in one table indexed by (task, timestamp) and (timestamp);
+    archiving streams rows older than the retention period month by month into
+    archive files and deletes them. The archive is renamed into place before
+    the deletion is committed; rows it already holds (the deletion of an
+    interrupted run rolled back) are only deleted, not written again.
+    """
+
+    chunk_size = 2000
+
+    def create_partitions(self, ahead):
+        return []
+
+    def archive(self, before):
+        """
+        Moves rows with timestamp earlier than `before` into archive files.
+            :param before: first month which is kept.
+            :returns dict: archived rows count per month.
+        """
+        archived = {}
+        oldest = TaskHistory.objects.filter(timestamp__lt=before).order_by('timestamp').values_list('timestamp', flat=True).first()
+        if oldest is None:
+            return archived
+
+        month = month_start(oldest)
+        while month < before:
+            end = add_months(month, 1)
+            rows = TaskHistory.objects.filter(timestamp__gte=month, timestamp__lt=end).order_by('id')
+
+            with transaction.atomic():
+                path = archive_path(month)
+                # id растут монотонно: строки с id не больше последнего в архиве уже в нем.
+                last_id = read_last_id(path)
+                new_rows = rows if last_id is None else rows.filter(id__gt=last_id)
+                count = write_archive(path, new_rows.values_list(*ARCHIVE_COLUMNS).iterator(chunk_size=self.chunk_size), append=True)
+                rows.delete()
+
+            if count:
+                archived[month.strftime('%Y-%m')] = count
+            month = end
+
+        return archived
+
+
+class PostgresHistoryStorage:
+    """
+    Native declarative partitioning of TaskHistory by month on PostgreSQL.
+
+    `convert()` turns the table created by migrations into a table partitioned
+    by range of `timestamp` (the primary key becomes (id, timestamp)), keeping
+    rows, indexes and foreign keys. Monthly partitions are created ahead of
+    time; a default partition catches rows outside of them. Archiving detaches
+    partitions older than the retention period, streams them into archive files
+    (one per partition) with a server-side cursor and drops them. A partition
+    whose archive file exists has been archived by an interrupted run and is
+    only dropped.
+    """
+
+    table = TaskHistory._meta.db_table
+    chunk_size = 5000
+
+    def partition_name(self, month):
+        return '%s_p%s' % (self.table, month.strftime('%Y_%m'))
+
+    def archive_path(self, name):
+        return os.path.join(archive_dir(), '%s.ndjson.gz' % name)
+
+    def is_partitioned(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s',
+                [self.table],
+            )
+            return cursor.fetchone() is not None
+
+    def convert(self):
+        """
+        Converts regular history table into partitioned one. Does nothing if it
+        is partitioned already.
+            :returns bool: whether table has been converted.
+        """
+        if self.is_partitioned():
+            return False
+
+        table = connection.ops.quote_name(self.table)
+        legacy = connection.ops.quote_name('%s_legacy' % self.table)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexdef FROM pg_indexes i JOIN pg_class c ON c.relname = i.indexname '
+                'JOIN pg_index x ON x.indexrelid = c.oid WHERE i.tablename = %s AND NOT x.indisprimary',
+                [self.table],
+            )
+            index_definitions = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+                [self.table],
+            )
+            foreign_keys = cursor.fetchall()
+            cursor.execute('SELECT min("timestamp") FROM %s' % table)
+            oldest = cursor.fetchone()[0] or timezone.now()
+
+            cursor.execute('ALTER TABLE %s RENAME TO %s' % (table, legacy))
+            cursor.execute(
+                'CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING IDENTITY) PARTITION BY RANGE ("timestamp")' % (table, legacy)
+            )
+            cursor.execute('ALTER TABLE %s ADD PRIMARY KEY ("id", "timestamp")' % table)
+            cursor.execute('CREATE TABLE %s PARTITION OF %s DEFAULT' % (connection.ops.quote_name('%s_default' % self.table), table))
+
+            month = month_start(oldest)
+            last = add_months(month_start(timezone.now()), getattr(settings, 'TASK_HISTORY_PARTITIONS_AHEAD', 3))
+            while month <= last:
+                self._create_partition(cursor, month)
+                month = add_months(month, 1)
+
+            cursor.execute('INSERT INTO %s SELECT * FROM %s' % (table, legacy))
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT max(id) FROM " + table + "), 1))",
+                [self.table],
+            )
+            cursor.execute('DROP TABLE %s' % legacy)
+
+            for definition in index_definitions:
+                cursor.execute(definition)
+            for name, definition in foreign_keys:
+                cursor.execute('ALTER TABLE %s ADD CONSTRAINT %s %s' % (table, connection.ops.quote_name(name), definition))
+
+        return True
+
+    def create_partitions(self, ahead):
+        """
+        Creates monthly partitions from the current month up to `ahead` months.
+            :returns list: names of created partitions.
+        """
+        created = []
+        month = month_start(timezone.now())
+        with connection.cursor() as cursor:
+            for _ in range(ahead + 1):
+                if self._create_partition(cursor, month):
+                    created.append(self.partition_name(month))
+                month = add_months(month, 1)
+        return created
+
+    def archive(self, before):
+        """
+        Detaches, archives and drops partitions which end not later than `before`.
+            :param before: first month which is kept.
+            :returns dict: archived rows count per month.
+        """
+        archived = {}
+        for name, month in self._partitions_before(before):
+            quoted = connection.ops.quote_name(name)
+
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT 1 FROM pg_inherits WHERE inhrelid = %s::regclass AND inhparent = %s::regclass',
+                    [name, self.table],
+                )
+                if cursor.fetchone():
+                    cursor.execute('ALTER TABLE %s DETACH PARTITION %s' % (connection.ops.quote_name(self.table), quoted))
+
+            path = self.archive_path(name)
+            if os.path.exists(path):
+                logger.info('Partition %s has been archived already, dropping it.', name)
+            else:
+                with transaction.atomic():
+                    with connection.chunked_cursor() as cursor:
+                        cursor.execute('SELECT %s FROM %s ORDER BY id' % (', '.join('"%s"' % column for column in ARCHIVE_COLUMNS), quoted))
+                        count = write_archive(path, self._fetch(cursor))
+
+                archived[month.strftime('%Y-%m')] = count
+                logger.info('Archived %s history rows of partition %s.', count, name)
+
+            with connection.cursor() as cursor:
+                cursor.execute('DROP TABLE %s' % quoted)
+
+        return archived
+
+    def _fetch(self, cursor):
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                return
+            yield from rows
+
+    def _partitions_before(self, before):
+        # Включая отсоединенные, но не удаленные партиции прерванного запуска.
+        prefix = '%s_p' % self.table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relname FROM pg_class WHERE relkind IN ('r', 'p') AND relname LIKE %s ORDER BY relname",
+                [prefix.replace('_', r'\_') + '%'],
+            )
+            names = [row[0] for row in cursor.fetchall()]
+
+        partitions = []
+        for name in names:
+            try:
+                month = datetime.datetime.strptime(name[len(prefix):], '%Y_%m').replace(tzinfo=datetime.timezone.utc)
+            except ValueError:
+                continue
+            if add_months(month, 1) <= before:
+                partitions.append((name, month))
+        return partitions
+
+    def _create_partition(self, cursor, month):
+        name = self.partition_name(month)
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+
+        cursor.execute(
+            'CREATE TABLE %s PARTITION OF %s FOR VALUES FROM (%%s) TO (%%s)' % (
+                connection.ops.quote_name(name),
+                connection.ops.quote_name(self.table),
+            ),
+            [month, add_months(month, 1)],
+        )
+        return True
+
+
+def get_history_storage():
+    """
+    Returns partitioned storage on PostgreSQL once the table has been converted
+    (see `manage.py partition_task_history --convert`), single table otherwise.
+    """
+    if connection.vendor == 'postgresql':
+        storage = PostgresHistoryStorage()
+        if storage.is_partitioned():
+            return storage
+    return SingleTableHistoryStorage()
+
+
+def maintain_history(retention_months=None, ahead=None):
+    """
+    Creates upcoming partitions and archives history older than retention period.
+        :param retention_months: full months of history kept in the database.
+        :param ahead: number of monthly partitions created in advance.
+        :returns tuple: (created partitions, archived rows count per month).
+    """
+    if retention_months is None:
+        retention_months = getattr(settings, 'TASK_HISTORY_RETENTION_MONTHS', 12)
+    if ahead is None:
+        ahead = getattr(settings, 'TASK_HISTORY_PARTITIONS_AHEAD', 3)
+
+    storage = get_history_storage()
+    created = storage.create_partitions(ahead)
+    archived = storage.archive(add_months(month_start(timezone.now()), -retention_months))
+
+    return created, archived
+
+
+__all__ = [
+    'get_history_storage',
+    'maintain_history',
+]
@@ -0,0 +1,374 @@
+import csv
+import io
+import json
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .lookups import priorities, statuses, tags
+from .models import Board, BoardStatusCounter, Task, TaskImport
+from .response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# Участники и метки в CSV перечисляются через ';', как в выгрузке задач.
+LIST_SEPARATOR = ';'
+
+# Связи проверяются словарями, а не clean_fields(): там был бы запрос на каждую строку.
+RELATED_FIELDS = ['board_id', 'status', 'priority', 'previous_status']
+
+
+def read_csv(stream):
+    """
+    Yields (line, row, errors) of CSV file with header (columns as in export).
+        :param stream: binary file object.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        yield reader.line_num, row, None
+
+
+def read_ndjson(stream):
+    """
+    Yields (line, row, errors) of file with one JSON object per line.
+        :param stream: binary file object.
+    """
+    for line, text in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), 1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError:
+            yield line, None, {'error': ['Invalid JSON.']}
+            continue
+        if not isinstance(row, dict):
+            yield line, None, {'error': ['Expected JSON object.']}
+            continue
+        yield line, row, None
+
+
+IMPORT_READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+def to_int(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+def split_list(value):
+    if value is None or value == '':
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(LIST_SEPARATOR) if item.strip()]
+    if isinstance(value, list):
+        return value
+    return None
+
+
+def copy_rows(table, columns, rows):
+    """
+    Writes rows with COPY FROM STDIN (PostgreSQL): one statement per table
+    instead of an INSERT with parameters for every row.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    quote_name = connection.ops.quote_name
+    sql = 'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (
+        quote_name(table), ', '.join(quote_name(column) for column in columns),
+    )
+    with connection.cursor() as cursor:
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy_expert'):
+            raw_cursor.copy_expert(sql, buffer)
+        else:
+            with raw_cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def use_copy():
+    return connection.vendor == 'postgresql' and getattr(settings, 'IMPORT_USE_COPY', True)
+
+
+def insert_rows(table, columns, rows):
+    """
+    Inserts tuples of plain values, without building model instances
+    (join tables of participants and tags).
+    """
+    if not rows:
+        return
+    if use_copy():
+        copy_rows(table, columns, rows)
+        return
+
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote_name(table), ', '.join(quote_name(column) for column in columns), ', '.join(['%s'] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def insert_tasks(tasks):
+    """
+    Inserts tasks and sets their ids: on PostgreSQL ids are taken from the
+    sequence beforehand and rows are written by COPY, otherwise bulk_create
+    returns them.
+    """
+    if not use_copy():
+        Task.objects.bulk_create(tasks)
+        return
+
+    meta = Task._meta
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+            [meta.db_table, meta.pk.column, len(tasks)],
+        )
+        for task, (pk,) in zip(tasks, cursor.fetchall()):
+            task.pk = pk
+
+    # Значения готовятся самими полями, как для INSERT: работают auto_now и значения по умолчанию.
+    fields = meta.concrete_fields
+    copy_rows(meta.db_table, [field.column for field in fields], [
+        [field.get_db_prep_save(field.pre_save(task, True), connection) for field in fields] for task in tasks
+    ])
+
+
+class TaskImporter:
+    """
+    Creates tasks from rows in batches.
+
+    References are resolved without a query per row: statuses, priorities and
+    tags through lookup caches, boards and participants with one query per
+    batch for values not seen before. Rejected rows are counted and reported
+    (the first `max_errors` of them), the rest of the batch is written with
+    bulk inserts, COPY on PostgreSQL, in one transaction.
+    """
+
+    def __init__(self, board=None, batch_size=None, max_errors=None, on_batch=None):
+        """
+        :param board: if given, all tasks are created on this board and
+            board_id of rows is ignored.
+        :param on_batch: called with the importer after every batch.
+        """
+        self.board = board
+        self.batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', 2000)
+        self.max_errors = getattr(settings, 'IMPORT_MAX_ERRORS', 1000) if max_errors is None else max_errors
+        self.on_batch = on_batch
+
+        self.processed = 0
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+        self.board_ids = set() if board is None else {board.pk}
+        self.user_ids = set()
+        self.user_ids_by_name = {}
+
+    def run(self, rows):
+        """
+        Imports rows produced by one of IMPORT_READERS.
+            :param rows: iterable of (line, row, errors).
+            :returns TaskImporter: self with counters and errors.
+        """
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        return self
+
+    def reject(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def import_batch(self, batch):
+        self.resolve_references([row for _, row, errors in batch if errors is None])
+
+        valid = []
+        for line, row, errors in batch:
+            if errors is None:
+                task, tag_ids, user_ids, errors = self.build_task(row)
+            if errors:
+                self.reject(line, errors)
+            else:
+                valid.append((line, task, tag_ids, user_ids))
+
+        if valid:
+            try:
+                with transaction.atomic():
+                    self.write(valid)
+            except DatabaseError as exc:
+                # Например, борд удален во время импорта: отклоняется только эта пачка.
+                for line, *_ in valid:
+                    self.reject(line, {'error': ['Batch could not be written: %s' % exc]})
+            else:
+                self.created += len(valid)
+
+        self.processed += len(batch)
+        if self.on_batch is not None:
+            self.on_batch(self)
+
+    def resolve_references(self, rows):
+        """
+        Loads boards and participants of the batch not seen in previous batches.
+        """
+        board_ids = set()
+        user_ids = set()
+        usernames = set()
+
+        for row in rows:
+            if self.board is None:
+                board_id = to_int(row.get('board_id'))
+                if board_id is not None and board_id not in self.board_ids:
+                    board_ids.add(board_id)
+            for participant in split_list(row.get('participants')) or ():
+                if isinstance(participant, str) and participant not in self.user_ids_by_name:
+                    usernames.add(participant)
+                elif to_int(participant) is not None and participant not in self.user_ids:
+                    user_ids.add(participant)
+
+        if board_ids:
+            self.board_ids.update(Board.objects.filter(pk__in=board_ids).values_list('pk', flat=True))
+        if user_ids:
+            self.user_ids.update(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        if usernames:
+            self.user_ids_by_name.update(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+
+    def build_task(self, row):
+        """
+        Validates row and builds unsaved task.
+            :returns tuple: (task, tag ids, participant ids, errors).
+        """
+        errors = {}
+        task = Task(
+            title=row.get('title') or '',
+            description=row.get('description') or '',
+            due_to=row.get('due_to') or None,
+        )
+        try:
+            task.clean_fields(exclude=RELATED_FIELDS)
+        except ValidationError as exc:
+            errors.update(exc.message_dict)
+
+        if self.board is not None:
+            task.board_id_id = self.board.pk
+        else:
+            board_id = to_int(row.get('board_id'))
+            if board_id is None:
+                errors['board_id'] = ['This field is required.']
+            elif board_id not in self.board_ids:
+                errors['board_id'] = ['Board %s not found.' % board_id]
+            else:
+                task.board_id_id = board_id
+
+        status = row.get('status')
+        status = statuses.get_by_slug(status) if isinstance(status, str) else None
+        if status is None:
+            errors['status'] = ['Expected one of: %s.' % ', '.join(status for status, _ in statuses.model.STATUSES)]
+        else:
+            task.status_id = status.pk
+
+        priority = row.get('priority')
+        if to_int(priority) is not None:
+            priority = priorities.get_by_pk(to_int(priority))
+        else:
+            priority = priorities.get_by_slug(priority) if isinstance(priority, str) else None
+        if priority is None:
+            errors['priority'] = ['Expected priority id or one of: %s.' % ', '.join(
+                priority for priority, _ in priorities.model.PRIORITIES
+            )]
+        else:
+            task.priority_id = priority.pk
+
+        tag_ids = {}
+        row_tags = split_list(row.get('tags'))
+        for slug in row_tags if row_tags is not None else [None]:
+            tag = tags.get_by_slug(slug) if isinstance(slug, str) else None
+            if tag is None:
+                errors.setdefault('tags', []).append('Tag %s not found.' % slug)
+            else:
+                tag_ids[tag.pk] = None
+
+        user_ids = {}
+        participants = split_list(row.get('participants'))
+        for participant in participants if participants is not None else [None]:
+            if isinstance(participant, str):
+                user_id = self.user_ids_by_name.get(participant)
+            else:
+                user_id = participant if to_int(participant) in self.user_ids else None
+            if user_id is None:
+                errors.setdefault('participants', []).append('User %s not found.' % participant)
+            else:
+                user_ids[user_id] = None
+
+        return task, list(tag_ids), list(user_ids), errors
+
+    def write(self, valid):
+        tasks = [task for _, task, _, _ in valid]
+        insert_tasks(tasks)
+
+        insert_rows(Task.tags.through._meta.db_table, ['task_id', 'tag_id'], [
+            (task.pk, tag_id) for _, task, tag_ids, _ in valid for tag_id in tag_ids
+        ])
+        insert_rows(Task.participants.through._meta.db_table, ['task_id', 'user_id'], [
+            (task.pk, user_id) for _, task, _, user_ids in valid for user_id in user_ids
+        ])
+
+        deltas = Counter((task.board_id_id, task.status_id) for task in tasks)
+        BoardStatusCounter.objects.apply_deltas(deltas)
+        response_cache.invalidate(Board, {board_id for board_id, _ in deltas})
+
+
+def run_import(task_import):
+    """
+    Processes uploaded TaskImport, saving progress after every batch.
+        :param task_import: TaskImport in pending state.
+        :returns TaskImporter: finished importer.
+    """
+    imports = TaskImport.objects.filter(pk=task_import.pk)
+    imports.update(state=TaskImport.RUNNING, started_at=timezone.now())
+
+    def save_progress(importer):
+        imports.update(
+            processed=importer.processed,
+            created=importer.created,
+            failed=importer.failed,
+            errors=importer.errors,
+        )
+
+    importer = TaskImporter(board=task_import.board, on_batch=save_progress)
+    try:
+        with task_import.file.open('rb') as stream:
+            importer.run(IMPORT_READERS[task_import.format](stream))
+    except Exception as exc:
+        # Строки до ошибки уже записаны пачками: импорт прерывается с причиной.
+        logger.exception('Task import %s failed.', task_import.pk)
+        imports.update(state=TaskImport.FAILED, message=str(exc), finished_at=timezone.now())
+    else:
+        imports.update(state=TaskImport.DONE, finished_at=timezone.now())
+    return importer
+
+
+__all__ = [
+    'IMPORT_READERS',
+    'TaskImporter',
+    'run_import',
+]
@@ -0,0 +1,168 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import Priority, Status, Tag
+
+
+class LookupCache:
+    """
+    Process-local copy of a small reference table (Status, Tag, Priority).
+
+    Rows are kept in memory and looked up by primary key or by slug without
+    touching the database. Each table has a version token in the shared Django
+    cache: a change of a row bumps it, and every worker process compares its
+    local version with the shared one at most once in LOOKUP_CACHE_CHECK_INTERVAL
+    seconds, reloading the table when they differ.
+
+    Returned instances are shared between requests and must not be modified.
+    """
+
+    def __init__(self, model, slug_field):
+        self.model = model
+        self.slug_field = slug_field
+        self.version_key = 'tasks_api:lookups:%s' % model._meta.label_lower
+
+        self._lock = threading.Lock()
+        self._rows = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def __deepcopy__(self, memo):
+        # Serializer fields deep-copy their arguments; the cache is shared.
+        return self
+
+    def get_by_pk(self, pk):
+        return self._get_rows()[0].get(pk)
+
+    def get_by_slug(self, slug):
+        return self._get_rows()[1].get(slug)
+
+    def all(self):
+        return list(self._get_rows()[0].values())
+
+    def get_version(self):
+        """
+        Returns version token of the local copy; it changes when the table does.
+        """
+        self._get_rows()
+        return self._version
+
+    def get_or_create(self, slug):
+        """
+        Returns cached row by slug, creating it if it does not exist yet.
+            :param slug: value of slug field.
+            :returns instance: model instance.
+        """
+        obj = self.get_by_slug(slug)
+        if obj is None:
+            obj, created = self.model.objects.get_or_create(**{self.slug_field: slug})
+        return obj
+
+    async def aget_by_pk(self, pk):
+        return (await self._aget_rows())[0].get(pk)
+
+    async def aall(self):
+        return list((await self._aget_rows())[0].values())
+
+    async def aget_version(self):
+        await self._aget_rows()
+        return self._version
+
+    def invalidate(self):
+        """
+        Drops local copy immediately and bumps the shared version after commit,
+        so that other worker processes reload the table too.
+        """
+        self._rows = None
+        transaction.on_commit(lambda: cache.set(self.version_key, uuid.uuid4().hex, None))
+
+    def _get_rows(self):
+        now = time.monotonic()
+        interval = getattr(settings, 'LOOKUP_CACHE_CHECK_INTERVAL', 5)
+
+        rows = self._rows
+        if rows is not None and now - self._checked_at < interval:
+            return rows
+
+        with self._lock:
+            version = cache.get(self.version_key)
+            if version is None:
+                cache.add(self.version_key, uuid.uuid4().hex, None)
+                version = cache.get(self.version_key)
+
+            rows = self._rows
+            if rows is None or version != self._version:
+                objects = list(self.model.objects.all())
+                rows = (
+                    {obj.pk: obj for obj in objects},
+                    {getattr(obj, self.slug_field): obj for obj in objects},
+                )
+                self._rows = rows
+                self._version = version
+
+            self._checked_at = now
+            return rows
+
+    async def _aget_rows(self):
+        """
+        _get_rows() for async views: the table is reloaded with the async ORM.
+        Concurrent reloads are harmless, so no lock is taken.
+        """
+        now = time.monotonic()
+        interval = getattr(settings, 'LOOKUP_CACHE_CHECK_INTERVAL', 5)
+
+        rows = self._rows
+        if rows is not None and now - self._checked_at < interval:
+            return rows
+
+        version = await cache.aget(self.version_key)
+        if version is None:
+            await cache.aadd(self.version_key, uuid.uuid4().hex, None)
+            version = await cache.aget(self.version_key)
+
+        rows = self._rows
+        if rows is None or version != self._version:
+            objects = [obj async for obj in self.model.objects.all()]
+            rows = (
+                {obj.pk: obj for obj in objects},
+                {getattr(obj, self.slug_field): obj for obj in objects},
+            )
+            self._rows = rows
+            self._version = version
+
+        self._checked_at = now
+        return rows
+
+
+statuses = LookupCache(Status, 'status')
+tags = LookupCache(Tag, 'tag')
+priorities = LookupCache(Priority, 'priority')
+
+LOOKUPS = {
+    Status: statuses,
+    Tag: tags,
+    Priority: priorities,
+}
+
+
+def invalidate_lookup(sender, **kwargs):
+    LOOKUPS[sender].invalidate()
+
+
+for lookup_model in LOOKUPS:
+    post_save.connect(invalidate_lookup, sender=lookup_model, dispatch_uid='invalidate_lookup_%s' % lookup_model.__name__)
+    post_delete.connect(invalidate_lookup, sender=lookup_model, dispatch_uid='invalidate_lookup_delete_%s' % lookup_model.__name__)
+
+
+__all__ = [
+    'LookupCache',
+    'statuses',
+    'tags',
+    'priorities',
+]
@@ -0,0 +1,159 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+logger = logging.getLogger(__name__)
+
+
+def build_message(subject, html_message, recipients):
+    """
+    Builds HTML e-mail with subject used as plain text body, like send_mail did.
+        :returns EmailMultiAlternatives: message.
+    """
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=subject,
+        from_email=os.getenv('EMAIL_USER'),
+        to=list(recipients),
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
+def is_connection_error(exc):
+    """
+    Tells whether sending failed because the connection was lost. Other SMTP
+    errors (refused recipients, rejected data) are raised by the server over
+    a working connection and would fail again on a new one.
+        :returns bool: True for SMTP disconnect and connect errors and socket errors.
+    """
+    if isinstance(exc, smtplib.SMTPException):
+        return isinstance(exc, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError))
+    return isinstance(exc, OSError)
+
+
+def is_transient_error(exc):
+    """
+    Tells whether sending may succeed if retried later: the connection was
+    lost or the server answered with a temporary (4xx) reply. Permanent (5xx)
+    replies would be the same on retry.
+        :returns bool: True for connection errors and 4xx replies.
+    """
+    if is_connection_error(exc):
+        return True
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    return isinstance(exc, smtplib.SMTPResponseException) and 400 <= exc.smtp_code < 500
+
+
+class ConnectionPool:
+    """
+    Keeps one open mail connection per worker process.
+
+    Opening an SMTP connection (TCP, STARTTLS, AUTH) costs far more than sending
+    a message over it, so the connection is opened once and reused by every job
+    the process runs. A connection idle for longer than MAIL_HEALTHCHECK_INTERVAL
+    seconds is checked with NOOP before use; a broken connection is reopened and
+    sending resumes from the message which failed.
+    """
+
+    max_attempts = 2
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connection = None
+        self._used_at = 0.0
+
+    def send_messages(self, messages):
+        """
+        Sends messages over the pooled connection.
+            :param messages: list of EmailMessage.
+            :returns int: number of sent messages.
+        """
+        if not messages:
+            return 0
+
+        with self._lock:
+            sent = 0
+            attempts = 0
+            while sent < len(messages):
+                try:
+                    connection = self._get_connection()
+                    connection.send_messages([messages[sent]])
+                    sent += 1
+                    attempts = 0
+                except OSError as exc:
+                    if not is_connection_error(exc):
+                        raise
+                    self._close()
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        raise
+                    logger.warning('Mail connection has been lost, reconnecting.')
+                finally:
+                    self._used_at = time.monotonic()
+
+        return sent
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _get_connection(self):
+        connection = self._connection
+        interval = getattr(settings, 'MAIL_HEALTHCHECK_INTERVAL', 30)
+
+        if connection is not None and time.monotonic() - self._used_at >= interval and not self._is_alive(connection):
+            self._close()
+            connection = None
+
+        if connection is None:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            self._connection = connection
+
+        return connection
+
+    @staticmethod
+    def _is_alive(connection):
+        smtp = getattr(connection, 'connection', None)
+        if smtp is None:
+            # Не SMTP бэкенд (console, locmem) - проверять нечего.
+            return True
+        try:
+            return smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except (smtplib.SMTPException, OSError):
+                pass
+
+
+pool = ConnectionPool()
+
+
+@worker_process_shutdown.connect
+def close_pool(**kwargs):
+    pool.close()
+
+
+def send_messages(messages):
+    return pool.send_messages(messages)
+
+
+__all__ = [
+    'build_message',
+    'ConnectionPool',
+    'send_messages',
+]
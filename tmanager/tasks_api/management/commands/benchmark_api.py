@@ -0,0 +1,336 @@
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from tasks_api import urls
+from tasks_api.attachments import append_chunk, create_upload, part_path
+from tasks_api.membership import membership
+from tasks_api.metrics import track_queries
+from tasks_api.models import AttachmentUpload, Board, Task, TaskImport
+from tasks_api.response_cache import response_cache
+from tasks_api.serializers import ClaimsTokenObtainPairSerializer
+
+CHUNK = b'0123456789abcdef' * 64
+
+
+class Rollback(Exception):
+    pass
+
+
+class Scenario:
+    """
+    One endpoint call: `build(context, iteration)` returns path and request
+    arguments for the test client.
+    """
+
+    def __init__(self, name, method, build, max_iterations=None, label=None):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.max_iterations = max_iterations
+        self.label = label or '%s %s' % (name, method.upper())
+
+
+def json_body(data):
+    return {'data': json.dumps(data), 'content_type': 'application/json'}
+
+
+def task_payload(context, iteration):
+    return {
+        'title': 'Benchmark task %s' % iteration,
+        'description': 'Created by benchmark.',
+        'board_id': context['board'].pk,
+        'priority': context['task'].priority_id,
+        'tags': context['tag_ids'],
+        'due_to': '2030-01-01',
+        'status': 'to_do',
+        'participants': [context['user'].pk],
+    }
+
+
+def next_to_do_ids(context, count=5):
+    ids, context['to_do_ids'] = context['to_do_ids'][:count], context['to_do_ids'][count:]
+    context['used_to_do_ids'].extend(ids)
+    return ids
+
+
+SCENARIOS = [
+    Scenario('token_get', 'post', lambda c, i: (
+        reverse('tasks_api:token_get'), json_body({'username': c['user'].username, 'password': c['password']}),
+    ), max_iterations=10),
+    Scenario('token_refresh', 'post', lambda c, i: (
+        reverse('tasks_api:token_refresh'), json_body({'refresh': c['refresh']}),
+    )),
+    Scenario('board', 'get', lambda c, i: (reverse('tasks_api:board', kwargs={'pk': c['board'].pk}), {})),
+    Scenario('task', 'get', lambda c, i: (reverse('tasks_api:task', kwargs={'pk': c['task'].pk}), {})),
+    Scenario('task', 'put', lambda c, i: (
+        reverse('tasks_api:task', kwargs={'pk': c['task'].pk}), json_body({'title': 'Benchmark %s' % i}),
+    )),
+    Scenario('board_tasks', 'get', lambda c, i: (reverse('tasks_api:board_tasks', kwargs={'pk': c['board'].pk}), {})),
+    Scenario('board_tasks', 'get', lambda c, i: (
+        reverse('tasks_api:board_tasks', kwargs={'pk': c['board'].pk}) + '?pagination=cursor', {},
+    ), label='board_tasks GET cursor'),
+    Scenario('board_tasks', 'get', lambda c, i: (
+        reverse('tasks_api:board_tasks', kwargs={'pk': c['board'].pk}) + '?status=%s&page=5' % c['task'].status_id, {},
+    ), label='board_tasks GET status'),
+    Scenario('board_tasks_search', 'get', lambda c, i: (
+        reverse('tasks_api:board_tasks_search', kwargs={'pk': c['board'].pk}) + '?q=%s' % c['search'], {},
+    )),
+    Scenario('board_tasks_export', 'get', lambda c, i: (
+        reverse('tasks_api:board_tasks_export', kwargs={'pk': c['board'].pk}), {},
+    ), max_iterations=20),
+    Scenario('task_attachment', 'get', lambda c, i: (
+        reverse('tasks_api:task_attachment', kwargs={'pk': c['task'].pk}), {'HTTP_RANGE': 'bytes=0-99'},
+    )),
+    Scenario('async_board', 'get', lambda c, i: (reverse('tasks_api:async_board', kwargs={'pk': c['board'].pk}), {})),
+    Scenario('async_task', 'get', lambda c, i: (reverse('tasks_api:async_task', kwargs={'pk': c['task'].pk}), {})),
+    Scenario('async_board_tasks', 'get', lambda c, i: (
+        reverse('tasks_api:async_board_tasks', kwargs={'pk': c['board'].pk}), {},
+    )),
+    Scenario('create_board', 'post', lambda c, i: (
+        reverse('tasks_api:create_board'), json_body({'title': 'Benchmark %s' % i, 'description': 'Benchmark.'}),
+    )),
+    Scenario('create_task', 'post', lambda c, i: (reverse('tasks_api:create_task'), json_body(task_payload(c, i)))),
+    Scenario('user-register', 'post', lambda c, i: (
+        reverse('tasks_api:user-register'),
+        json_body({'username': 'benchmark_%s_%s' % (c['run'], i), 'email': 'b%s@example.com' % i, 'password': 'benchmark'}),
+    ), max_iterations=10),
+    Scenario('bulk_create_tasks', 'post', lambda c, i: (
+        reverse('tasks_api:bulk_create_tasks'), json_body([task_payload(c, '%s.%s' % (i, n)) for n in range(10)]),
+    )),
+    Scenario('bulk_update_tasks', 'put', lambda c, i: (
+        reverse('tasks_api:bulk_update_tasks'),
+        json_body([{'id': task_id, 'title': 'Benchmark %s' % i} for task_id in c['board_task_ids'][:10]]),
+    )),
+    Scenario('bulk_task_status', 'put', lambda c, i: (
+        reverse('tasks_api:bulk_task_status'),
+        json_body([{'id': task_id, 'status': 'in_progress'} for task_id in next_to_do_ids(c)]),
+    )),
+    Scenario('attachment_uploads', 'post', lambda c, i: (
+        reverse('tasks_api:attachment_uploads', kwargs={'pk': c['task'].pk}), json_body({'filename': 'b.bin', 'size': 1024}),
+    )),
+    Scenario('attachment_upload', 'patch', lambda c, i: (
+        reverse('tasks_api:attachment_upload', kwargs={'pk': c['upload'].pk}),
+        {
+            'data': CHUNK,
+            'content_type': 'application/offset+octet-stream',
+            'HTTP_UPLOAD_OFFSET': str(i * len(CHUNK)),
+        },
+    )),
+    Scenario('task_imports', 'post', lambda c, i: (
+        reverse('tasks_api:task_imports'), {'data': {'file': SimpleUploadedFile('benchmark.csv', c['import_csv'])}},
+    )),
+    Scenario('task_import', 'get', lambda c, i: (
+        reverse('tasks_api:task_import', kwargs={'pk': c['task_import'].pk}), {},
+    )),
+    Scenario('schema-json', 'get', lambda c, i: (reverse('tasks_api:schema-json', kwargs={'format': '.json'}), {})),
+    Scenario('schema-swagger-ui', 'get', lambda c, i: (reverse('tasks_api:schema-swagger-ui'), {})),
+    Scenario('schema-redoc', 'get', lambda c, i: (reverse('tasks_api:schema-redoc'), {})),
+]
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Calls every endpoint of tasks_api/urls.py in-process with the test client and reports throughput, '
+        'p50/p95/p99 latency and database queries per request. Uses the biggest board of the configured '
+        'database (see seed_data); all changes are rolled back. Results are written as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=3, help='Requests per endpoint before measuring.')
+        parser.add_argument('--only', action='append', help='URL name to run (repeatable).')
+        parser.add_argument('--output', default='benchmark-results.json', help='File to write JSON results to.')
+        parser.add_argument('--compare', help='Previous results file: prints p50 and queries change.')
+
+    def handle(self, *args, **options):
+        self.check_coverage()
+
+        scenarios = [scenario for scenario in SCENARIOS if not options['only'] or scenario.name in options['only']]
+        if not scenarios:
+            raise CommandError('No endpoints match --only.')
+
+        results = {}
+        context = {}
+        uploads = []
+        import_files = []
+        try:
+            with transaction.atomic():
+                context.update(self.prepare(options['iterations'] + options['warmup']))
+                for scenario in scenarios:
+                    results[scenario.label] = self.run(scenario, context, options['iterations'], options['warmup'])
+                uploads = list(AttachmentUpload.objects.filter(user=context['user']))
+                import_files = list(TaskImport.objects.filter(user=context['user']).values_list('file', flat=True))
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            self.cleanup(context, uploads, import_files)
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'boards': Board.objects.count(),
+                'tasks': Task.objects.count(),
+                'board_tasks': context['board_tasks'],
+            },
+            'iterations': options['iterations'],
+            'results': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+
+        self.print_results(results, options['compare'])
+        self.stdout.write('Results are written to %s.' % options['output'])
+
+    def check_coverage(self):
+        names = {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern)}
+        missing = names - {scenario.name for scenario in SCENARIOS}
+        if missing:
+            self.stderr.write('Endpoints without benchmark scenario: %s' % ', '.join(sorted(missing)))
+
+    def prepare(self, requests):
+        board = Board.objects.annotate(task_count=Count('tasks')).order_by('-task_count', 'id').first()
+        if board is None:
+            raise CommandError('Database is empty, run seed_data first.')
+        board_task_ids = list(board.tasks.order_by('id').values_list('id', flat=True))
+        task = Task.objects.get(pk=board_task_ids[0])
+
+        password = 'benchmark'
+        run = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        user = User.objects.create_user('benchmark_%s' % run, 'benchmark@example.com', password, is_staff=True)
+        task.participants.add(user)
+        refresh = ClaimsTokenObtainPairSerializer.get_token(user)
+
+        upload = create_upload(task, user, 'benchmark.bin', len(CHUNK) * requests)
+        append_chunk(create_upload(task, user, 'attachment.bin', len(CHUNK)).pk, 0, io.BytesIO(CHUNK), len(CHUNK))
+
+        # Файл импорта сохраняется, но задача Celery не запускается: транзакция откатывается.
+        import_csv = 'board_id,title,description,status,priority,participants,tags,due_to\n' + ''.join(
+            '%s,Imported %s,Benchmark import.,to_do,%s,%s,,2030-01-01\n' % (board.pk, i, task.priority_id, user.username)
+            for i in range(100)
+        )
+        task_import = TaskImport.objects.create(user=user, file='imports/benchmark.csv', format='csv')
+
+        # С пустым ALLOWED_HOSTS (DEBUG) разрешен localhost.
+        hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+        client = Client(HTTP_AUTHORIZATION='Bearer %s' % refresh.access_token, HTTP_HOST=hosts[0] if hosts else 'localhost')
+        return {
+            'client': client,
+            'board': board,
+            'board_tasks': len(board_task_ids),
+            'board_task_ids': board_task_ids,
+            'used_to_do_ids': [],
+            'to_do_ids': list(board.tasks.filter(status__status='to_do').order_by('id').values_list('id', flat=True)),
+            'task': task,
+            'tag_ids': list(task.tags.values_list('id', flat=True)),
+            'user': user,
+            'password': password,
+            'refresh': str(refresh),
+            'search': (task.title.split() or ['task'])[0],
+            'upload': upload,
+            'import_csv': import_csv.encode(),
+            'task_import': task_import,
+            'run': run,
+        }
+
+    def cleanup(self, context, uploads, import_files):
+        # Части загрузок и файлы импорта лежат на диске и не откатываются вместе с транзакцией.
+        for upload in uploads:
+            if os.path.exists(part_path(upload)):
+                os.remove(part_path(upload))
+        for name in import_files:
+            default_storage.delete(name)
+
+        # Кэш заполнялся изменениями, которые откатились: версии затронутых объектов сбрасываются.
+        if context:
+            task_ids = {context['task'].pk} | set(context['board_task_ids'][:10]) | set(context['used_to_do_ids'])
+            response_cache.invalidate(Task, task_ids)
+            response_cache.invalidate(Board, [context['board'].pk])
+            membership.invalidate([context['task'].pk])
+
+    def run(self, scenario, context, iterations, warmup):
+        if scenario.max_iterations:
+            iterations = min(iterations, scenario.max_iterations)
+        request = getattr(context['client'], scenario.method)
+
+        latencies, queries, statuses = [], [], {}
+        for iteration in range(warmup + iterations):
+            path, kwargs = scenario.build(context, iteration)
+            started = time.perf_counter()
+            with track_queries() as stats:
+                response = request(path, **kwargs)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+            elapsed = time.perf_counter() - started
+
+            if iteration < warmup:
+                continue
+            latencies.append(elapsed * 1000)
+            queries.append(stats.count)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        total = sum(latencies) / 1000
+        return {
+            'path': path,
+            'requests': len(latencies),
+            'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+            'throughput_rps': round(len(latencies) / total, 1) if total else 0.0,
+            'latency_ms': {
+                'mean': round(statistics.fmean(latencies), 2),
+                'p50': round(percentile(latencies, 0.5), 2),
+                'p95': round(percentile(latencies, 0.95), 2),
+                'p99': round(percentile(latencies, 0.99), 2),
+            },
+            'queries': {'mean': round(statistics.fmean(queries), 2), 'max': max(queries)},
+        }
+
+    def print_results(self, results, compare):
+        previous = {}
+        if compare:
+            with open(compare) as baseline:
+                previous = json.load(baseline)['results']
+
+        self.stdout.write('%-40s %9s %9s %9s %9s %8s  %s' % ('endpoint', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'status'))
+        for name, result in results.items():
+            line = '%-40s %9.1f %9.2f %9.2f %9.2f %8.1f  %s' % (
+                name, result['throughput_rps'], result['latency_ms']['p50'], result['latency_ms']['p95'],
+                result['latency_ms']['p99'], result['queries']['mean'],
+                ','.join('%s:%s' % item for item in result['status_codes'].items()),
+            )
+            before = previous.get(name)
+            if before and before['latency_ms']['p50']:
+                line += '  p50 %+.0f%%, queries %+.1f' % (
+                    (result['latency_ms']['p50'] / before['latency_ms']['p50'] - 1) * 100,
+                    result['queries']['mean'] - before['queries']['mean'],
+                )
+            self.stdout.write(line)
+
@@ -0,0 +1,180 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+ENDPOINTS = {
+    'board': ('/api/v1/board/{pk}/', '/api/v1/async/board/{pk}/'),
+    'task': ('/api/v1/task/{pk}/', '/api/v1/async/task/{pk}/'),
+    'board_tasks': ('/api/v1/board/{pk}/tasks/?pagination=cursor', '/api/v1/async/board/{pk}/tasks/'),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by server.')
+
+    length, chunked, close = 0, False, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and value == 'chunked':
+            chunked = True
+        elif name == 'connection' and value == 'close':
+            close = True
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.readexactly(length)
+
+    return int(status_line.split()[1]), close
+
+
+async def client(port, request, count, latencies, errors):
+    connection = None
+    for _ in range(count):
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection('127.0.0.1', port)
+            reader, writer = connection
+            writer.write(request)
+            await writer.drain()
+            status_code, close = await read_response(reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            errors.append(None)
+            connection = None
+            continue
+
+        latencies.append(time.perf_counter() - started)
+        if status_code != 200:
+            errors.append(status_code)
+        if close:
+            # Синхронные воркеры gunicorn не поддерживают keep-alive.
+            connection[1].close()
+            connection = None
+
+    if connection is not None:
+        connection[1].close()
+
+
+async def run_load(port, path, token, total, concurrency):
+    request = (
+        'GET %s HTTP/1.1\r\nHost: 127.0.0.1:%s\r\nAuthorization: Bearer %s\r\nConnection: keep-alive\r\n\r\n'
+        % (path, port, token)
+    ).encode()
+    latencies, errors = [], []
+    per_client = max(total // concurrency, 1)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client(port, request, per_client, latencies, errors) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Starts the project under gunicorn sync workers (WSGI, as run.sh does) and under uvicorn '
+        '(ASGI, async views) and compares throughput and latency of a read endpoint under concurrent load. '
+        'Uses the configured database, which must contain the requested object.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='task')
+        parser.add_argument('--pk', type=int, default=1)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--wsgi-workers', type=int, default=7, help='gunicorn workers (run.sh uses 7).')
+        parser.add_argument('--asgi-workers', type=int, default=1, help='uvicorn worker processes.')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='benchmark_http')
+        token = str(AccessToken.for_user(user))
+        sync_path, async_path = (path.format(pk=options['pk']) for path in ENDPOINTS[options['endpoint']])
+
+        servers = (
+            ('WSGI gunicorn x%s' % options['wsgi_workers'], sync_path, [
+                sys.executable, '-m', 'gunicorn', 'tmanager.wsgi',
+                '--workers', str(options['wsgi_workers']), '--bind', '127.0.0.1:{port}', '--log-level', 'warning',
+            ]),
+            ('ASGI uvicorn x%s' % options['asgi_workers'], async_path, [
+                sys.executable, '-m', 'uvicorn', 'tmanager.asgi:application',
+                '--workers', str(options['asgi_workers']), '--host', '127.0.0.1', '--port', '{port}',
+                '--log-level', 'warning', '--no-access-log',
+            ]),
+        )
+
+        self.stdout.write('endpoint: %s, requests: %s, concurrency: %s' % (
+            options['endpoint'], options['requests'], options['concurrency'],
+        ))
+        for name, path, command in servers:
+            port = free_port()
+            process = subprocess.Popen(
+                [part.format(port=port) for part in command],
+                cwd=settings.BASE_DIR,
+                env=dict(os.environ),
+            )
+            try:
+                self.wait_ready(port, path, token)
+                latencies, errors, elapsed = asyncio.run(
+                    run_load(port, path, token, options['requests'], options['concurrency'])
+                )
+            finally:
+                process.terminate()
+                process.wait(10)
+
+            self.report(name, latencies, errors, elapsed)
+
+    def wait_ready(self, port, path, token, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                latencies, errors, elapsed = asyncio.run(run_load(port, path, token, 1, 1))
+            except OSError:
+                latencies, errors = [], [None]
+            if latencies and not errors:
+                return
+            if latencies and errors:
+                raise CommandError('%s returned HTTP %s.' % (path, errors[0]))
+            time.sleep(0.2)
+        raise CommandError('Server on port %s did not start.' % port)
+
+    def report(self, name, latencies, errors, elapsed):
+        latencies = sorted(latencies)
+
+        def percentile(value):
+            if not latencies:
+                return 0.0
+            return latencies[min(int(len(latencies) * value), len(latencies) - 1)] * 1000
+
+        self.stdout.write(
+            '%-20s %8.1f req/s   p50 %7.1f ms   p99 %7.1f ms   errors %s' % (
+                name, len(latencies) / elapsed if elapsed else 0.0, percentile(0.5), percentile(0.99), len(errors),
+            )
+        )
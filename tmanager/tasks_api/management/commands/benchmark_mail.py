@@ -0,0 +1,58 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from tasks_api.mail import ConnectionPool, build_message
+from tasks_api.management.fake_smtp import FakeSMTPServer
+
+
+class Command(BaseCommand):
+
+    help = 'Compares messages per second sent with a new SMTP connection per job and with the pooled connection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200, help='Number of messages to send.')
+        parser.add_argument(
+            '--connect-delay',
+            type=float,
+            default=0.05,
+            help='Seconds the fake server spends on every new connection (emulates TLS handshake and AUTH).',
+        )
+
+    def handle(self, *args, **options):
+        count = options['messages']
+
+        with FakeSMTPServer(connect_delay=options['connect_delay']) as server, override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=server.port,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+        ):
+            messages = [
+                build_message('Benchmark %s' % i, '<p>Benchmark message.</p>', ['bench@example.com'])
+                for i in range(count)
+            ]
+
+            started = time.perf_counter()
+            for message in messages:
+                # Так работал send_mail: новое соединение на каждую задачу.
+                get_connection(fail_silently=False).send_messages([message])
+            before = time.perf_counter() - started
+            before_connections = server.connections
+
+            pool = ConnectionPool()
+            started = time.perf_counter()
+            for message in messages:
+                pool.send_messages([message])
+            after = time.perf_counter() - started
+            pool.close()
+            after_connections = server.connections - before_connections
+
+        self.stdout.write('messages: %s' % count)
+        self.stdout.write('connection per message: %.1f msg/s (%s connections)' % (count / before, before_connections))
+        self.stdout.write('pooled connection:      %.1f msg/s (%s connections)' % (count / after, after_connections))
@@ -0,0 +1,93 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from tasks_api.lookups import statuses
+from tasks_api.models import Board, Priority, Status, Tag, Task
+from tasks_api.renderers import FastJSONRenderer
+from tasks_api.rows import TaskRowSerializer
+from tasks_api.serializers import TaskSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Compares serializing and rendering a list of tasks with TaskSerializer + JSONRenderer and '
+        'with TaskRowSerializer + FastJSONRenderer. Test data is created in a transaction which is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=1000, help='Number of tasks in the list.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each path, the best one is reported.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['tasks'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, count, repeat):
+        board = Board.objects.create(title='Benchmark', description='Serialization benchmark.')
+        status, _ = Status.objects.get_or_create(status='to_do')
+        priority, _ = Priority.objects.get_or_create(priority='ordinary')
+        tags = [Tag.objects.get_or_create(tag=tag)[0] for tag in ('backend', 'testing')]
+        users = [User.objects.create(username='benchmark_%s' % i) for i in range(3)]
+
+        tasks = Task.objects.bulk_create([
+            Task(
+                board_id=board,
+                title='Task %s' % i,
+                description='Benchmark task description. ' * 10,
+                priority=priority,
+                status=status,
+                due_to='2024-12-24',
+            ) for i in range(count)
+        ])
+        Task.participants.through.objects.bulk_create([
+            Task.participants.through(task_id=task.pk, user_id=user.pk) for task in tasks for user in users
+        ])
+        Task.tags.through.objects.bulk_create([
+            Task.tags.through(task_id=task.pk, tag_id=tag.pk) for task in tasks for tag in tags
+        ])
+        statuses.invalidate()
+        statuses.all()
+
+        queryset = board.tasks.order_by('-id')
+
+        def serializer_path():
+            return JSONRenderer().render(TaskSerializer(queryset.with_related(), many=True).data)
+
+        def rows_path():
+            serializer = TaskRowSerializer()
+            return FastJSONRenderer().render(serializer.serialize(serializer.get_queryset(queryset)))
+
+        if serializer_path() != rows_path():
+            self.stderr.write('Outputs differ!')
+
+        before = self.measure(serializer_path, repeat)
+        after = self.measure(rows_path, repeat)
+
+        per_thousand = 1000.0 / count
+        self.stdout.write('tasks: %s' % count)
+        self.stdout.write('TaskSerializer + JSONRenderer:        %.1f ms per 1000 tasks' % (before * per_thousand * 1000))
+        self.stdout.write('TaskRowSerializer + FastJSONRenderer: %.1f ms per 1000 tasks' % (after * per_thousand * 1000))
+        self.stdout.write('speedup: %.1fx' % (before / after))
+
+    @staticmethod
+    def measure(func, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
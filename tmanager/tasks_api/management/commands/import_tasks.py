@@ -0,0 +1,57 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks_api.imports import IMPORT_READERS, TaskImporter
+from tasks_api.models import Board
+
+EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Imports tasks from CSV or NDJSON file (columns as in board tasks export). Rows are validated and '
+        'written in batches, rejected rows are reported and do not stop the import.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=list(IMPORT_READERS), help='By default from file extension.')
+        parser.add_argument('--board', type=int, help='Create all tasks on this board, board_id of rows is ignored.')
+        parser.add_argument('--batch-size', type=int, help='Rows per batch (transaction), IMPORT_BATCH_SIZE by default.')
+        parser.add_argument('--errors', type=int, default=20, help='How many row errors to print.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or EXTENSIONS.get(os.path.splitext(options['path'])[1].lower())
+        if file_format is None:
+            raise CommandError('Could not guess format of %s, use --format.' % options['path'])
+
+        board = None
+        if options['board'] is not None:
+            board = Board.objects.filter(pk=options['board']).first()
+            if board is None:
+                raise CommandError('Board %s not found.' % options['board'])
+
+        started = time.perf_counter()
+
+        def report(importer):
+            elapsed = time.perf_counter() - started
+            self.stdout.write('%9s rows  %9s created  %7s rejected  %8.0f rows/s' % (
+                importer.processed, importer.created, importer.failed, importer.processed / elapsed if elapsed else 0,
+            ))
+
+        importer = TaskImporter(board=board, batch_size=options['batch_size'], max_errors=options['errors'], on_batch=report)
+        try:
+            with open(options['path'], 'rb') as stream:
+                importer.run(IMPORT_READERS[file_format](stream))
+        except (OSError, UnicodeDecodeError) as exc:
+            raise CommandError(exc)
+
+        for error in importer.errors:
+            self.stdout.write('line %s: %s' % (error['line'], error['errors']))
+
+        self.stdout.write('Imported %s of %s rows in %.1f s.' % (
+            importer.created, importer.processed, time.perf_counter() - started,
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from tasks_api.history import PostgresHistoryStorage, maintain_history
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Maintains time-partitioned task history: converts the table into a partitioned one '
+        '(PostgreSQL), creates upcoming monthly partitions and archives old history.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help='Convert history table into partitioned one (PostgreSQL only).')
+        parser.add_argument('--retention-months', type=int, default=None, help='Full months of history kept in the database.')
+        parser.add_argument('--ahead', type=int, default=None, help='Monthly partitions created in advance.')
+
+    def handle(self, *args, **options):
+        if options['convert']:
+            if connection.vendor != 'postgresql':
+                self.stderr.write('Partitioning is supported on PostgreSQL only, history stays in a single table.')
+            elif PostgresHistoryStorage().convert():
+                self.stdout.write('History table has been converted into partitioned one.')
+            else:
+                self.stdout.write('History table is partitioned already.')
+
+        created, archived = maintain_history(options['retention_months'], options['ahead'])
+
+        for name in created:
+            self.stdout.write('Created partition %s.' % name)
+        for month, count in archived.items():
+            self.stdout.write('Archived %s rows of %s.' % (count, month))
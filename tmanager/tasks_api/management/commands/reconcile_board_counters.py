@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from tasks_api.models import BoardStatusCounter, Board
+from tasks_api.response_cache import response_cache
+
+
+class Command(BaseCommand):
+
+    help = 'Recounts tasks of boards by status and repairs drifted board status counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--board', type=int, action='append', dest='boards', help='Board id (may be repeated), all boards by default.')
+
+    def handle(self, *args, **options):
+        repaired = BoardStatusCounter.objects.reconcile(options['boards'])
+
+        boards = options['boards'] or Board.objects.values_list('pk', flat=True)
+        response_cache.invalidate(Board, list(boards))
+
+        self.stdout.write('Repaired %s board status counters.' % repaired)
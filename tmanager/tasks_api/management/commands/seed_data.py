@@ -0,0 +1,176 @@
+import datetime
+import random
+import time
+from collections import defaultdict
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from tasks_api.models import Board, BoardStatusCounter, Priority, Status, Tag, Task, TaskHistory
+
+STATUS_WEIGHTS = {'to_do': 5, 'in_progress': 3, 'done': 2}
+
+WORDS = (
+    'api', 'board', 'bug', 'cache', 'deploy', 'design', 'docs', 'export', 'feature', 'fix', 'index', 'login',
+    'mail', 'migration', 'page', 'query', 'release', 'report', 'review', 'search', 'test', 'ui', 'upload', 'user',
+)
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Seeds the configured database with a large generated dataset (boards, users, tasks with participants '
+        'and tags, task history) using bulk inserts. Usernames and board titles are prefixed, so several '
+        'datasets can be seeded side by side.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--boards', type=int, default=20)
+        parser.add_argument('--tasks', type=int, default=20000, help='Total number of tasks spread over boards.')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--participants', type=int, default=3, help='Participants per task.')
+        parser.add_argument('--tags', type=int, default=2, help='Tags per task (out of Tag.TAGS).')
+        parser.add_argument('--history', type=int, default=40000, help='Number of TaskHistory rows.')
+        parser.add_argument('--days', type=int, default=365, help='Tasks and history are spread over that many past days.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same dataset.')
+
+    def handle(self, *args, **options):
+        if options['tasks'] and not options['boards']:
+            raise CommandError('Tasks need at least one board.')
+        if User.objects.filter(username__startswith='%s_user_' % options['prefix']).exists():
+            raise CommandError('Dataset with prefix "%s" exists already, use another --prefix.' % options['prefix'])
+
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = timezone.localdate()
+        started = time.perf_counter()
+
+        statuses = {status: Status.objects.get_or_create(status=status)[0] for status, _ in Status.STATUSES}
+        priorities = [Priority.objects.get_or_create(priority=priority)[0] for priority, _ in Priority.PRIORITIES]
+        tags = [Tag.objects.get_or_create(tag=tag)[0] for tag, _ in Tag.TAGS]
+
+        users = self.step('users', self.create_users, options['prefix'], options['users'])
+        boards = self.step('boards', self.create_boards, options['prefix'], options['boards'])
+        tasks = self.step(
+            'tasks', self.create_tasks, boards, statuses, priorities, options['tasks'], options['days'],
+        )
+        self.step(
+            'participants', self.create_relations, Task.participants.through, 'user_id',
+            tasks, [user.pk for user in users], options['participants'],
+        )
+        self.step('tags', self.create_relations, Task.tags.through, 'tag_id', tasks, [tag.pk for tag in tags], options['tags'])
+        self.step('history', self.create_history, tasks, users, options['history'], options['days'])
+        self.step('counters', self.reconcile_counters, boards)
+
+        self.stdout.write('Seeded in %.1f s.' % (time.perf_counter() - started))
+
+    def step(self, name, func, *args):
+        started = time.perf_counter()
+        with transaction.atomic():
+            result = func(*args)
+        elapsed = time.perf_counter() - started
+        count = len(result) if isinstance(result, list) else result
+        self.stdout.write('%-13s %8s rows  %6.2f s  %9.0f rows/s' % (name, count, elapsed, count / elapsed if elapsed else 0))
+        return result
+
+    def create_users(self, prefix, count):
+        # Хэш пароля считается один раз: PBKDF2 на каждого пользователя занял бы минуты.
+        password = make_password('%s_password' % prefix)
+        User.objects.bulk_create(
+            [
+                User(username='%s_user_%s' % (prefix, i), email='%s_user_%s@example.com' % (prefix, i), password=password)
+                for i in range(count)
+            ],
+            batch_size=self.batch_size,
+        )
+        return list(User.objects.filter(username__startswith='%s_user_' % prefix).only('id'))
+
+    def create_boards(self, prefix, count):
+        return Board.objects.bulk_create(
+            [Board(title='%s board %s' % (prefix, i), description='Generated board %s.' % i) for i in range(count)],
+            batch_size=self.batch_size,
+        )
+
+    def create_tasks(self, boards, statuses, priorities, count, days):
+        status_choices = [statuses[status] for status in STATUS_WEIGHTS]
+        weights = list(STATUS_WEIGHTS.values())
+
+        tasks = []
+        created_at = []
+        for i in range(count):
+            title = ' '.join(self.random.sample(WORDS, 3))
+            tasks.append(Task(
+                board_id=boards[i % len(boards)],
+                title=title[:50],
+                description='Generated task %s: %s.' % (i, ' '.join(self.random.choices(WORDS, k=12))),
+                priority=self.random.choice(priorities),
+                status=self.random.choices(status_choices, weights)[0],
+                due_to=self.today + datetime.timedelta(days=self.random.randint(-60, 60)),
+            ))
+            created_at.append(self.today - datetime.timedelta(days=self.random.randrange(max(days, 1))))
+
+        tasks = Task.objects.bulk_create(tasks, batch_size=self.batch_size)
+        # created_at - auto_now, bulk_create ставит текущую дату: даты распределяются отдельным UPDATE по дню.
+        self.update_dates(Task, 'created_at', zip((task.pk for task in tasks), created_at))
+        return tasks
+
+    def create_relations(self, through, column, tasks, related_ids, per_task):
+        per_task = min(per_task, len(related_ids))
+        rows = [
+            through(task_id=task.pk, **{column: related_id})
+            for task in tasks
+            for related_id in self.random.sample(related_ids, per_task)
+        ]
+        through.objects.bulk_create(rows, batch_size=self.batch_size, ignore_conflicts=True)
+        return len(rows)
+
+    def create_history(self, tasks, users, count, days):
+        if not tasks:
+            return 0
+
+        transitions = [('to_do', 'in_progress'), ('in_progress', 'done')]
+        history = []
+        timestamps = []
+        now = timezone.now().replace(microsecond=0)
+        for _ in range(count):
+            previous_status, current_status = self.random.choice(transitions)
+            history.append(TaskHistory(
+                task_id=self.random.choice(tasks).pk,
+                user_id=self.random.choice(users).pk if users else None,
+                previous_status=previous_status,
+                current_status=current_status,
+            ))
+            # Точность до дня: UPDATE по значению затрагивает пачки строк.
+            timestamps.append(now - datetime.timedelta(days=self.random.randrange(max(days, 1))))
+
+        # timestamp - auto_now_add, как и created_at задач.
+        history = TaskHistory.objects.bulk_create(history, batch_size=self.batch_size)
+        self.update_dates(TaskHistory, 'timestamp', zip((row.pk for row in history), timestamps))
+        return len(history)
+
+    def update_dates(self, model, field, values):
+        """
+        Sets field of many rows with one UPDATE per distinct value and chunk.
+            :param values: iterable of (pk, value).
+        """
+        groups = defaultdict(list)
+        for pk, value in values:
+            groups[value].append(pk)
+
+        for value, pks in groups.items():
+            for chunk in chunks(pks, self.batch_size):
+                model.objects.filter(pk__in=chunk).update(**{field: value})
+
+    def reconcile_counters(self, boards):
+        BoardStatusCounter.objects.reconcile([board.pk for board in boards])
+        return BoardStatusCounter.objects.filter(board__in=boards).count()
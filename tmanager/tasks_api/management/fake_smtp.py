@@ -0,0 +1,114 @@
+import socket
+import socketserver
+import threading
+import time
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        server.register(self.connection)
+        time.sleep(server.connect_delay)
+
+        self.reply(b'220 fake ESMTP')
+        lines = None
+
+        while True:
+            try:
+                line = self.rfile.readline()
+            except OSError:
+                break
+            if not line:
+                break
+
+            if lines is not None:
+                if line in (b'.\r\n', b'.\n'):
+                    server.messages.append(b''.join(lines))
+                    lines = None
+                    self.reply(b'250 OK')
+                else:
+                    lines.append(line)
+                continue
+
+            command = line[:4].upper()
+            if command == b'RCPT' and line[8:].strip(b' <>\r\n').decode() in server.rejected_recipients:
+                self.reply(b'550 No such user')
+            elif command == b'DATA':
+                lines = []
+                self.reply(b'354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self.reply(b'221 Bye')
+                break
+            else:
+                self.reply(b'250 OK')
+
+        server.unregister(self.connection)
+
+    def reply(self, line):
+        try:
+            self.wfile.write(line + b'\r\n')
+        except OSError:
+            pass
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Minimal in-process SMTP server for tests and mail benchmarks.
+
+    Accepts every message (except for `rejected_recipients`) and keeps it in
+    `messages`; `connections` counts opened connections. `connect_delay` emulates the cost of a real connection
+    setup (TCP + STARTTLS + AUTH) which the server does not implement.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay=0.0):
+        super().__init__(('127.0.0.1', 0), FakeSMTPHandler)
+        self.connect_delay = connect_delay
+        self.messages = []
+        self.connections = 0
+        self.rejected_recipients = set()
+        self._active = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def register(self, connection):
+        with self._lock:
+            self.connections += 1
+            self._active.add(connection)
+
+    def unregister(self, connection):
+        with self._lock:
+            self._active.discard(connection)
+
+    def drop_connections(self):
+        """
+        Closes all client connections, as an SMTP server timing out idle clients does.
+        """
+        with self._lock:
+            for connection in self._active:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,101 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete
+
+from .models import Task
+
+
+class MembershipIndex:
+    """
+    Participant ids of tasks kept in the Django cache (Redis in production),
+    one entry per task, so permission checks do not query the participants
+    join table.
+
+    Entries are filled on first use and dropped after commit when the
+    participants of a task change (m2m_changed on either side of the relation)
+    or the task is deleted. MEMBERSHIP_CACHE_TIMEOUT bounds how long an entry
+    read concurrently with a change may stay stale.
+    """
+
+    prefix = 'tasks_api:membership:task'
+    through = Task.participants.through
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'MEMBERSHIP_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'MEMBERSHIP_CACHE_TIMEOUT', 300)
+
+    def key(self, task_id):
+        return '%s:%s' % (self.prefix, task_id)
+
+    def get_participant_ids(self, task_id):
+        return self.get_many([task_id])[task_id]
+
+    def get_many(self, task_ids):
+        """
+        Returns participant ids of tasks, reading the missing ones with one query.
+            :param task_ids: iterable of task ids.
+            :returns dict: task id to frozenset of user ids.
+        """
+        keys = {self.key(task_id): task_id for task_id in task_ids}
+        cached = self.cache.get_many(list(keys))
+        result = {keys[key]: frozenset(user_ids) for key, user_ids in cached.items()}
+
+        missing = [task_id for task_id in keys.values() if task_id not in result]
+        if missing:
+            loaded = defaultdict(set)
+            for task_id, user_id in self.through.objects.filter(task_id__in=missing).values_list('task_id', 'user_id'):
+                loaded[task_id].add(user_id)
+            for task_id in missing:
+                result[task_id] = frozenset(loaded[task_id])
+                self.cache.add(self.key(task_id), sorted(loaded[task_id]), self.timeout)
+
+        return result
+
+    def is_participant(self, task_id, user_id):
+        return user_id in self.get_participant_ids(task_id)
+
+    def filter_member_tasks(self, task_ids, user_id):
+        """
+        Returns ids of tasks among task_ids the user participates in.
+        """
+        return {task_id for task_id, user_ids in self.get_many(task_ids).items() if user_id in user_ids}
+
+    def invalidate(self, task_ids):
+        keys = [self.key(task_id) for task_id in task_ids]
+        if keys:
+            transaction.on_commit(lambda: self.cache.delete_many(keys))
+
+
+membership = MembershipIndex()
+
+
+def invalidate_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            membership.invalidate([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        membership.invalidate(pk_set)
+    elif action == 'pre_clear':
+        # После очистки со стороны пользователя список его задач уже не узнать.
+        membership.invalidate(list(sender.objects.filter(user_id=instance.pk).values_list('task_id', flat=True)))
+
+
+def invalidate_task_membership(sender, instance, **kwargs):
+    membership.invalidate([instance.pk])
+
+
+m2m_changed.connect(invalidate_membership, sender=Task.participants.through, dispatch_uid='membership_participants')
+post_delete.connect(invalidate_task_membership, sender=Task, dispatch_uid='membership_task_delete')
+
+
+__all__ = [
+    'MembershipIndex',
+    'membership',
+]
@@ -0,0 +1,320 @@
+import contextvars
+import datetime
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from celery import current_app
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_process_shutdown
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+HTTP_REQUEST_DURATION = Histogram(
+    'tasks_manager_http_request_duration_seconds',
+    'HTTP request latency by URL name.',
+    ['view', 'method'],
+    buckets=REQUEST_BUCKETS,
+)
+HTTP_REQUESTS = Counter(
+    'tasks_manager_http_requests',
+    'HTTP responses by URL name and status code.',
+    ['view', 'method', 'status'],
+)
+HTTP_DB_QUERIES = Histogram(
+    'tasks_manager_http_db_queries',
+    'Database queries per HTTP request.',
+    ['view', 'method'],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+HTTP_DB_DURATION = Histogram(
+    'tasks_manager_http_db_duration_seconds',
+    'Time spent in database per HTTP request.',
+    ['view', 'method'],
+    buckets=REQUEST_BUCKETS,
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    'tasks_manager_http_response_size_bytes',
+    'HTTP response body size.',
+    ['view', 'method'],
+    buckets=SIZE_BUCKETS,
+)
+
+CELERY_TASK_WAIT = Histogram(
+    'tasks_manager_celery_task_wait_seconds',
+    'Time a Celery task spent in queue before a worker started it.',
+    ['task', 'queue'],
+    buckets=LATENCY_BUCKETS,
+)
+CELERY_TASK_RUNTIME = Histogram(
+    'tasks_manager_celery_task_runtime_seconds',
+    'Celery task execution time.',
+    ['task', 'queue'],
+    buckets=LATENCY_BUCKETS,
+)
+CELERY_TASKS = Counter(
+    'tasks_manager_celery_tasks',
+    'Finished Celery tasks by state.',
+    ['task', 'queue', 'state'],
+)
+CELERY_TASK_DB_QUERIES = Histogram(
+    'tasks_manager_celery_task_db_queries',
+    'Database queries per Celery task.',
+    ['task', 'queue'],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+CELERY_TASK_DB_DURATION = Histogram(
+    'tasks_manager_celery_task_db_duration_seconds',
+    'Time spent in database per Celery task.',
+    ['task', 'queue'],
+    buckets=LATENCY_BUCKETS,
+)
+
+NOTIFICATION_EVENTS = Counter(
+    'tasks_manager_notification_events',
+    'Notification events buffered for coalescing, one per recipient.',
+)
+NOTIFICATION_MESSAGES = Counter(
+    'tasks_manager_notification_messages',
+    'Messages sent for coalesced notification events.',
+)
+NOTIFICATION_EVENTS_PER_MESSAGE = Histogram(
+    'tasks_manager_notification_events_per_message',
+    'Notification events coalesced into one message.',
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100),
+)
+
+PUBLISHED_AT_HEADER = 'published_at'
+
+_started = {}
+
+_query_stats = contextvars.ContextVar('tasks_api_query_stats', default=None)
+
+
+class QueryStats:
+
+    __slots__ = ('count', 'duration', 'parent')
+
+    def __init__(self, parent=None):
+        self.count = 0
+        self.duration = 0.0
+        self.parent = parent
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting queries of the request or task being
+    measured. Outside of measurement it only calls through.
+    """
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        # Вложенные измерения (задача внутри запроса, запрос внутри бенчмарка) учитываются все.
+        while stats is not None:
+            stats.count += 1
+            stats.duration += duration
+            stats = stats.parent
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# Обертка ставится на каждое подключение (в том числе в потоках sync_to_async),
+# а статистика берется из contextvar, который asgiref переносит между потоками.
+connection_created.connect(install_query_recorder, dispatch_uid='metrics_query_recorder')
+for _connection in connections.all():
+    install_query_recorder(_connection)
+
+
+@contextmanager
+def track_queries():
+    """
+    Counts database queries made inside the block.
+        :returns QueryStats: number of queries and time spent in database.
+    """
+    stats = QueryStats(_query_stats.get())
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+def get_queue_depths():
+    """
+    Counts messages waiting in every configured Celery queue (for Redis all
+    priority lists of a queue are summed up by kombu).
+        :returns dict: queue name to number of messages.
+    """
+    depths = {}
+    app = current_app
+    with app.connection_for_read() as connection:
+        connection.ensure_connection(max_retries=1, interval_start=0)
+        channel = connection.default_channel
+        for queue in app.conf.task_queues or ():
+            try:
+                depths[queue.name] = channel.queue_declare(queue=queue.name, passive=True).message_count
+            except connection.channel_errors:
+                # Очередь еще не создана: в нее ничего не отправляли.
+                channel = connection.channel()
+                depths[queue.name] = 0
+    return depths
+
+
+class CeleryQueueCollector:
+    """
+    Reads queue depths from the broker at scrape time, so the value is the
+    same whichever process answers the scrape.
+    """
+
+    def collect(self):
+        depth = GaugeMetricFamily('tasks_manager_celery_queue_depth', 'Messages waiting in Celery queue.', labels=['queue'])
+        up = GaugeMetricFamily('tasks_manager_celery_broker_up', 'Whether Celery broker could be reached.')
+        try:
+            depths = get_queue_depths()
+        except Exception as exc:
+            logger.warning('Could not read Celery queue depths: %s', exc)
+            up.add_metric([], 0)
+        else:
+            up.add_metric([], 1)
+            for queue, count in sorted(depths.items()):
+                depth.add_metric([queue], count)
+        yield depth
+        yield up
+
+
+def get_registry():
+    """
+    Registry to be scraped. With PROMETHEUS_MULTIPROC_DIR set (gunicorn and
+    celery prefork workers) values written by all processes are aggregated.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of application metrics, available only from
+    METRICS_ALLOWED_IPS.
+        :param request: HTTP GET request.
+        :returns HttpResponse: metrics in Prometheus text format.
+        :raises Http404: if client address is not allowed.
+    """
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1']):
+        raise Http404
+
+    registry = get_registry()
+    body = generate_latest(registry)
+
+    queues = CollectorRegistry()
+    queues.register(CeleryQueueCollector())
+    body += generate_latest(queues)
+
+    return HttpResponse(body, content_type=CONTENT_TYPE_LATEST)
+
+
+def get_queue_name(task):
+    delivery_info = task.request.delivery_info or {}
+    if delivery_info.get('routing_key'):
+        return delivery_info['routing_key']
+    # Задача выполнена без брокера (apply()): очередь берется из маршрутов.
+    return current_app.amqp.router.route({}, task.name, (), {})['queue'].name
+
+
+def get_enqueued_at(request):
+    published_at = getattr(request, PUBLISHED_AT_HEADER, None) or (request.headers or {}).get(PUBLISHED_AT_HEADER)
+    if published_at is None:
+        return None
+
+    # Отложенная задача (countdown, eta) ждет в очереди не с момента отправки, а со срока запуска.
+    eta = request.eta
+    if eta:
+        if isinstance(eta, str):
+            eta = datetime.datetime.fromisoformat(eta)
+        if eta.tzinfo is None:
+            eta = eta.replace(tzinfo=datetime.timezone.utc)
+        return max(float(published_at), eta.timestamp())
+    return float(published_at)
+
+
+@before_task_publish.connect(dispatch_uid='metrics_before_task_publish')
+def stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(PUBLISHED_AT_HEADER, time.time())
+
+
+@task_prerun.connect(dispatch_uid='metrics_task_prerun')
+def start_task_timer(task_id=None, task=None, **kwargs):
+    now = time.time()
+    stats = QueryStats(_query_stats.get())
+    _started[task_id] = (time.perf_counter(), stats, _query_stats.set(stats))
+
+    enqueued_at = get_enqueued_at(task.request)
+    if enqueued_at is not None:
+        CELERY_TASK_WAIT.labels(task.name, get_queue_name(task)).observe(max(now - enqueued_at, 0))
+
+
+@task_postrun.connect(dispatch_uid='metrics_task_postrun')
+def stop_task_timer(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    queue = get_queue_name(task)
+    if started is not None:
+        started, stats, token = started
+        CELERY_TASK_RUNTIME.labels(task.name, queue).observe(time.perf_counter() - started)
+        CELERY_TASK_DB_QUERIES.labels(task.name, queue).observe(stats.count)
+        CELERY_TASK_DB_DURATION.labels(task.name, queue).observe(stats.duration)
+        try:
+            _query_stats.reset(token)
+        except ValueError:
+            # Задача выполнилась в другом контексте (eager вызов внутри задачи).
+            _query_stats.set(None)
+    CELERY_TASKS.labels(task.name, queue, state or 'UNKNOWN').inc()
+
+
+@worker_process_shutdown.connect(dispatch_uid='metrics_worker_process_shutdown')
+def mark_worker_process_dead(pid=None, **kwargs):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+__all__ = [
+    'HTTP_REQUEST_DURATION',
+    'HTTP_REQUESTS',
+    'HTTP_DB_QUERIES',
+    'HTTP_DB_DURATION',
+    'HTTP_RESPONSE_SIZE',
+    'CELERY_TASK_WAIT',
+    'CELERY_TASK_RUNTIME',
+    'CELERY_TASKS',
+    'CELERY_TASK_DB_QUERIES',
+    'CELERY_TASK_DB_DURATION',
+    'NOTIFICATION_EVENTS',
+    'NOTIFICATION_MESSAGES',
+    'NOTIFICATION_EVENTS_PER_MESSAGE',
+    'get_queue_depths',
+    'track_queries',
+    'metrics_view',
+]
@@ -0,0 +1,109 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from .metrics import *
+from .profiling import is_requested, is_sampled, profile_queries
+
+UNMATCHED_VIEW = '<unmatched>'
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status code, response size and database queries of every
+    request labelled by URL name, so label cardinality stays bounded.
+
+    Works both under WSGI and ASGI: async views are not pushed into a thread
+    because of this middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        with track_queries() as stats:
+            response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with track_queries() as stats:
+            response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started, stats)
+        return response
+
+    @staticmethod
+    def observe(request, response, duration, stats):
+        match = request.resolver_match
+        view = match.view_name if match is not None else UNMATCHED_VIEW
+        method = request.method
+
+        HTTP_REQUEST_DURATION.labels(view, method).observe(duration)
+        HTTP_REQUESTS.labels(view, method, str(response.status_code)).inc()
+        HTTP_DB_QUERIES.labels(view, method).observe(stats.count)
+        HTTP_DB_DURATION.labels(view, method).observe(stats.duration)
+
+        # У потоковых ответов размер известен только из Content-Length.
+        if response.has_header('Content-Length'):
+            HTTP_RESPONSE_SIZE.labels(view, method).observe(int(response['Content-Length']))
+        elif not response.streaming:
+            HTTP_RESPONSE_SIZE.labels(view, method).observe(len(response.content))
+
+
+class SQLProfilingMiddleware:
+    """
+    Profiles SQL of requests asking for it with X-Profile-SQL header and of
+    a SQL_PROFILING_SAMPLE_RATE share of all requests (see profiling.py).
+    Profiled responses carry Server-Timing header with database time.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        if not (is_requested(request) or is_sampled()):
+            return self.get_response(request)
+
+        with profile_queries('%s %s' % (request.method, request.path)) as profile:
+            response = self.get_response(request)
+        return self.add_timing(response, profile)
+
+    async def __acall__(self, request):
+        if not (is_requested(request) or is_sampled()):
+            return await self.get_response(request)
+
+        with profile_queries('%s %s' % (request.method, request.path), report=False) as profile:
+            response = await self.get_response(request)
+        await sync_to_async(profile.report)()
+        return self.add_timing(response, profile)
+
+    @staticmethod
+    def add_timing(response, profile):
+        response['Server-Timing'] = 'db;dur=%.1f;desc="%s queries"' % (profile.duration * 1000, len(profile.queries))
+        return response
+
+
+__all__ = [
+    'MetricsMiddleware',
+    'SQLProfilingMiddleware',
+]
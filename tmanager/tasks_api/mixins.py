@@ -13,3 +13,59 @@ class CommonValidationMixin:
             raise ValidationError(v.detail)
 
         return attrs
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin taking optional `fields` argument: only listed fields are serialized.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsMixin:
+    """
+    View mixin reading `?fields=a,b` of GET requests. Requested fields narrow
+    serializer output (see DynamicFieldsMixin) and the queryset with .only().
+    """
+
+    fields_query_param = 'fields'
+
+    def get_requested_fields(self):
+        """
+        Returns requested serializer fields or None if all fields are needed.
+            :raises ValidationError: if unknown field is requested.
+        """
+        if not hasattr(self, '_requested_fields'):
+            # Асинхронные представления работают с обычным HttpRequest без query_params.
+            query_params = getattr(self.request, 'query_params', self.request.GET)
+            value = query_params.get(self.fields_query_param) if self.request.method == 'GET' else None
+            fields = None
+            if value:
+                fields = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+                unknown = set(fields) - set(self.serializer_class().fields)
+                if unknown:
+                    raise ValidationError({self.fields_query_param: 'Unknown fields: %s.' % ', '.join(sorted(unknown))})
+            self._requested_fields = fields
+        return self._requested_fields
+
+    def only_requested_fields(self, queryset, *required):
+        """
+        Defers model columns which are not requested.
+            :param required: columns needed regardless of request (e.g. ordering key).
+        """
+        fields = self.get_requested_fields()
+        if fields is None:
+            return queryset
+        return queryset.only(*only_columns(queryset.model, fields, required))
+
+
+def only_columns(model, fields, required=()):
+    columns = {field.name for field in model._meta.concrete_fields}
+    return [model._meta.pk.name] + [name for name in list(fields) + list(required) if name in columns]
@@ -1,5 +1,9 @@
-from django.db import models
-from django.db.models import F
+import uuid
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Count, F, Prefetch
+from django.db.models.fields.files import FieldFile
 from django.contrib.auth.models import User
 
 
@@ -11,6 +15,111 @@ class CanBeDestroyedMixin(models.Model):
         return user.is_staff
 
 
+class DirtyFieldsMixin(models.Model):
+    """
+    Remembers field values as they were loaded from the database, so that
+    changed fields are known without re-reading the row. Instances loaded
+    from the database are saved with an UPDATE of the changed columns only;
+    auto_now fields are added to such an UPDATE, as a full save would set
+    them too. refresh_from_db and loading of deferred fields update the
+    remembered values.
+    """
+
+    class Meta:
+        abstract = True
+
+    _loaded_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if value is not models.DEFERRED
+        }
+        return instance
+
+    def has_loaded_values(self):
+        return self._loaded_values is not None
+
+    def get_loaded_value(self, attname):
+        return self._loaded_values[attname]
+
+    def get_dirty_fields(self):
+        """
+        Returns attnames of loaded fields which have been changed since loading.
+            :returns list: changed field attnames (empty for unsaved instances).
+        """
+        if self._loaded_values is None:
+            return []
+
+        return [
+            attname for attname, value in self._loaded_values.items()
+            if self._get_raw_value(attname) != value
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.saves_changed_fields_only(*args, **kwargs):
+            kwargs['update_fields'] = self.get_update_fields()
+
+        super().save(*args, **kwargs)
+        self._reset_loaded_values()
+
+    def saves_changed_fields_only(self, *args, **kwargs):
+        """
+        Tells whether save() with these arguments updates changed columns only.
+            :returns bool: True for instances loaded from the database saved without update_fields.
+        """
+        return (
+            not args
+            and self.has_loaded_values()
+            and not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        )
+
+    def get_update_fields(self):
+        """
+        Returns attnames written by a save of changed columns only.
+            :returns list: changed attnames with auto_now fields, empty if nothing changed.
+        """
+        update_fields = self.get_dirty_fields()
+        if update_fields:
+            update_fields += [
+                field.attname for field in self._meta.concrete_fields
+                if getattr(field, 'auto_now', False) and field.attname not in update_fields
+            ]
+        return update_fields
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        # Вызывается и при обращении к отложенному (deferred) полю.
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._reset_loaded_values(fields)
+
+    def _reset_loaded_values(self, fields=None):
+        """
+        Remembers current values as loaded ones.
+            :param fields: names of reloaded fields, None for all loaded fields.
+        """
+        if fields is None or self._loaded_values is None:
+            deferred = self.get_deferred_fields()
+            self._loaded_values = {
+                field.attname: self._get_raw_value(field.attname)
+                for field in self._meta.concrete_fields if field.attname not in deferred
+            }
+            return
+
+        for name in fields:
+            field = self._meta.get_field(name)
+            if field in self._meta.concrete_fields:
+                self._loaded_values[field.attname] = self._get_raw_value(field.attname)
+
+    def _get_raw_value(self, attname):
+        value = getattr(self, attname)
+        if isinstance(value, FieldFile):
+            return value.name
+        return value
+
+
 class Board(CanBeDestroyedMixin):
     title = models.CharField(max_length=50, verbose_name='Заголовок борда', blank=False, null=False)
     description = models.TextField(verbose_name='Описание борда', blank=False, null=False)
@@ -101,9 +210,36 @@ class Priority(CanBeDestroyedMixin):
         verbose_name_plural = 'Приоритеты'
 
 
-class Task(CanBeDestroyedMixin):
+class TaskQuerySet(models.QuerySet):
+
+    def with_related(self, fields=None):
+        """
+        Loads everything TaskSerializer renders in a constant number of queries:
+        status is joined, participants and tags are prefetched with only
+        the columns their __str__ needs (ordered by id). priority and board_id are rendered
+        as primary keys and need no extra query.
+            :param fields: serialized fields if only some are needed; relations
+                which are not listed are not fetched.
+        """
+        queryset = self
+        if fields is None or 'status' in fields:
+            queryset = queryset.select_related('status')
+        if fields is None or 'participants' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('participants', queryset=User.objects.only('id', 'username').order_by('id')),
+            )
+        if fields is None or 'tags' in fields:
+            queryset = queryset.prefetch_related(Prefetch('tags', queryset=Tag.objects.only('id', 'tag').order_by('id')))
+        return queryset
+
 
-    board_id = models.ForeignKey(Board, on_delete=models.CASCADE, related_name='tasks', verbose_name='Борд')
+class Task(DirtyFieldsMixin, CanBeDestroyedMixin):
+
+    # Отдельные индексы внешних ключей board_id и status не создаются: их
+    # покрывают составные индексы Meta.indexes, которые начинаются с этих полей.
+    board_id = models.ForeignKey(
+        Board, on_delete=models.CASCADE, related_name='tasks', verbose_name='Борд', db_index=False,
+    )
     participants = models.ManyToManyField(User, verbose_name='Участники')
     title = models.CharField(max_length=50, verbose_name='Заголовок задачи', blank=False, null=False)
     description = models.TextField(blank=False, null=False, verbose_name='Описание задачи')
@@ -112,7 +248,9 @@ class Task(CanBeDestroyedMixin):
     attachment = models.FileField(upload_to='media/%d/%m/%Y', blank=True, null=True)
     created_at = models.DateField(auto_now=True, verbose_name='Время создания задачи')
     due_to = models.DateField(verbose_name='Дедлайн', blank=False, null=False)
-    status = models.ForeignKey(Status, on_delete=models.CASCADE, blank=False, verbose_name='Статус задачи')
+    status = models.ForeignKey(
+        Status, on_delete=models.CASCADE, blank=False, verbose_name='Статус задачи', db_index=False,
+    )
 
     previous_status = models.ForeignKey(
         Status,
@@ -123,34 +261,237 @@ class Task(CanBeDestroyedMixin):
         verbose_name='Предыдущий статус'
     )
 
+    objects = TaskQuerySet.as_manager()
+
+    # Поля, от которых зависят счетчики статусов борда.
+    COUNTER_FIELDS = {'board_id', 'board_id_id', 'status', 'status_id'}
+
+    _expected_key = None
+    _saved_keys = None
+
     def save(self, *args, **kwargs):
-        if self.pk:
-            obj = Task.objects.get(pk=self.pk)
-            if obj.status != self.status:
-                self.previous_status = obj.status
-        super().save(*args, **kwargs)
+        self._saved_keys = None
+        if self.saves_changed_fields_only(*args, **kwargs):
+            kwargs['update_fields'] = self.get_update_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not self.COUNTER_FIELDS & set(update_fields):
+            # Борд и статус не записываются: счетчики не меняются, строка не читается.
+            super().save(*args, **kwargs)
+            return
+
+        # Счетчики статусов меняются в той же транзакции, что и задача.
+        with transaction.atomic(savepoint=False):
+            counter_key = None
+            if update_fields is not None and self.has_loaded_values() and {'board_id_id', 'status_id'} <= self._loaded_values.keys():
+                # Загруженные значения проверяет сам UPDATE (см. _do_update): строка
+                # не читается заранее, а блокируется записью.
+                counter_key = self._expected_key = (
+                    self.get_loaded_value('board_id_id'),
+                    self.get_loaded_value('status_id'),
+                )
+            elif self.pk:
+                counter_key = (
+                    Task.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list('board_id_id', 'status_id')
+                    .first()
+                )
+
+            current_key = (self.board_id_id, self.status_id)
+            if counter_key is not None:
+                current_key = self.get_current_key(counter_key, update_fields)
+                if counter_key[1] != current_key[1]:
+                    self.previous_status_id = counter_key[1]
+                    if update_fields is not None:
+                        kwargs['update_fields'] = sorted(set(update_fields) | {'previous_status_id'})
+
+            self._saved_keys = counter_key, current_key
+            try:
+                super().save(*args, **kwargs)
+            finally:
+                self._expected_key = None
+            BoardStatusCounter.objects.apply_deltas(self.get_counter_deltas(*self._saved_keys))
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected = self._expected_key
+        if expected is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+        expected_qs = base_qs.filter(board_id_id=expected[0], status_id=expected[1])
+        if super()._do_update(expected_qs, using, pk_val, values, update_fields, forced_update):
+            return True
+
+        # Борд или статус изменил другой запрос: переход считается от сохраненной строки.
+        stored = (
+            base_qs.select_for_update()
+            .filter(pk=pk_val)
+            .values_list('board_id_id', 'status_id', 'previous_status_id')
+            .first()
+        )
+        if stored is not None:
+            counter_key = stored[:2]
+            current_key = self.get_current_key(counter_key, update_fields)
+            self.previous_status_id = counter_key[1] if counter_key[1] != current_key[1] else stored[2]
+
+            field = self._meta.get_field('previous_status')
+            values = [value for value in values if value[0] is not field] + [(field, None, self.previous_status_id)]
+            self._saved_keys = counter_key, current_key
+
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+    def has_status_changed(self):
+        """
+        Tells whether the last save changed status of the stored task. Valid
+        from post_save on, as the transition is known only after the UPDATE.
+            :returns bool: False for new tasks and saves keeping the status.
+        """
+        if self._saved_keys is None:
+            return False
+        counter_key, current_key = self._saved_keys
+        return counter_key is not None and counter_key[1] != current_key[1]
+
+    def get_current_key(self, counter_key, update_fields):
+        """
+        Returns (board id, status id) stored after saving the task.
+            :param counter_key: (board id, status id) stored before.
+            :param update_fields: written fields, None for all fields.
+            :returns tuple: written values, stored ones for fields which are not written.
+        """
+        if update_fields is None:
+            return self.board_id_id, self.status_id
+
+        update_fields = set(update_fields)
+        return (
+            self.board_id_id if {'board_id', 'board_id_id'} & update_fields else counter_key[0],
+            self.status_id if {'status', 'status_id'} & update_fields else counter_key[1],
+        )
+
+    def get_counter_deltas(self, counter_key, current_key=None):
+        """
+        Returns changes of board status counters caused by saving the task.
+            :param counter_key: (board id, status id) stored before, None for new task.
+            :param current_key: (board id, status id) stored after, by default the task's own.
+            :returns Counter: deltas keyed by (board id, status id).
+        """
+        deltas = Counter()
+        if current_key is None:
+            current_key = (self.board_id_id, self.status_id)
+        if counter_key != current_key:
+            if counter_key is not None:
+                deltas[counter_key] -= 1
+            deltas[current_key] += 1
+        return deltas
 
     def __str__(self):
         return self.title
 
     class Meta:
-        ordering = [F('board_id__updated_at').desc()]
+        # Сортировка по первичному ключу: детерминирована и не требует JOIN
+        # на борд и отдельной сортировки. Задачи борда сортируются явно
+        # по id, см. BoardTasksMixin.
+        ordering = ['-id']
         verbose_name = 'Задача'
         verbose_name_plural = 'Задачи'
 
-        # Индексация полей status и due_to имеет смысл поскольку
-        # запросы на фильтрацию по дате и статусу входят в ТЗ.
-        # Однако, важно помнить, что при изменении или удалении
-        # записей индексы будут пересчитываться. При высокой нагрузке
-        # это может сказываться на производительности.
+        # Индексы повторяют формы запросов: равенство по борду и фильтру
+        # (status, priority), затем ключ сортировки и курсорной пагинации id.
+        # created_at в ключ не входит: поле auto_now меняется при каждом
+        # сохранении задачи, и задача переезжала бы в конец списка. Запросы
+        # плана проверяются в QueryPlanTestCase. Важно помнить, что каждый
+        # индекс пересчитывается при записи задачи: лишние не добавлять.
         indexes = [
-            models.Index(fields=['board_id']),
-            models.Index(fields=['status']),
+            models.Index(fields=['board_id', 'id'], name='task_board_idx'),
+            models.Index(fields=['board_id', 'status', 'id'], name='task_board_status_idx'),
+            models.Index(fields=['board_id', 'priority', 'id'], name='task_board_prio_idx'),
+            # Ежедневная рассылка: открытые статусы и due_to <= сегодня.
+            models.Index(fields=['status', 'due_to'], name='task_status_due_to_idx'),
             models.Index(fields=['due_to']),
             models.Index(fields=['title']),
         ]
 
 
+class BoardStatusCounterManager(models.Manager):
+
+    def apply_deltas(self, deltas):
+        """
+        Atomically adds deltas to counters with UPDATE ... SET count = count + delta.
+        Missing counters are created for positive deltas only: a negative delta
+        without a counter means the board is being deleted or counters drifted
+        (see `manage.py reconcile_board_counters`).
+            :param deltas: mapping of (board id, status id) to delta.
+        """
+        for (board_id, status_id), delta in sorted(deltas.items()):
+            if not delta:
+                continue
+            counters = self.filter(board_id=board_id, status_id=status_id)
+            if counters.update(count=F('count') + delta) or delta < 0:
+                continue
+            self.bulk_create([self.model(board_id=board_id, status_id=status_id, count=0)], ignore_conflicts=True)
+            counters.update(count=F('count') + delta)
+
+    def get_counts(self, board_id):
+        """
+        Returns task counts of board per status id, read from counters only.
+        """
+        return dict(self.filter(board_id=board_id).values_list('status_id', 'count'))
+
+    def reconcile(self, board_ids=None):
+        """
+        Recounts tasks and repairs counters which drifted from them.
+            :param board_ids: boards to reconcile, all boards if None.
+            :returns int: number of repaired counters.
+        """
+        tasks = Task.objects.order_by()
+        counters = self.all()
+        if board_ids is not None:
+            tasks = tasks.filter(board_id__in=board_ids)
+            counters = counters.filter(board_id__in=board_ids)
+
+        actual = {
+            (row['board_id_id'], row['status_id']): row['total']
+            for row in tasks.values('board_id_id', 'status_id').annotate(total=Count('id'))
+        }
+        stored = {(counter.board_id, counter.status_id): counter for counter in counters}
+
+        repaired = 0
+        with transaction.atomic():
+            for key in stored.keys() | actual.keys():
+                count = actual.get(key, 0)
+                counter = stored.get(key)
+                if counter is None:
+                    self.create(board_id=key[0], status_id=key[1], count=count)
+                elif counter.count != count:
+                    self.filter(pk=counter.pk).update(count=count)
+                else:
+                    continue
+                repaired += 1
+
+        return repaired
+
+
+class BoardStatusCounter(models.Model):
+    """
+    Denormalized number of tasks of a board in each status. Changed together
+    with tasks, so board counters are read without counting tasks.
+    """
+
+    board = models.ForeignKey(Board, on_delete=models.CASCADE, related_name='status_counters', verbose_name='Борд')
+    status = models.ForeignKey(Status, on_delete=models.CASCADE, related_name='+', verbose_name='Статус')
+    count = models.IntegerField(default=0, verbose_name='Количество задач')
+
+    objects = BoardStatusCounterManager()
+
+    class Meta:
+        verbose_name = 'Счетчик задач борда'
+        verbose_name_plural = 'Счетчики задач бордов'
+        constraints = [
+            models.UniqueConstraint(name='board_status_counter_unique', fields=['board', 'status']),
+        ]
+
+    def __str__(self):
+        return '%s - %s: %s' % (self.board_id, self.status_id, self.count)
+
+
 class TaskHistory(CanBeDestroyedMixin):
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='history', verbose_name='Задача')
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Пользователь')
@@ -163,15 +504,128 @@ class TaskHistory(CanBeDestroyedMixin):
         verbose_name = 'История задачи'
         verbose_name_plural = 'История задач'
 
+        # На PostgreSQL таблица секционируется по месяцам timestamp
+        # (см. history.py), индексы создаются в каждой секции.
+        indexes = [
+            models.Index(fields=['task', 'timestamp']),
+            models.Index(fields=['timestamp']),
+        ]
+
     def __str__(self):
         return '%s - %s' % (self.task, self.timestamp)
 
 
+class AttachmentUpload(models.Model):
+    """
+    Resumable upload of a task attachment. Parts are appended to a file on disk
+    in order; the completed file is moved to content-addressed storage.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='uploads', verbose_name='Задача')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Пользователь')
+    filename = models.CharField(max_length=255, verbose_name='Имя файла')
+    size = models.BigIntegerField(verbose_name='Размер файла')
+    offset = models.BigIntegerField(default=0, verbose_name='Загружено байт')
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name='SHA-256 содержимого')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Время начала загрузки')
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name='Время завершения загрузки')
+
+    class Meta:
+        verbose_name = 'Загрузка вложения'
+        verbose_name_plural = 'Загрузки вложений'
+        indexes = [
+            models.Index(fields=['task', 'sha256']),
+        ]
+
+    def __str__(self):
+        return '%s - %s' % (self.task_id, self.filename)
+
+
+class TaskImport(models.Model):
+    """
+    Bulk import of tasks from an uploaded CSV or NDJSON file, processed by a
+    Celery worker. Counters are updated after every batch; errors keep the
+    first IMPORT_MAX_ERRORS rejected rows.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATES = (
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Завершен'),
+        (FAILED, 'Прерван'),
+    )
+
+    FORMATS = (
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Пользователь')
+    board = models.ForeignKey(
+        Board,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Борд для всех задач',
+    )
+    file = models.FileField(upload_to='imports/%Y/%m/%d', verbose_name='Файл')
+    format = models.CharField(max_length=10, choices=FORMATS, verbose_name='Формат')
+    state = models.CharField(max_length=10, choices=STATES, default=PENDING, verbose_name='Состояние')
+    processed = models.IntegerField(default=0, verbose_name='Обработано строк')
+    created = models.IntegerField(default=0, verbose_name='Создано задач')
+    failed = models.IntegerField(default=0, verbose_name='Отклонено строк')
+    errors = models.JSONField(default=list, blank=True, verbose_name='Ошибки строк')
+    message = models.TextField(blank=True, verbose_name='Причина прерывания')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Время загрузки')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Время начала')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Время завершения')
+
+    class Meta:
+        verbose_name = 'Импорт задач'
+        verbose_name_plural = 'Импорты задач'
+
+    def __str__(self):
+        return '%s - %s' % (self.file.name, self.state)
+
+
+class PendingNotification(models.Model):
+    """
+    Notification event waiting to be coalesced into one message per recipient.
+    """
+
+    recipient = models.EmailField(verbose_name='Получатель')
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    text = models.TextField(verbose_name='Текст')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Время события')
+
+    class Meta:
+        verbose_name = 'Отложенное уведомление'
+        verbose_name_plural = 'Отложенные уведомления'
+        indexes = [
+            models.Index(fields=['recipient', 'id']),
+        ]
+
+    def __str__(self):
+        return '%s - %s' % (self.recipient, self.subject)
+
+
 __all__ = [
     'Board',
     'Status',
     'Tag',
     'Priority',
     'Task',
+    'BoardStatusCounter',
     'TaskHistory',
+    'AttachmentUpload',
+    'TaskImport',
+    'PendingNotification',
 ]
@@ -0,0 +1,83 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from .metrics import NOTIFICATION_EVENTS
+from .models import PendingNotification
+from .tasks import flush_notifications, send_bulk_email_notifications
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED_KEY = 'tasks_api:notifications:scheduled:%s'
+
+
+def status_notification(title, user, previous_status, current_status):
+    """
+    Builds notification sent to task participants when task status has been changed.
+        :param title: task title.
+        :param user: user who changed status.
+        :param previous_status: status before change.
+        :param current_status: status after change.
+        :returns tuple: (subject, text).
+    """
+    subject = 'Status of task %s has been changed' % title
+    text = 'User %s changed status of task %s from %s to %s.' % (user, title, previous_status, current_status)
+
+    return subject, text
+
+
+def render_notification(subject, text):
+    context = {
+        'subject': subject,
+        'message': text,
+        'daily': False,
+    }
+    return render_to_string('mail/notification_detail.html', context=context)
+
+
+def notify(events):
+    """
+    Delivers notifications after current transaction is committed.
+
+    When NOTIFICATION_COALESCE_WINDOW is set, events are buffered per recipient
+    in PendingNotification and one flush_notifications job per recipient is
+    scheduled at the end of the window; events arriving meanwhile join the
+    same message. Otherwise all events are sent at once by one job.
+        :param events: list of (subject, text, recipients).
+    """
+    events = [(subject, text, sorted(recipients)) for subject, text, recipients in events if recipients]
+    if not events:
+        return
+
+    window = getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 0)
+
+    if not window:
+        messages = [[subject, render_notification(subject, text), recipients] for subject, text, recipients in events]
+        transaction.on_commit(lambda: send_bulk_email_notifications.delay(messages))
+        return
+
+    PendingNotification.objects.bulk_create([
+        PendingNotification(recipient=recipient, subject=subject, text=text)
+        for subject, text, recipients in events for recipient in recipients
+    ])
+    recipients = {recipient for _, _, event_recipients in events for recipient in event_recipients}
+
+    def schedule():
+        # Экономия от объединения: NOTIFICATION_EVENTS против NOTIFICATION_MESSAGES (см. flush_notifications).
+        NOTIFICATION_EVENTS.inc(sum(len(event_recipients) for _, _, event_recipients in events))
+        for recipient in recipients:
+            # Первое событие окна планирует отправку, остальные к ней присоединяются.
+            if cache.add(SCHEDULED_KEY % recipient, 1, window + 60):
+                flush_notifications.apply_async(args=[recipient], countdown=window)
+
+    transaction.on_commit(schedule)
+
+
+__all__ = [
+    'status_notification',
+    'render_notification',
+    'notify',
+]
@@ -1,5 +1,235 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib import parse
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class ApiViewPaginator(PageNumberPagination):
     page_size = 10
+
+    # ?count=false отключает COUNT(*): вместо него выбирается
+    # page_size + 1 строк, чтобы понять, есть ли следующая страница.
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.with_count = request.query_params.get(self.count_query_param, '').lower() not in ('false', '0')
+
+        if self.with_count:
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        try:
+            self.page_number = _positive_int(request.query_params.get(self.page_query_param, 1), strict=True)
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+
+        if not rows and self.page_number != 1:
+            raise NotFound(self.invalid_page_message)
+
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.with_count:
+            return super().get_paginated_response(data)
+
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if self.with_count:
+            return super().get_next_link()
+
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.with_count:
+            return super().get_previous_link()
+
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+
+class ApiViewCursorPaginator(BasePagination):
+    """
+    Keyset pagination over a unique, immutable key.
+
+    Unlike PageNumberPagination it never runs COUNT(*) and never uses OFFSET:
+    every page is a range scan `id < (cursor)` served by the (board_id, id)
+    index, so deep pages cost the same as the first. The key must not change
+    when a row is saved, or the row would move between pages.
+    The cursor is opaque to clients: base64 of the last seen key values.
+    """
+
+    page_size = 10
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Ключ сортировки (по убыванию). Последнее поле обязано быть уникальным.
+    ordering = ('id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self._prepare_queryset(queryset, request)
+        return self._set_page(list(queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() for async views, the page is read with the async ORM.
+        """
+        queryset = self._prepare_queryset(queryset, request)
+        return self._set_page([row async for row in queryset[:self.page_size + 1]])
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def _prepare_queryset(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.fields = self.get_ordering_fields(queryset)
+
+        position, self.reverse = self.decode_cursor(request)
+        self.has_cursor = position is not None
+        self.position = position
+
+        if self.reverse:
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            queryset = queryset.order_by(*['-%s' % name for name in self.ordering])
+
+        if position is not None:
+            queryset = queryset.filter(self._position_filter(position, self.reverse))
+
+        return queryset
+
+    def _set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next = self.has_cursor
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.has_cursor
+
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            return self.encode_cursor(self._get_position_from_instance(self.page[-1]), reverse=False)
+        return self.encode_cursor(self.position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            return self.encode_cursor(self._get_position_from_instance(self.page[0]), reverse=True)
+        return self.encode_cursor(self.position, reverse=True)
+
+    def decode_cursor(self, request):
+        """
+        Given a request, returns the decoded key values and direction.
+            :param request: HTTP request.
+            :returns tuple: (position or None, reverse flag).
+            :raises NotFound: if cursor could not be decoded.
+        """
+        # Асинхронные представления передают обычный HttpRequest без query_params.
+        encoded = getattr(request, 'query_params', request.GET).get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            querystring = b64decode(encoded.encode('ascii'), altchars=b'-_').decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            values = tokens['p']
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (TypeError, ValueError, KeyError, UnicodeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        tokens = [('p', str(value)) for value in position]
+        if reverse:
+            tokens.append(('r', '1'))
+
+        querystring = parse.urlencode(tokens)
+        encoded = b64encode(querystring.encode('ascii'), altchars=b'-_').decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_ordering_fields(self, queryset):
+        """
+        Returns fields of ordering key used to parse cursor values; annotations
+        (e.g. search rank) are resolved through their output field.
+        """
+        fields = []
+        for name in self.ordering:
+            annotation = queryset.query.annotations.get(name)
+            fields.append(annotation.output_field if annotation is not None else queryset.model._meta.get_field(name))
+        return fields
+
+    def _get_position_from_instance(self, instance):
+        # Страница может состоять из строк .values() (см. TaskRowSerializer).
+        if isinstance(instance, dict):
+            return [instance[name] for name in self.ordering]
+        return [getattr(instance, name) for name in self.ordering]
+
+    def _position_filter(self, position, reverse):
+        """
+        Builds a lexicographic comparison `(f1, f2, ...) < (v1, v2, ...)`
+        (or `>` when paginating backwards) out of plain Q objects.
+        """
+        lookup = 'gt' if reverse else 'lt'
+        condition = Q()
+        equal = {}
+        for name, value in zip(self.ordering, position):
+            condition |= Q(**equal, **{'%s__%s' % (name, lookup): value})
+            equal[name] = value
+        return condition
+
+
+class SearchCursorPaginator(ApiViewCursorPaginator):
+    """
+    Keyset pagination of search results by rank (see search.py), ties broken by id.
+    Backends annotate rank as double precision, so the rank read back from the
+    cursor compares equal to the rank of the row it was taken from.
+    """
+
+    ordering = ('rank', 'id')
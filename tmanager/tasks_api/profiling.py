@@ -0,0 +1,212 @@
+import contextvars
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+PROFILING_HEADER = 'X-Profile-SQL'
+
+PROJECT_DIR = str(settings.BASE_DIR)
+SKIPPED_FILES = {__file__, os.path.join(os.path.dirname(__file__), 'metrics.py')}
+
+# IN (%s, %s, ...) разной длины - та же форма запроса.
+IN_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+
+_profile = contextvars.ContextVar('tasks_api_sql_profile', default=None)
+
+
+class ProfiledQuery:
+
+    __slots__ = ('sql', 'params', 'many', 'alias', 'duration', 'origin')
+
+    def __init__(self, sql, params, many, alias, duration, origin):
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.alias = alias
+        self.duration = duration
+        self.origin = origin
+
+    @property
+    def shape(self):
+        return IN_LIST_RE.sub('(%s...)', self.sql)
+
+
+class QueryProfile:
+    """
+    SQL statements run by one request or Celery task with their timings and
+    the line of project code which issued them.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.queries = []
+
+    @property
+    def duration(self):
+        return sum(query.duration for query in self.queries)
+
+    def get_repeated(self, threshold):
+        """
+        Groups statements of the same shape issued from the same line.
+            :param threshold: minimal number of repetitions.
+            :returns list: (shape, origin, queries) sorted by repetitions.
+        """
+        groups = defaultdict(list)
+        for query in self.queries:
+            groups[(query.shape, query.origin)].append(query)
+        repeated = [(shape, origin, queries) for (shape, origin), queries in groups.items() if len(queries) >= threshold]
+        return sorted(repeated, key=lambda group: len(group[2]), reverse=True)
+
+    def get_slow(self, threshold_ms):
+        return [query for query in self.queries if query.duration * 1000 >= threshold_ms]
+
+    def report(self):
+        """
+        Logs summary of profile, repeated same-shape statements (likely N+1)
+        and slow statements with their EXPLAIN plans.
+        """
+        logger.info('%s: %s queries in %.1f ms.', self.label, len(self.queries), self.duration * 1000)
+
+        for shape, origin, queries in self.get_repeated(getattr(settings, 'SQL_PROFILING_REPEATED_THRESHOLD', 5)):
+            logger.warning(
+                '%s: possible N+1, %s queries of the same shape from %s (%.1f ms): %s',
+                self.label, len(queries), origin, sum(query.duration for query in queries) * 1000, shape,
+            )
+
+        for query in self.get_slow(getattr(settings, 'SQL_SLOW_QUERY_MS', 100)):
+            logger.warning(
+                '%s: slow query %.1f ms from %s: %s\n%s',
+                self.label, query.duration * 1000, query.origin, query.sql, explain(query),
+            )
+
+
+def explain(query):
+    """
+    Returns query plan of SELECT statement (EXPLAIN without ANALYZE, so the
+    statement is not executed again).
+    """
+    if query.many or not query.sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return '(no plan)'
+
+    connection = connections[query.alias]
+    token = _profile.set(None)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('%s %s' % (connection.ops.explain_query_prefix(), query.sql), query.params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except Exception as exc:
+        return '(plan is not available: %s)' % exc
+    finally:
+        _profile.reset(token)
+
+
+def find_origin():
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_DIR) and filename not in SKIPPED_FILES:
+            return '%s:%s in %s' % (os.path.relpath(filename, PROJECT_DIR), frame.f_lineno, frame.f_code.co_name)
+        frame = frame.f_back
+    return '<unknown>'
+
+
+def profile_query(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        profile.queries.append(ProfiledQuery(sql, params, many, context['connection'].alias, duration, find_origin()))
+
+
+def install_query_profiler(connection, **kwargs):
+    if profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_query)
+
+
+connection_created.connect(install_query_profiler, dispatch_uid='profiling_query_profiler')
+for _connection in connections.all():
+    install_query_profiler(_connection)
+
+
+def is_sampled():
+    rate = getattr(settings, 'SQL_PROFILING_SAMPLE_RATE', 0)
+    return rate > 0 and random.random() < rate
+
+
+def is_requested(request):
+    """
+    Whether request asks to be profiled with X-Profile-SQL header: with any
+    value in DEBUG, otherwise the value must equal SQL_PROFILING_TOKEN.
+    """
+    value = request.headers.get(PROFILING_HEADER)
+    if not value:
+        return False
+    token = getattr(settings, 'SQL_PROFILING_TOKEN', None)
+    return settings.DEBUG or (bool(token) and value == token)
+
+
+@contextmanager
+def profile_queries(label, report=True):
+    """
+    Captures statements run inside the block and reports them at exit.
+        :param label: name of request or task used in log records.
+        :param report: whether to report at exit (async code reports itself,
+            EXPLAIN queries are synchronous).
+        :returns QueryProfile: captured statements.
+    """
+    profile = QueryProfile(label)
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+        if report:
+            profile.report()
+
+
+_task_profiles = {}
+
+
+@task_prerun.connect(dispatch_uid='profiling_task_prerun')
+def start_task_profile(task_id=None, task=None, **kwargs):
+    if is_sampled():
+        manager = profile_queries('task %s' % task.name)
+        manager.__enter__()
+        _task_profiles[task_id] = manager
+
+
+@task_postrun.connect(dispatch_uid='profiling_task_postrun')
+def stop_task_profile(task_id=None, **kwargs):
+    manager = _task_profiles.pop(task_id, None)
+    if manager is not None:
+        try:
+            manager.__exit__(None, None, None)
+        except ValueError:
+            # Контекст сменился (eager вызов внутри задачи): профиль не сохраняется.
+            _profile.set(None)
+
+
+__all__ = [
+    'PROFILING_HEADER',
+    'QueryProfile',
+    'is_requested',
+    'is_sampled',
+    'profile_queries',
+]
@@ -0,0 +1,253 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils.http import parse_etags
+
+from .lookups import statuses, tags
+from .models import Board, Task
+
+
+class CachedEntry:
+
+    def __init__(self, data, etag):
+        self.data = data
+        self.etag = etag
+
+
+class ResponseCache:
+    """
+    Cache of serialized objects keyed by a per-object version token.
+
+    Saving or deleting an object (or changing its many-to-many relations)
+    drops its version token and a new one is generated on the next read, so
+    stale entries are never read again and simply expire. Version tokens
+    expire too, later than entries: a missing token is just a cache miss, and
+    tokens of objects no longer read (or never found) do not pile up. Entries
+    carry a soft expiration time: when it passes, one request (holding a short
+    lock) recomputes the entry while the others keep serving the previous one,
+    so a popular object does not hit the database with every concurrent request.
+
+    The backend is any Django cache: Redis in production, LocMemCache locally.
+    """
+
+    prefix = 'tasks_api:response'
+    lock_timeout = 5
+    wait_interval = 0.05
+    wait_attempts = 10
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', self.alias)]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60)
+
+    @property
+    def entry_timeout(self):
+        # Запись хранится дольше мягкого срока, чтобы отдавать ее во время пересчета.
+        return self.timeout * 2
+
+    @property
+    def version_timeout(self):
+        return self.entry_timeout + self.timeout
+
+    def version_key(self, model, pk):
+        return '%s:version:%s:%s' % (self.prefix, model._meta.label_lower, pk)
+
+    def invalidate(self, model, pks):
+        """
+        Drops version tokens of objects after current transaction is committed.
+            :param model: model class.
+            :param pks: primary keys of changed objects.
+        """
+        keys = [self.version_key(model, pk) for pk in pks]
+        if keys:
+            transaction.on_commit(lambda: self.cache.delete_many(keys))
+
+    def get_or_set(self, model, pk, compute, dependencies=(), salt='', variant=''):
+        """
+        Returns cached entry for object or computes it.
+            :param model: model class.
+            :param pk: primary key of object.
+            :param compute: callable returning serialized data of object.
+            :param dependencies: LookupCache instances data depends on.
+            :param salt: extra value mixed into ETag (e.g. renderer format).
+            :param variant: representation of object (e.g. requested fields),
+                cached separately.
+            :returns CachedEntry: data and ETag.
+        """
+        cache = self.cache
+        version_key = self.version_key(model, pk)
+        version = cache.get(version_key)
+        if version is None:
+            cache.add(version_key, uuid.uuid4().hex, self.version_timeout)
+            version = cache.get(version_key, '')
+
+        versions = [version, variant] + [lookup.get_version() for lookup in dependencies]
+        key = self.entry_key(model, pk, versions)
+        lock_key = '%s:lock' % key
+
+        entry = cache.get(key)
+        if entry is not None and entry['expires'] > time.time():
+            return CachedEntry(entry['data'], entry['etag'])
+
+        locked = cache.add(lock_key, 1, self.lock_timeout)
+        if not locked:
+            if entry is None:
+                # Entry is being computed by another request: wait for it shortly.
+                entry = self._wait_for(key)
+            if entry is not None:
+                return CachedEntry(entry['data'], entry['etag'])
+
+        try:
+            entry = self.make_entry(compute(), salt)
+            cache.set(key, entry, self.entry_timeout)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+        return CachedEntry(entry['data'], entry['etag'])
+
+    async def aget_or_set(self, model, pk, compute, dependencies=(), salt='', variant=''):
+        """
+        get_or_set() for async views: `compute` is a coroutine function and
+        cache is accessed with its async API.
+        """
+        cache = self.cache
+        version_key = self.version_key(model, pk)
+        version = await cache.aget(version_key)
+        if version is None:
+            await cache.aadd(version_key, uuid.uuid4().hex, self.version_timeout)
+            version = await cache.aget(version_key, '')
+
+        versions = [version, variant] + [await lookup.aget_version() for lookup in dependencies]
+        key = self.entry_key(model, pk, versions)
+        lock_key = '%s:lock' % key
+
+        entry = await cache.aget(key)
+        if entry is not None and entry['expires'] > time.time():
+            return CachedEntry(entry['data'], entry['etag'])
+
+        locked = await cache.aadd(lock_key, 1, self.lock_timeout)
+        if not locked:
+            if entry is None:
+                for attempt in range(self.wait_attempts):
+                    await asyncio.sleep(self.wait_interval)
+                    entry = await cache.aget(key)
+                    if entry is not None:
+                        break
+            if entry is not None:
+                return CachedEntry(entry['data'], entry['etag'])
+
+        try:
+            entry = self.make_entry(await compute(), salt)
+            await cache.aset(key, entry, self.entry_timeout)
+        finally:
+            if locked:
+                await cache.adelete(lock_key)
+
+        return CachedEntry(entry['data'], entry['etag'])
+
+    def entry_key(self, model, pk, versions):
+        return '%s:entry:%s:%s:%s' % (
+            self.prefix,
+            model._meta.label_lower,
+            pk,
+            hashlib.md5(':'.join(versions).encode()).hexdigest(),
+        )
+
+    def make_entry(self, data, salt):
+        data = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+        return {'data': data, 'etag': self.make_etag(data, salt), 'expires': time.time() + self.timeout}
+
+    def _wait_for(self, key):
+        for attempt in range(self.wait_attempts):
+            time.sleep(self.wait_interval)
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry
+        return None
+
+    @staticmethod
+    def make_etag(data, salt=''):
+        body = json.dumps(data, sort_keys=True, separators=(',', ':'), cls=DjangoJSONEncoder)
+        return '"%s"' % hashlib.sha1(('%s:%s' % (salt, body)).encode()).hexdigest()
+
+    @staticmethod
+    def etag_matches(request, etag):
+        header = request.headers.get('If-None-Match')
+        if not header:
+            return False
+        etags = parse_etags(header)
+        return '*' in etags or etag in etags
+
+
+response_cache = ResponseCache()
+
+
+def invalidate_instance(sender, instance, **kwargs):
+    response_cache.invalidate(sender, [instance.pk])
+
+
+def invalidate_task_board(sender, instance, **kwargs):
+    # Борд отдается вместе со счетчиками задач по статусам.
+    board_ids = {instance.board_id_id}
+    if instance.has_loaded_values() and 'board_id_id' in instance._loaded_values:
+        board_ids.add(instance.get_loaded_value('board_id_id'))
+    response_cache.invalidate(Board, board_ids)
+
+
+def invalidate_task_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            response_cache.invalidate(Task, [instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        response_cache.invalidate(Task, pk_set)
+    elif action == 'pre_clear':
+        # После очистки со стороны пользователя или метки список задач уже не узнать.
+        related = 'user_id' if sender is Task.participants.through else 'tag_id'
+        task_ids = sender.objects.filter(**{related: instance.pk}).values_list('task_id', flat=True)
+        response_cache.invalidate(Task, list(task_ids))
+
+
+def invalidate_user_tasks(sender, instance, created, **kwargs):
+    # Участники задачи отображаются по username.
+    if not created:
+        task_ids = Task.participants.through.objects.filter(user_id=instance.pk).values_list('task_id', flat=True)
+        response_cache.invalidate(Task, list(task_ids))
+
+
+for cached_model in (Board, Task):
+    post_save.connect(invalidate_instance, sender=cached_model, dispatch_uid='response_cache_save_%s' % cached_model.__name__)
+    post_delete.connect(invalidate_instance, sender=cached_model, dispatch_uid='response_cache_delete_%s' % cached_model.__name__)
+
+post_save.connect(invalidate_task_board, sender=Task, dispatch_uid='response_cache_task_board_save')
+post_delete.connect(invalidate_task_board, sender=Task, dispatch_uid='response_cache_task_board_delete')
+
+for through in (Task.participants.through, Task.tags.through):
+    m2m_changed.connect(invalidate_task_relations, sender=through, dispatch_uid='response_cache_m2m_%s' % through.__name__)
+
+post_save.connect(invalidate_user_tasks, sender=User, dispatch_uid='response_cache_user')
+
+
+TASK_DEPENDENCIES = (statuses, tags)
+
+
+__all__ = [
+    'ResponseCache',
+    'response_cache',
+    'TASK_DEPENDENCIES',
+]
@@ -0,0 +1,134 @@
+from collections import defaultdict
+
+from .lookups import statuses
+from .models import Status, Task
+from .serializers import TaskSerializer
+
+COLUMNS = {
+    'id': 'id',
+    'status': 'status_id',
+    'priority': 'priority_id',
+    'title': 'title',
+    'description': 'description',
+    'attachment': 'attachment',
+    'created_at': 'created_at',
+    'due_to': 'due_to',
+    'board_id': 'board_id_id',
+}
+
+_field_names = None
+
+
+def get_field_names():
+    global _field_names
+    if _field_names is None:
+        _field_names = list(TaskSerializer().fields)
+    return _field_names
+
+
+class TaskRowSerializer:
+    """
+    Read-only equivalent of TaskSerializer(many=True) for task lists.
+
+    Rows are read with .values() instead of model instances, status comes
+    from the lookup cache and participants and tags are read with one query
+    each for the whole page, so no model or serializer field is instantiated
+    per task. The output is the same as TaskSerializer's: same keys in the
+    same order and the same value representation.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = [name for name in get_field_names() if fields is None or name in fields]
+
+    def get_queryset(self, queryset, extra=()):
+        """
+        Turns tasks queryset into a queryset of plain rows.
+            :param queryset: tasks queryset (filtered and ordered).
+            :param extra: additional columns or annotations, e.g. pagination key.
+            :returns QuerySet: rows as dicts.
+        """
+        columns = ['id'] + [COLUMNS[name] for name in self.fields if name in COLUMNS]
+        return queryset.select_related(None).prefetch_related(None).values(*dict.fromkeys(columns + list(extra)))
+
+    def serialize(self, rows):
+        """
+        Represents rows the way TaskSerializer represents tasks.
+            :param rows: dicts returned by the queryset of get_queryset().
+            :returns list: task representations.
+        """
+        rows = list(rows)
+        ids = [row['id'] for row in rows]
+
+        participants = self._get_related(Task.participants.through, 'user__username', 'user_id', ids) if 'participants' in self.fields else {}
+        tags = self._get_related(Task.tags.through, 'tag__tag', 'tag_id', ids) if 'tags' in self.fields else {}
+        status_names = {status_id: self._get_status(status_id) for status_id in {row.get('status_id') for row in rows} if status_id}
+
+        return self._represent(rows, status_names, participants, tags)
+
+    async def aserialize(self, rows):
+        """
+        serialize() for async views: related rows are read with the async ORM.
+        """
+        ids = [row['id'] for row in rows]
+
+        participants = await self._aget_related(Task.participants.through, 'user__username', 'user_id', ids) if 'participants' in self.fields else {}
+        tags = await self._aget_related(Task.tags.through, 'tag__tag', 'tag_id', ids) if 'tags' in self.fields else {}
+        status_names = {}
+        for status_id in {row.get('status_id') for row in rows}:
+            if status_id:
+                status = await statuses.aget_by_pk(status_id) or await Status.objects.aget(pk=status_id)
+                status_names[status_id] = status.status
+
+        return self._represent(rows, status_names, participants, tags)
+
+    def _represent(self, rows, status_names, participants, tags):
+        storage = Task._meta.get_field('attachment').storage
+
+        data = []
+        for row in rows:
+            item = {}
+            for name in self.fields:
+                if name == 'status':
+                    item[name] = status_names[row['status_id']]
+                elif name == 'participants':
+                    item[name] = participants.get(row['id'], [])
+                elif name == 'tags':
+                    item[name] = tags.get(row['id'], [])
+                elif name == 'attachment':
+                    item[name] = storage.url(row['attachment']) if row['attachment'] else None
+                elif name in ('created_at', 'due_to'):
+                    item[name] = row[name].isoformat() if row[name] is not None else None
+                else:
+                    item[name] = row[COLUMNS[name]]
+            data.append(item)
+        return data
+
+    @staticmethod
+    def _get_status(status_id):
+        status = statuses.get_by_pk(status_id)
+        if status is None:
+            # Статус создан в другом процессе, а локальная копия еще не обновлена.
+            status = Status.objects.get(pk=status_id)
+        return status.status
+
+    @staticmethod
+    def _get_related(through, value, order, ids):
+        # Порядок как у Task.objects.with_related(): по id связанного объекта.
+        related = defaultdict(list)
+        if ids:
+            for task_id, name in through.objects.filter(task_id__in=ids).order_by(order).values_list('task_id', value):
+                related[task_id].append(name)
+        return related
+
+    @staticmethod
+    async def _aget_related(through, value, order, ids):
+        related = defaultdict(list)
+        if ids:
+            async for task_id, name in through.objects.filter(task_id__in=ids).order_by(order).values_list('task_id', value):
+                related[task_id].append(name)
+        return related
+
+
+__all__ = [
+    'TaskRowSerializer',
+]
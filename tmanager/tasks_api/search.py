@@ -0,0 +1,196 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Task
+
+TASK_TABLE = Task._meta.db_table
+
+
+class PostgresSearchBackend:
+    """
+    Full-text search over a `search_vector` tsvector column of the task table.
+
+    The column is filled by a BEFORE INSERT/UPDATE trigger (title weighted
+    above description) and served by a GIN index. A trigger is used instead
+    of a generated column so that migrations may still alter title and
+    description.
+    """
+
+    function = '%s_search_vector' % TASK_TABLE
+    index = '%s_search_idx' % TASK_TABLE
+
+    @property
+    def config(self):
+        return getattr(settings, 'TASK_SEARCH_CONFIG', 'simple')
+
+    def vector_sql(self, prefix):
+        return (
+            "setweight(to_tsvector('{config}', coalesce({prefix}title, '')), 'A') || "
+            "setweight(to_tsvector('{config}', coalesce({prefix}description, '')), 'B')"
+        ).format(config=self.config, prefix=prefix)
+
+    def install(self, cursor):
+        cursor.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'search_vector'",
+            [TASK_TABLE],
+        )
+        created = cursor.fetchone() is None
+        if created:
+            cursor.execute('ALTER TABLE "%s" ADD COLUMN search_vector tsvector' % TASK_TABLE)
+
+        cursor.execute(
+            'CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$ '
+            'BEGIN NEW.search_vector := %s; RETURN NEW; END $$ LANGUAGE plpgsql' % (self.function, self.vector_sql('NEW.'))
+        )
+        cursor.execute(
+            'SELECT 1 FROM pg_trigger WHERE tgname = %s AND tgrelid = %s::regclass',
+            [self.function, '"%s"' % TASK_TABLE],
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(
+                'CREATE TRIGGER %s BEFORE INSERT OR UPDATE OF title, description ON "%s" '
+                'FOR EACH ROW EXECUTE FUNCTION %s()' % (self.function, TASK_TABLE, self.function)
+            )
+
+        # Существующие строки заполняются один раз, при добавлении колонки: дальше их ведет триггер.
+        if created:
+            cursor.execute('UPDATE "%s" SET search_vector = %s' % (TASK_TABLE, self.vector_sql('')))
+        cursor.execute('CREATE INDEX IF NOT EXISTS %s ON "%s" USING GIN (search_vector)' % (self.index, TASK_TABLE))
+
+    def search(self, queryset, query):
+        tsquery = 'websearch_to_tsquery(%s, %s)'
+        params = [self.config, query]
+        # ts_rank_cd возвращает real: значение из курсора (double) не было бы равно
+        # рангу в строке, и строки с одинаковым рангом терялись бы между страницами.
+        rank_sql = 'ts_rank_cd("%s".search_vector, %s)::double precision' % (TASK_TABLE, tsquery)
+        return queryset.annotate(
+            rank=RawSQL(rank_sql, params, output_field=FloatField()),
+        ).filter(
+            RawSQL('"%s".search_vector @@ %s' % (TASK_TABLE, tsquery), params, output_field=BooleanField()),
+        )
+
+
+class SQLiteSearchBackend:
+    """
+    Full-text search through an FTS5 table with external content (the task
+    table itself), kept in sync by triggers. Rank is negated bm25 with title
+    weighted above description, so that greater rank means better match.
+    """
+
+    table = '%s_fts' % TASK_TABLE
+
+    triggers = ('%s_ai' % table, '%s_ad' % table, '%s_au' % table)
+
+    def install(self, cursor):
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (%s)" % ', '.join(['%s'] * (len(self.triggers) + 1)),
+            [self.table, *self.triggers],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if existing == {self.table, *self.triggers}:
+            # Индекс на месте и ведется триггерами: повторная миграция его не перестраивает.
+            return
+
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(title, description, content='%s', content_rowid='id')"
+            % (self.table, TASK_TABLE)
+        )
+        # Пересоздание таблицы при миграции SQLite удаляет триггеры, поэтому они создаются заново.
+        cursor.execute(
+            'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{table}" BEGIN '
+            'INSERT INTO {fts}(rowid, title, description) VALUES (new.id, new.title, new.description); END'
+            .format(fts=self.table, table=TASK_TABLE)
+        )
+        cursor.execute(
+            'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{table}" BEGIN '
+            "INSERT INTO {fts}({fts}, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END"
+            .format(fts=self.table, table=TASK_TABLE)
+        )
+        cursor.execute(
+            'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF title, description ON "{table}" BEGIN '
+            "INSERT INTO {fts}({fts}, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+            'INSERT INTO {fts}(rowid, title, description) VALUES (new.id, new.title, new.description); END'
+            .format(fts=self.table, table=TASK_TABLE)
+        )
+        # Без триггеров изменения задач в индекс не попадали: он строится заново.
+        cursor.execute("INSERT INTO {fts}({fts}) VALUES ('rebuild')".format(fts=self.table))
+
+    @staticmethod
+    def make_query(query):
+        # Каждое слово в кавычках: синтаксис FTS5 из пользовательского ввода не интерпретируется.
+        return ' '.join('"%s"' % word for word in re.findall(r'\w+', query))
+
+    def search(self, queryset, query):
+        match = self.make_query(query)
+        return queryset.annotate(
+            rank=RawSQL(
+                'SELECT -bm25({fts}, 10.0, 1.0) FROM {fts} WHERE {fts} MATCH %s AND rowid = "{table}"."id"'
+                .format(fts=self.table, table=TASK_TABLE),
+                [match],
+                output_field=FloatField(),
+            ),
+        ).filter(
+            RawSQL(
+                '"{table}"."id" IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)'.format(fts=self.table, table=TASK_TABLE),
+                [match],
+                output_field=BooleanField(),
+            ),
+        )
+
+
+class LikeSearchBackend:
+    """
+    Fallback for other databases: unindexed substring search without ranking.
+    """
+
+    def install(self, cursor):
+        pass
+
+    def search(self, queryset, query):
+        condition = Q()
+        for word in query.split():
+            condition &= Q(title__icontains=word) | Q(description__icontains=word)
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField())).filter(condition)
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend(using='default'):
+    return BACKENDS.get(connections[using].vendor, LikeSearchBackend)()
+
+
+def search_tasks(queryset, query):
+    """
+    Filters tasks by full-text query and annotates them with `rank`
+    (greater is better).
+        :param queryset: tasks queryset.
+        :param query: search query entered by user.
+        :returns QuerySet: matching tasks.
+    """
+    return get_search_backend(queryset.db).search(queryset, query)
+
+
+def install_search_index(sender, using='default', **kwargs):
+    """
+    post_migrate handler creating search structures which are not expressed
+    in models (column, triggers, FTS table). Safe to run repeatedly: existing
+    structures are left as they are, the index is filled only when it is
+    created or its triggers were missing.
+    """
+    with connections[using].cursor() as cursor:
+        get_search_backend(using).install(cursor)
+
+
+__all__ = [
+    'get_search_backend',
+    'install_search_index',
+    'search_tasks',
+]
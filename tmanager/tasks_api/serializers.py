@@ -1,10 +1,17 @@
 from django.contrib.auth.models import User
-from rest_framework.exceptions import ValidationError
+from django.utils.encoding import smart_str
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
 from rest_framework.relations import SlugRelatedField
-from rest_framework.serializers import ModelSerializer, StringRelatedField, PrimaryKeyRelatedField, ManyRelatedField, CharField
-
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework.serializers import (
+    ModelSerializer, StringRelatedField, PrimaryKeyRelatedField, ManyRelatedField, CharField, SerializerMethodField,
+)
+
+from .authentication import make_user_claims
+from .lookups import priorities, statuses, tags
 from .models import *
-from .mixins import CommonValidationMixin
+from .mixins import CommonValidationMixin, DynamicFieldsMixin
 
 
 class StatusSerializer(ModelSerializer):
@@ -24,11 +31,46 @@ class ManyRelatedTagField(ManyRelatedField):
         return TagSerializer(value, many=True).data
 
     def to_internal_value(self, data):
-        tags = []
-        for tag_data in data:
-            tag, created = Tag.objects.get_or_create(**tag_data)
-            tags.append(tag)
-        return tags
+        return [tags.get_or_create(tag_data['tag']) for tag_data in data]
+
+
+class CachedSlugRelatedField(SlugRelatedField):
+    """
+    SlugRelatedField resolving values through a LookupCache instead of the database.
+    """
+
+    def __init__(self, lookup, **kwargs):
+        self.lookup = lookup
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        obj = self.lookup.get_by_slug(data) if isinstance(data, str) else None
+        if obj is None:
+            self.fail('does_not_exist', slug_name=self.slug_field, value=smart_str(data))
+        return obj
+
+
+class CachedPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField resolving values through a LookupCache instead of the database.
+    """
+
+    def __init__(self, lookup, **kwargs):
+        self.lookup = lookup
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        obj = self.lookup.get_by_pk(pk)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
 
 
 class PrioritySerializer(ModelSerializer):
@@ -43,11 +85,18 @@ class ParticipantsSerializer(ModelSerializer):
         fields = ['username']
 
 
-class BoardSerializer(ModelSerializer, CommonValidationMixin):
+class BoardSerializer(DynamicFieldsMixin, ModelSerializer, CommonValidationMixin):
+
+    status_counters = SerializerMethodField()
 
     class Meta:
         model = Board
-        fields = ['title', 'description', 'created_at', 'updated_at']
+        fields = ['title', 'description', 'created_at', 'updated_at', 'status_counters']
+
+    def get_status_counters(self, obj):
+        # Одна выборка из BoardStatusCounter вместо COUNT по задачам борда.
+        counts = BoardStatusCounter.objects.get_counts(obj.pk)
+        return {status.status: counts.get(status.pk, 0) for status in statuses.all()}
 
 
 class UserSerializer(ModelSerializer):
@@ -63,10 +112,39 @@ class UserSerializer(ModelSerializer):
         return user
 
 
-class TaskSerializer(ModelSerializer, CommonValidationMixin):
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Issues tokens carrying user claims trusted by ClaimsJWTAuthentication.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token.payload.update(make_user_claims(user))
+        return token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refreshes tokens with user claims re-read from the database: claims of the
+    refresh token may be as old as the refresh token itself.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed('No active account found for the given token.', code='no_active_account')
+
+        refresh.payload.update(make_user_claims(user))
+        # Новый access токен копирует утверждения из обновленного refresh токена.
+        return super().validate({'refresh': str(refresh)})
+
+
+class TaskSerializer(DynamicFieldsMixin, ModelSerializer, CommonValidationMixin):
 
-    status = SlugRelatedField(slug_field='status', queryset=Status.objects.all())
-    priority = PrimaryKeyRelatedField(queryset=Priority.objects.all())
+    status = CachedSlugRelatedField(lookup=statuses, slug_field='status', queryset=Status.objects.all())
+    priority = CachedPrimaryKeyRelatedField(lookup=priorities, queryset=Priority.objects.all())
     participants = StringRelatedField(many=True, read_only=True)
     tags = StringRelatedField(many=True, read_only=True)
 
@@ -97,6 +175,8 @@ class TaskSerializer(ModelSerializer, CommonValidationMixin):
 
 __all__ = [
     'BoardSerializer',
+    'ClaimsTokenObtainPairSerializer',
+    'ClaimsTokenRefreshSerializer',
     'TaskSerializer',
     'UserSerializer',
 ]
@@ -1,17 +1,19 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.template.loader import render_to_string
 
-from .models import Task, TaskHistory
-from .tasks import send_email_notifications
+from .models import BoardStatusCounter, Task, TaskHistory
+from .notifications import notify, status_notification
 
 
 @receiver(post_save, sender=Task)
 def update_task_history(sender, instance, created, **kwargs):
 
-    user = kwargs.get('user')
+    # Автор изменения задается вызывающим кодом до сохранения (см. RetrieveUpdateDestroyTaskApiView).
+    user = getattr(instance, '_history_user', None)
 
-    if not created:
+    # Переход определяется тем, что записал Task.save, а не заполненным
+    # previous_status: он остается от прошлой смены статуса.
+    if not created and instance.has_status_changed():
         TaskHistory.objects.create(
             user=user,
             task=instance,
@@ -19,19 +21,22 @@ def update_task_history(sender, instance, created, **kwargs):
             current_status=instance.status,
         )
 
-        subject = 'Status of task %s has been changed' % instance.title
-        context = {
-            'user': user,
-            'subject': subject,
-            'message': 'User %s changed status of task from %s to %s.' % (user, instance.previous_status, instance.status),
-            'daily': False,
-        }
-        message = render_to_string('mail/notification_detail.html', context=context)
+        subject, text = status_notification(
+            instance.title,
+            user,
+            instance.previous_status,
+            instance.status,
+        )
 
         recipients_emails = set()
         for user in instance.participants.all():
             if user.email:
                 recipients_emails.add(user.email)
 
-        if recipients_emails:
-            send_email_notifications.delay(subject, message, list(recipients_emails))
+        notify([(subject, text, recipients_emails)])
+
+
+@receiver(post_delete, sender=Task)
+def update_board_counters(sender, instance, **kwargs):
+    # Вызывается и при каскадном удалении, внутри транзакции удаления.
+    BoardStatusCounter.objects.apply_deltas({(instance.board_id_id, instance.status_id): -1})
@@ -1,11 +1,22 @@
-import datetime
-import os
+import logging
+from itertools import groupby
+from operator import itemgetter
+from smtplib import SMTPException
 
 from celery import shared_task
-from django.core.mail import send_mail, send_mass_mail
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.template.loader import render_to_string
+from django.utils import timezone
 
-from .models import Task
+from . import metrics, profiling  # noqa: F401 - сигналы celery для метрик и профилирования SQL
+from .lookups import statuses
+from .mail import build_message, is_transient_error, send_messages
+from .models import PendingNotification, Task, TaskImport
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
@@ -15,39 +26,188 @@ def send_email_notifications(
         recipients: list[str],
 ):
 
-    send_mail(
-        subject=subject,
-        message=subject,
-        html_message=message,
-        from_email=os.getenv('EMAIL_USER'),
-        recipient_list=recipients,
-        fail_silently=False,
+    send_messages([build_message(subject, message, recipients)])
+
+
+@shared_task
+def send_bulk_email_notifications(messages: list[list]):
+    """
+    Sends notifications collected by one bulk operation over the pooled connection.
+        :param messages: list of (subject, html message, recipients).
+    """
+
+    send_messages([build_message(subject, message, recipients) for subject, message, recipients in messages])
+
+
+@shared_task(bind=True, max_retries=5)
+def flush_notifications(self, recipient: str):
+    """
+    Sends all notifications buffered for recipient as one message. Events are
+    deleted in the transaction of the send. If sending fails for a transient
+    reason (lost connection, 4xx reply) they stay buffered and the job is
+    retried with backoff; a permanent failure is logged and the events are
+    dropped, as a retry would fail the same way.
+        :param recipient: e-mail of recipient.
+    """
+
+    from .notifications import SCHEDULED_KEY
+
+    # Снимаем отметку до чтения буфера: события, пришедшие после этого
+    # момента, запланируют следующую отправку сами.
+    cache.delete(SCHEDULED_KEY % recipient)
+
+    with transaction.atomic():
+        events = list(
+            PendingNotification.objects
+            .select_for_update(skip_locked=True)
+            .filter(recipient=recipient)
+            .order_by('id')
+        )
+
+        if not events:
+            return
+
+        if len(events) == 1:
+            subject = events[0].subject
+        else:
+            subject = 'You have %s task updates' % len(events)
+
+        context = {
+            'subject': subject,
+            'message': events[0].text if len(events) == 1 else 'Here is what has changed in your tasks.',
+            'daily': False,
+            'events': [event.text for event in events] if len(events) > 1 else [],
+        }
+        html_message = render_to_string('mail/notification_detail.html', context=context)
+
+        # Строки остаются заблокированными до отправки: при временной ошибке
+        # транзакция откатывается, события не теряются и отправляются при повторе.
+        try:
+            send_messages([build_message(subject, html_message, [recipient])])
+        except (SMTPException, OSError) as exc:
+            if not is_transient_error(exc):
+                logger.error('Dropped %s notification events for %s: %s', len(events), recipient, exc)
+                PendingNotification.objects.filter(pk__in=[event.pk for event in events]).delete()
+                return
+            countdown = get_exponential_backoff_interval(1, self.request.retries, 600, full_jitter=True)
+            raise self.retry(exc=exc, countdown=countdown)
+
+        PendingNotification.objects.filter(pk__in=[event.pk for event in events]).delete()
+
+    metrics.NOTIFICATION_MESSAGES.inc()
+    metrics.NOTIFICATION_EVENTS_PER_MESSAGE.observe(len(events))
+    logger.info('Coalesced %s notification events into one message for %s.', len(events), recipient)
+
+
+DIGEST_STATUSES = ['in_progress', 'to_do']
+
+
+def get_digest_rows(today):
+    """
+    Participations in open tasks due today or earlier, ordered by recipient.
+    Statuses are filtered by id taken from the lookup cache: without a join
+    to the status table the tasks are found by the (status, due_to) index.
+        :param today: date the tasks are due by.
+        :returns QuerySet: (user id, email, task title, status id, due_to) rows.
+    """
+    status_ids = [status.pk for status in map(statuses.get_by_slug, DIGEST_STATUSES) if status is not None]
+    return (
+        Task.participants.through.objects
+        .filter(
+            task__status_id__in=status_ids,
+            task__due_to__lte=today,
+            user__email__gt='',
+        )
+        .order_by('user_id', 'task__due_to', 'task_id')
+        .values_list('user_id', 'user__email', 'task__title', 'task__status_id', 'task__due_to')
     )
 
 
 @shared_task(name='send_daily_project_notification')
 def send_daily_project_notification():
+    """
+    Sends every participant of open overdue tasks one digest listing these tasks.
 
-    allowed_statuses = ['in_progress', 'to_do']
+    Participation rows are streamed with a server-side cursor ordered by user,
+    so only one recipient's tasks are held in memory at a time. Digests are
+    handed to send_daily_digest_batch in batches of DAILY_DIGEST_BATCH_SIZE,
+    which lets several workers render and send them in parallel.
+    """
 
-    cur_date = datetime.datetime.now()
-    formatted_date = cur_date.strftime('%Y-%m-%d')
+    batch_size = getattr(settings, 'DAILY_DIGEST_BATCH_SIZE', 100)
+    max_tasks = getattr(settings, 'DAILY_DIGEST_MAX_TASKS', 100)
 
-    tasks = Task.objects.filter(status__status__in=allowed_statuses, due_to__lte=formatted_date)
+    rows = get_digest_rows(timezone.localdate()).iterator(chunk_size=getattr(settings, 'DAILY_DIGEST_CHUNK_SIZE', 2000))
 
-    emails = []
-    for task in tasks:
-        recipients = [user.email for user in task.participants.all()]
+    batch = []
+    for user_id, user_rows in groupby(rows, key=itemgetter(0)):
+        tasks = []
+        total = 0
+        for _, email, title, status_id, due_to in user_rows:
+            total += 1
+            if len(tasks) < max_tasks:
+                tasks.append([title, str(statuses.get_by_pk(status_id)), due_to.isoformat()])
+
+        batch.append([email, tasks, total])
+        if len(batch) >= batch_size:
+            send_daily_digest_batch.delay(batch)
+            batch = []
+
+    if batch:
+        send_daily_digest_batch.delay(batch)
 
-        subject = 'Notification! Status of task %s is %s' % (tasks.title, task.status.status)
-        message = 'Good morning! Here is a notification of current status of task %s.' % tasks.title
+
+@shared_task
+def send_daily_digest_batch(digests: list[list]):
+    """
+    Renders and sends a batch of daily digests over the pooled connection.
+        :param digests: list of (recipient email, [(title, status, due_to)], total tasks count).
+    """
+
+    emails = []
+    for email, tasks, total in digests:
+        subject = 'Notification! You have %s overdue tasks' % total
         context = {
             'subject': subject,
-            'message': message,
+            'message': 'Good morning! Here is a notification of current status of your tasks.',
             'daily': True,
+            'tasks': [{'title': title, 'status': status, 'due_to': due_to} for title, status, due_to in tasks],
+            'more': total - len(tasks),
         }
         html_message = render_to_string('mail/notification_detail.html', context=context)
-        data_list = [subject, html_message, os.getenv('EMAIL_USER'), recipients]
-        emails.append(data_list)
+        emails.append(build_message(subject, html_message, [email]))
+
+    send_messages(emails)
 
-    send_mass_mail(tuple(emails), fail_silently=False)
+
+@shared_task(name='maintain_task_history')
+def maintain_task_history():
+    """
+    Creates upcoming TaskHistory partitions and archives history older than
+    TASK_HISTORY_RETENTION_MONTHS.
+    """
+
+    from .history import maintain_history
+
+    created, archived = maintain_history()
+    logger.info('Task history maintenance: created partitions %s, archived %s.', created, archived)
+
+
+@shared_task
+def import_tasks(import_id: str):
+    """
+    Imports tasks from file uploaded with TaskImport (see imports.py).
+        :param import_id: id of TaskImport.
+    """
+
+    from .imports import run_import
+
+    task_import = TaskImport.objects.select_related('board').filter(pk=import_id, state=TaskImport.PENDING).first()
+    if task_import is None:
+        return
+
+    importer = run_import(task_import)
+    logger.info(
+        'Task import %s: processed %s, created %s, rejected %s.',
+        import_id, importer.processed, importer.created, importer.failed,
+    )
@@ -1,18 +1,32 @@
 import dataclasses
+import datetime
+import io
+import json
+import os
+import tempfile
+from unittest import mock, skipUnless
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.core import mail
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from .models import *
+from .response_cache import response_cache
 
 
-class ApiViewTestCase(TestCase):
+class AuthenticatedApiTestCase(TestCase):
 
     fixtures = ['test_data.json']
 
     def setUp(self):
 
+        # Кэш не откатывается вместе с транзакцией теста.
+        cache.clear()
+
         self.username = 'test_user'
         self.password = 'test_password'
         self.email = 'test_email@example.com'
@@ -32,6 +46,9 @@ class ApiViewTestCase(TestCase):
         self.assertEqual(token_response.status_code, 200)
         self.token = token_response.json().get('access')
 
+
+class ApiViewTestCase(AuthenticatedApiTestCase):
+
     def test_get_board_by_id(self):
 
         board_response = self.client.get(
@@ -163,6 +180,47 @@ class ApiViewTestCase(TestCase):
             'Только участники могут обновлять статус таска.'
         )
 
+    def test_participant_updates_title_without_history(self):
+
+        Task.objects.get(pk=1).participants.add(User.objects.get(username=self.username))
+
+        task_response = self.client.put(
+            reverse('tasks_api:task', kwargs={'pk': 1}),
+            data={'title': 'Новое название'},
+            content_type='application/json',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+
+        self.assertEqual(task_response.status_code, 200)
+        self.assertFalse(TaskHistory.objects.filter(task_id=1).exists())
+
+    def test_participant_status_update_writes_one_history_row(self):
+
+        user = User.objects.get(username=self.username)
+        Task.objects.get(pk=1).participants.add(user)
+        url = reverse('tasks_api:task', kwargs={'pk': 1})
+
+        task_response = self.client.put(
+            url,
+            data={'status': 'in_progress'},
+            content_type='application/json',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+        self.assertEqual(task_response.status_code, 200)
+
+        history = TaskHistory.objects.filter(task_id=1)
+        self.assertEqual(history.count(), 1)
+        self.assertEqual(history.get().user, user)
+
+        task_response = self.client.put(
+            url,
+            data={'title': 'Новое название'},
+            content_type='application/json',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+        self.assertEqual(task_response.status_code, 200)
+        self.assertEqual(history.count(), 1, 'Изменение названия не должно попадать в историю статусов.')
+
     def test_remove_task(self):
 
         task_response = self.client.delete(
@@ -176,3 +234,1580 @@ class ApiViewTestCase(TestCase):
             403,
             'Невозмонжно удалить таск, если вы не администратор.'
         )
+
+    def test_board_tasks_cursor_pagination(self):
+
+        board = Board.objects.get(pk=1)
+        for i in range(12):
+            Task.objects.create(
+                board_id=board,
+                title='Task %s' % i,
+                description='Task for pagination.',
+                priority_id=1,
+                status_id=1,
+                due_to='2024-12-24',
+            )
+
+        expected_ids = set(board.tasks.values_list('id', flat=True))
+
+        url = reverse('tasks_api:board_tasks', kwargs={'pk': 1}) + '?pagination=cursor'
+        seen_ids = []
+        pages = []
+        while url:
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertNotIn('count', body, 'Курсорная пагинация не должна считать COUNT(*).')
+            pages.append(url)
+            seen_ids.extend(task['id'] for task in body['results'])
+            url = body['next']
+
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(len(seen_ids), len(set(seen_ids)), 'Задачи повторяются между страницами.')
+        self.assertEqual(set(seen_ids), expected_ids)
+
+        last_page = self.client.get(pages[-1], HTTP_AUTHORIZATION='Bearer %s' % self.token).json()
+        previous_page = self.client.get(last_page['previous'], HTTP_AUTHORIZATION='Bearer %s' % self.token).json()
+        self.assertEqual([task['id'] for task in previous_page['results']], seen_ids[:10])
+        self.assertIsNone(previous_page['previous'])
+
+        filtered_response = self.client.get(
+            reverse('tasks_api:board_tasks', kwargs={'pk': 1}) + '?pagination=cursor&status=1&priority=2',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+        self.assertEqual(filtered_response.json()['results'], [])
+
+        invalid_response = self.client.get(
+            reverse('tasks_api:board_tasks', kwargs={'pk': 1}) + '?cursor=broken',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+        self.assertEqual(invalid_response.status_code, 404)
+
+    def test_edited_task_keeps_cursor_position(self):
+
+        board = Board.objects.get(pk=1)
+        for i in range(12):
+            Task.objects.create(
+                board_id=board,
+                title='Task %s' % i,
+                description='Task for pagination.',
+                priority_id=1,
+                status_id=1,
+                due_to='2024-12-24',
+            )
+        board.tasks.update(created_at=datetime.date(2020, 1, 1))
+
+        url = reverse('tasks_api:board_tasks', kwargs={'pk': 1}) + '?pagination=cursor'
+        first_page = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token).json()
+        seen_ids = [task['id'] for task in first_page['results']]
+
+        # Сохранение обновляет created_at (auto_now): задача не должна уйти со второй страницы.
+        edited = board.tasks.exclude(pk__in=seen_ids).first()
+        edited.title = 'Edited task'
+        edited.save()
+
+        second_page = self.client.get(first_page['next'], HTTP_AUTHORIZATION='Bearer %s' % self.token).json()
+        seen_ids += [task['id'] for task in second_page['results']]
+
+        self.assertEqual(sorted(seen_ids), sorted(board.tasks.values_list('id', flat=True)))
+
+    def test_board_tasks_without_count(self):
+
+        response = self.client.get(
+            reverse('tasks_api:board_tasks', kwargs={'pk': 1}) + '?count=false',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertNotIn('count', body)
+        self.assertIsNone(body['next'])
+        self.assertEqual(len(body['results']), 3)
+
+
+class QueryBudgetTestCase(AuthenticatedApiTestCase):
+
+    # Количество SQL запросов на эндпоинт не должно зависеть от числа задач.
+    # Пользователь при JWT аутентификации берется из токена, без запросов.
+    QUERY_BUDGET = {
+        'board_tasks': 5,
+        'task': 3,
+        'task_cached': 0,
+    }
+
+    def assertQueryBudget(self, url, budget, prepare=None):
+        # Первый запрос прогревает процессные кэши справочников.
+        self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        if prepare is not None:
+            prepare()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(context.captured_queries),
+            budget,
+            'Превышен бюджет SQL запросов для %s:\n%s' % (
+                url, '\n'.join(query['sql'] for query in context.captured_queries),
+            ),
+        )
+        return response
+
+    def add_tasks(self, count):
+        tasks = Task.objects.bulk_create([
+            Task(
+                board_id_id=1,
+                title='Budget task %s' % i,
+                description='Task for query budget.',
+                priority_id=1,
+                status_id=1,
+                due_to='2024-12-24',
+            ) for i in range(count)
+        ])
+        for task in tasks:
+            task.participants.set([1, 2, 3])
+            task.tags.set([1, 2])
+
+    def test_board_tasks_query_budget(self):
+
+        url = reverse('tasks_api:board_tasks', kwargs={'pk': 1})
+        self.assertQueryBudget(url, self.QUERY_BUDGET['board_tasks'])
+
+        self.add_tasks(10)
+        response = self.assertQueryBudget(url, self.QUERY_BUDGET['board_tasks'])
+        self.assertEqual(len(response.json()['results']), 10)
+
+        self.assertQueryBudget(url + '?count=false', self.QUERY_BUDGET['board_tasks'] - 1)
+        self.assertQueryBudget(url + '?pagination=cursor', self.QUERY_BUDGET['board_tasks'] - 1)
+
+    def test_task_query_budget(self):
+
+        url = reverse('tasks_api:task', kwargs={'pk': 1})
+        response = self.assertQueryBudget(
+            url,
+            self.QUERY_BUDGET['task'],
+            prepare=lambda: cache.delete(response_cache.version_key(Task, 1)),
+        )
+        self.assertQueryBudget(url, self.QUERY_BUDGET['task_cached'])
+        self.assertEqual(sorted(response.json()['participants']), ['user2', 'user3', 'user4'])
+        self.assertEqual(sorted(response.json()['tags']), ['backend', 'deploy', 'testing'])
+
+
+class DirtyFieldsTestCase(TestCase):
+
+    fixtures = ['test_data.json']
+
+    def test_status_change_updates_only_changed_columns(self):
+
+        task = Task.objects.get(pk=1)
+        task.status = Status.objects.get(status='in_progress')
+
+        with CaptureQueriesContext(connection) as context:
+            task.save()
+
+        update_sql = context.captured_queries[0]['sql']
+        self.assertTrue(update_sql.startswith('UPDATE'), 'Перед UPDATE не должно быть повторного SELECT задачи.')
+        self.assertIn('previous_status_id', update_sql)
+        self.assertNotIn('"title"', update_sql)
+
+        task.refresh_from_db()
+        self.assertEqual(task.previous_status.status, 'to_do')
+        self.assertEqual(task.get_dirty_fields(), [])
+        self.assertTrue(TaskHistory.objects.filter(task=task, current_status='in_progress').exists())
+
+    def test_full_save_without_status_change_writes_no_history(self):
+
+        Task.objects.filter(pk=1).update(previous_status=Status.objects.get(status='in_progress'))
+        task = Task.objects.get(pk=1)
+
+        # Экземпляр без загруженных значений сохраняется целиком (update_fields=None).
+        copy = Task(**{field.attname: getattr(task, field.attname) for field in Task._meta.concrete_fields})
+        copy.title = 'Renamed task'
+        copy.save()
+
+        self.assertEqual(Task.objects.get(pk=1).title, 'Renamed task')
+        self.assertFalse(TaskHistory.objects.filter(task_id=1).exists())
+
+    def test_unchanged_save_skips_update(self):
+
+        task = Task.objects.get(pk=1)
+
+        with CaptureQueriesContext(connection) as context:
+            task.save()
+
+        self.assertEqual(len(context.captured_queries), 0)
+
+        task.title = 'Renamed task'
+        task.save()
+        self.assertFalse(TaskHistory.objects.filter(task=task).exists(), 'История статусов изменилась без смены статуса.')
+
+    def test_refresh_resets_loaded_values(self):
+
+        task = Task.objects.get(pk=1)
+        title = task.title
+        Task.objects.filter(pk=1).update(title='Changed elsewhere')
+
+        task.refresh_from_db()
+        self.assertEqual(task.get_dirty_fields(), [])
+
+        task.title = title
+        task.save()
+        self.assertEqual(Task.objects.get(pk=1).title, title)
+
+    def test_deferred_field_changes_are_saved(self):
+
+        task = Task.objects.only('id', 'board_id', 'status').get(pk=1)
+        self.assertTrue(task.title)
+
+        task.title = 'Renamed task'
+        task.save()
+        self.assertEqual(Task.objects.get(pk=1).title, 'Renamed task')
+
+    def test_partial_save_updates_auto_now_fields(self):
+
+        Task.objects.filter(pk=1).update(created_at=datetime.date(2000, 1, 1))
+        task = Task.objects.get(pk=1)
+
+        task.title = 'Renamed task'
+        task.save()
+        self.assertNotEqual(Task.objects.get(pk=1).created_at, datetime.date(2000, 1, 1))
+
+
+class BulkTaskApiTestCase(AuthenticatedApiTestCase):
+
+    def test_bulk_create_tasks(self):
+
+        task_data = {
+            'title': 'Bulk task',
+            'description': 'Created in bulk.',
+            'board_id': 1,
+            'priority': 1,
+            'due_to': '2024-12-24',
+            'status': 'to_do',
+        }
+
+        response = self.client.post(
+            reverse('tasks_api:bulk_create_tasks'),
+            data=[task_data, dict(task_data, status='unknown'), dict(task_data, title='Second bulk task')],
+            content_type='application/json',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'created'])
+        self.assertIn('status', results[1]['errors'])
+        self.assertEqual(Task.objects.filter(title__in=['Bulk task', 'Second bulk task']).count(), 2)
+
+    def test_bulk_status_transitions(self):
+
+        user = User.objects.get(username=self.username)
+        for task in Task.objects.filter(pk__in=[1, 3]):
+            task.participants.add(user)
+
+        items = [
+            {'id': 1, 'status': 'in_progress'},
+            {'id': 3, 'status': 'done'},
+            {'id': 5, 'status': 'in_progress'},
+            {'id': 1, 'title': 'Not allowed'},
+        ]
+
+        with override_settings(NOTIFICATION_COALESCE_WINDOW=0), \
+                mock.patch('tasks_api.notifications.send_bulk_email_notifications') as send_notifications:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.put(
+                    reverse('tasks_api:bulk_task_status'),
+                    data=items,
+                    content_type='application/json',
+                    HTTP_AUTHORIZATION='Bearer %s' % self.token,
+                )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['updated', 'error', 'error', 'error'])
+        self.assertIn('status', results[1]['errors'], 'Переход to_do -> done должен быть запрещен.')
+        self.assertIn('error', results[2]['errors'], 'Изменять задачу может только участник.')
+
+        task = Task.objects.get(pk=1)
+        self.assertEqual(task.status.status, 'in_progress')
+        self.assertEqual(task.previous_status.status, 'to_do')
+        self.assertEqual(
+            list(TaskHistory.objects.filter(task=task).values_list('previous_status', 'current_status', 'user')),
+            [('to_do', 'in_progress', user.pk)],
+        )
+
+        send_notifications.delay.assert_called_once()
+        messages, = send_notifications.delay.call_args.args
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0][2], ['test_email@example.com', 'user2@example.com', 'user3@example.com', 'user4@example.com'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'SQLite не поддерживает SELECT ... FOR UPDATE.')
+    def test_bulk_update_locks_tasks(self):
+
+        from .bulk import bulk_update_tasks
+
+        user = User.objects.get(username=self.username)
+        for task in Task.objects.filter(pk__in=[1, 3]):
+            task.participants.add(user)
+
+        with CaptureQueriesContext(connection) as context:
+            bulk_update_tasks([{'id': 3, 'title': 'Locked'}, {'id': 1, 'title': 'Locked too'}], user)
+
+        # Задачи читаются с блокировкой в порядке pk, снимок до транзакции не используется.
+        selects = [query['sql'] for query in context.captured_queries if 'FROM "tasks_api_task"' in query['sql']]
+        self.assertIn('FOR UPDATE OF "tasks_api_task"', selects[0])
+        self.assertIn('ORDER BY "tasks_api_task"."id" ASC', selects[0])
+        self.assertEqual(
+            list(Task.objects.filter(pk__in=[1, 3]).order_by('pk').values_list('title', flat=True)),
+            ['Locked too', 'Locked'],
+        )
+
+    @override_settings(NOTIFICATION_COALESCE_WINDOW=60)
+    def test_notifications_coalesced_per_recipient(self):
+
+        from prometheus_client import REGISTRY
+
+        from .tasks import flush_notifications
+
+        user = User.objects.get(username=self.username)
+        for task in Task.objects.filter(pk__in=[1, 3]):
+            task.participants.add(user)
+
+        events_before = REGISTRY.get_sample_value('tasks_manager_notification_events_total')
+        with mock.patch.object(flush_notifications, 'apply_async') as apply_async:
+            for task_id in (1, 3):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.put(
+                        reverse('tasks_api:bulk_task_status'),
+                        data=[{'id': task_id, 'status': 'in_progress'}],
+                        content_type='application/json',
+                        HTTP_AUTHORIZATION='Bearer %s' % self.token,
+                    )
+
+        scheduled = sorted(call.kwargs['args'][0] for call in apply_async.call_args_list)
+        self.assertEqual(
+            scheduled,
+            ['test_email@example.com', 'user1@example.com', 'user2@example.com', 'user3@example.com', 'user4@example.com'],
+            'Отправка должна планироваться один раз на получателя.',
+        )
+        self.assertEqual(
+            REGISTRY.get_sample_value('tasks_manager_notification_events_total'),
+            events_before + PendingNotification.objects.count(),
+        )
+
+        messages_before = REGISTRY.get_sample_value('tasks_manager_notification_messages_total')
+        flush_notifications(self.email)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'You have 2 task updates')
+        self.assertIn('Do homework!', mail.outbox[0].alternatives[0][0])
+        self.assertFalse(PendingNotification.objects.filter(recipient=self.email).exists())
+        self.assertEqual(REGISTRY.get_sample_value('tasks_manager_notification_messages_total'), messages_before + 1)
+
+    def test_failed_flush_keeps_events(self):
+
+        from smtplib import SMTPServerDisconnected
+        from .tasks import flush_notifications
+
+        PendingNotification.objects.create(recipient=self.email, subject='Subject', text='Text')
+
+        with mock.patch('tasks_api.tasks.send_messages', side_effect=SMTPServerDisconnected):
+            with self.assertRaises(SMTPServerDisconnected):
+                flush_notifications(self.email)
+        self.assertTrue(PendingNotification.objects.filter(recipient=self.email).exists())
+
+        flush_notifications(self.email)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(PendingNotification.objects.filter(recipient=self.email).exists())
+
+    def test_permanent_flush_error_drops_events(self):
+
+        from smtplib import SMTPDataError, SMTPRecipientsRefused
+        from .tasks import flush_notifications
+
+        PendingNotification.objects.create(recipient=self.email, subject='Subject', text='Text')
+
+        # Временный отказ (4xx): событие остается до повтора.
+        with mock.patch('tasks_api.tasks.send_messages', side_effect=SMTPDataError(451, b'Try again later')):
+            with self.assertRaises(SMTPDataError):
+                flush_notifications(self.email)
+        self.assertTrue(PendingNotification.objects.filter(recipient=self.email).exists())
+
+        refused = SMTPRecipientsRefused({self.email: (550, b'No such user')})
+        with mock.patch('tasks_api.tasks.send_messages', side_effect=refused), \
+                self.assertLogs('tasks_api.tasks', 'ERROR'):
+            flush_notifications(self.email)
+        self.assertFalse(PendingNotification.objects.filter(recipient=self.email).exists())
+
+    def test_coalescing_requires_shared_cache(self):
+
+        from .checks import check_notification_cache
+
+        local_cache = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared_cache = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+
+        with override_settings(NOTIFICATION_COALESCE_WINDOW=60, CACHES=local_cache):
+            self.assertEqual([error.id for error in check_notification_cache(None)], ['tasks_api.E001'])
+        with override_settings(NOTIFICATION_COALESCE_WINDOW=0, CACHES=local_cache):
+            self.assertEqual(check_notification_cache(None), [])
+        with override_settings(NOTIFICATION_COALESCE_WINDOW=60, CACHES=shared_cache):
+            self.assertEqual(check_notification_cache(None), [])
+
+
+class LookupCacheTestCase(AuthenticatedApiTestCase):
+
+    def test_serializer_resolves_lookups_without_queries(self):
+
+        from .serializers import TaskSerializer
+
+        data = {
+            'title': 'Cached lookups',
+            'description': 'Status and priority come from memory.',
+            'board_id': 1,
+            'priority': 2,
+            'due_to': '2024-12-24',
+            'status': 'to_do',
+        }
+        TaskSerializer(data=data).is_valid(raise_exception=True)
+
+        with CaptureQueriesContext(connection) as context:
+            serializer = TaskSerializer(data=data)
+            serializer.is_valid(raise_exception=True)
+
+        queried_tables = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('tasks_api_status', queried_tables)
+        self.assertNotIn('tasks_api_priority', queried_tables)
+        self.assertEqual(serializer.validated_data['status'].status, 'to_do')
+        self.assertEqual(serializer.validated_data['priority'].priority, 'ordinary')
+
+        self.assertFalse(TaskSerializer(data=dict(data, priority=99)).is_valid())
+
+    def test_lookup_invalidated_on_change(self):
+
+        from .lookups import tags
+
+        self.assertIsNone(tags.get_by_slug('release'))
+        Tag.objects.create(tag='release')
+        self.assertIsNotNone(tags.get_by_slug('release'))
+
+    def test_board_tasks_filter_uses_lookups(self):
+
+        response = self.client.get(
+            reverse('tasks_api:board_tasks', kwargs={'pk': 1}) + '?status=1&priority=1',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 3)
+
+        response = self.client.get(
+            reverse('tasks_api:board_tasks', kwargs={'pk': 1}) + '?status=99',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_schema_lists_lookup_choices(self):
+
+        response = self.client.get(reverse('tasks_api:schema-json', kwargs={'format': '.json'}))
+        self.assertEqual(response.status_code, 200)
+
+        parameters = response.json()['paths']['/board/{id}/tasks/']['get']['parameters']
+        status_parameter = next(p for p in parameters if p['name'] == 'status')
+        self.assertEqual(status_parameter['enum'], list(Status.objects.values_list('pk', flat=True)))
+
+
+class ResponseCacheTestCase(AuthenticatedApiTestCase):
+
+    def test_task_etag_and_invalidation(self):
+
+        url = reverse('tasks_api:task', kwargs={'pk': 1})
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'), 'ETag должен быть сильным.')
+
+        not_modified = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.get(pk=1)
+            task.title = 'Changed title'
+            task.save()
+
+        changed = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(changed.json()['title'], 'Changed title')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.get(pk=1).tags.remove(1)
+
+        self.assertNotIn('backend', self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token).json()['tags'])
+
+    def test_board_etag(self):
+
+        url = reverse('tasks_api:board', kwargs={'pk': 1})
+        etag = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                url,
+                data={'title': 'New board title'},
+                content_type='application/json',
+                HTTP_AUTHORIZATION='Bearer %s' % self.token,
+            )
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'New board title')
+
+    def test_version_of_missing_object_expires(self):
+
+        import time
+
+        response = self.client.get(reverse('tasks_api:task', kwargs={'pk': 999}), HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        self.assertEqual(response.status_code, 404)
+
+        version_key = response_cache.version_key(Task, 999)
+        self.assertIsNotNone(cache.get(version_key))
+
+        expired = time.time() + response_cache.version_timeout + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=expired):
+            self.assertIsNone(cache.get(version_key))
+
+
+class DailyDigestTestCase(TestCase):
+
+    fixtures = ['test_data.json']
+
+    @override_settings(DAILY_DIGEST_BATCH_SIZE=3, DAILY_DIGEST_MAX_TASKS=2)
+    def test_one_digest_per_recipient(self):
+
+        from .tasks import send_daily_digest_batch, send_daily_project_notification
+
+        Task.objects.filter(pk=4).update(status=Status.objects.get(status='done'))
+
+        with mock.patch.object(send_daily_digest_batch, 'delay', side_effect=send_daily_digest_batch) as delay:
+            send_daily_project_notification()
+
+        self.assertEqual(delay.call_count, 2, 'Письма должны отправляться пачками.')
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['user1@example.com', 'user2@example.com', 'user3@example.com', 'user4@example.com'],
+        )
+
+        digest = next(message for message in mail.outbox if message.to == ['user1@example.com'])
+        self.assertEqual(digest.subject, 'Notification! You have 3 overdue tasks')
+        html = digest.alternatives[0][0]
+        self.assertIn('Design landing page', html)
+        self.assertIn('And 1 more.', html)
+        self.assertNotIn('Refactor CSS code', ''.join(message.alternatives[0][0] for message in mail.outbox))
+
+
+class MailConnectionPoolTestCase(TestCase):
+
+    def setUp(self):
+        from .management.fake_smtp import FakeSMTPServer
+
+        self.server = FakeSMTPServer().start()
+        self.addCleanup(self.server.stop)
+
+        smtp_settings = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.server.port,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+            EMAIL_USE_TLS=False,
+            MAIL_HEALTHCHECK_INTERVAL=0,
+        )
+        smtp_settings.enable()
+        self.addCleanup(smtp_settings.disable)
+
+    def test_connection_is_reused_and_restored(self):
+
+        from .mail import ConnectionPool, build_message
+
+        pool = ConnectionPool()
+        self.addCleanup(pool.close)
+
+        message = build_message('Subject', '<p>Body</p>', ['user1@example.com'])
+        pool.send_messages([message, message])
+        pool.send_messages([message])
+
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertEqual(self.server.connections, 1, 'Соединение должно переиспользоваться между задачами.')
+
+        self.server.drop_connections()
+        pool.send_messages([message])
+
+        self.assertEqual(len(self.server.messages), 4)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_refused_recipient_is_not_resent(self):
+
+        from smtplib import SMTPRecipientsRefused
+        from .mail import ConnectionPool, build_message
+
+        pool = ConnectionPool()
+        self.addCleanup(pool.close)
+        self.server.rejected_recipients.add('nobody@example.com')
+
+        with self.assertRaises(SMTPRecipientsRefused):
+            pool.send_messages([build_message('Subject', '<p>Body</p>', ['nobody@example.com'])])
+        self.assertEqual(self.server.connections, 1, 'Отказ сервера не должен приводить к переподключению.')
+
+        pool.send_messages([build_message('Subject', '<p>Body</p>', ['user1@example.com'])])
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertEqual(self.server.connections, 1)
+
+
+class TaskHistoryArchiveTestCase(TestCase):
+
+    fixtures = ['test_data.json']
+
+    def test_old_history_is_archived(self):
+
+        import gzip
+        import json
+
+        from .history import maintain_history
+
+        task = Task.objects.get(pk=1)
+        old = TaskHistory.objects.create(task=task, previous_status='to_do', current_status='in_progress')
+        recent = TaskHistory.objects.create(task=task, previous_status='in_progress', current_status='done')
+        TaskHistory.objects.filter(pk=old.pk).update(timestamp='2020-05-10T12:00:00+00:00')
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(TASK_HISTORY_ARCHIVE_DIR=directory):
+            created, archived = maintain_history(retention_months=12)
+
+            self.assertEqual(archived, {'2020-05': 1})
+            with gzip.open('%s/taskhistory-2020-05.ndjson.gz' % directory, 'rt') as archive:
+                records = [json.loads(line) for line in archive]
+
+        self.assertEqual(records[0]['id'], old.pk)
+        self.assertEqual(records[0]['current_status'], 'in_progress')
+        self.assertEqual(list(TaskHistory.objects.values_list('pk', flat=True)), [recent.pk])
+
+    def test_rolled_back_archive_is_not_duplicated(self):
+
+        import gzip
+
+        from django.db import DatabaseError
+        from django.db.models import QuerySet
+
+        from .history import maintain_history
+
+        task = Task.objects.get(pk=1)
+        old = TaskHistory.objects.create(task=task, previous_status='to_do', current_status='in_progress')
+        TaskHistory.objects.filter(pk=old.pk).update(timestamp='2020-05-10T12:00:00+00:00')
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(TASK_HISTORY_ARCHIVE_DIR=directory):
+            # Архив записан, а удаление строк откатилось.
+            with mock.patch.object(QuerySet, 'delete', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+                maintain_history(retention_months=12)
+            self.assertTrue(TaskHistory.objects.filter(pk=old.pk).exists())
+
+            created, archived = maintain_history(retention_months=12)
+
+            with gzip.open('%s/taskhistory-2020-05.ndjson.gz' % directory, 'rt') as archive:
+                records = [json.loads(line) for line in archive]
+
+        self.assertEqual(archived, {})
+        self.assertEqual([record['id'] for record in records], [old.pk])
+        self.assertFalse(TaskHistory.objects.filter(pk=old.pk).exists())
+
+    def test_replaced_archive_is_written_whole(self):
+
+        import gzip
+
+        from .history import write_archive
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'archive.ndjson.gz')
+            with open(path + '.tmp', 'wb') as leftover:
+                leftover.write(b'interrupted')
+
+            write_archive(path, [(1, 1, None, None, 'to_do', 'in_progress')])
+            write_archive(path, [(2, 1, None, None, 'in_progress', 'done')])
+
+            with gzip.open(path, 'rt') as archive:
+                records = [json.loads(line) for line in archive]
+            self.assertEqual(os.listdir(directory), ['archive.ndjson.gz'])
+
+        self.assertEqual([record['id'] for record in records], [2])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Партиционирование есть только в PostgreSQL.')
+    def test_archived_partition_is_only_dropped(self):
+
+        import gzip
+
+        from .history import PostgresHistoryStorage
+
+        task = Task.objects.get(pk=1)
+        old = TaskHistory.objects.create(task=task, previous_status='to_do', current_status='in_progress')
+        TaskHistory.objects.filter(pk=old.pk).update(timestamp='2020-05-10T12:00:00+00:00')
+
+        storage = PostgresHistoryStorage()
+        storage.convert()
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(TASK_HISTORY_ARCHIVE_DIR=directory):
+            # Архив записан прерванным запуском, партиция осталась.
+            path = storage.archive_path(storage.partition_name(datetime.date(2020, 5, 1)))
+            with gzip.open(path, 'wt') as archive:
+                archive.write('{"id": %s}\n' % old.pk)
+
+            archived = storage.archive(datetime.datetime(2020, 6, 1, tzinfo=datetime.timezone.utc))
+
+            with gzip.open(path, 'rt') as archive:
+                lines = archive.readlines()
+
+        self.assertEqual(archived, {})
+        self.assertEqual(len(lines), 1)
+        self.assertFalse(TaskHistory.objects.filter(pk=old.pk).exists())
+
+
+class BoardStatusCounterTestCase(AuthenticatedApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Фикстуры загружаются в обход Task.save().
+        BoardStatusCounter.objects.reconcile()
+
+    def get_counters(self, board_id=1):
+        return self.client.get(
+            reverse('tasks_api:board', kwargs={'pk': board_id}),
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        ).json()['status_counters']
+
+    @mock.patch('tasks_api.notifications.send_bulk_email_notifications')
+    def test_counters_follow_task_changes(self, send_notifications):
+
+        self.assertEqual(self.get_counters(), {'to_do': 3, 'in_progress': 0, 'done': 0})
+
+        task = Task.objects.get(pk=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            task.status = Status.objects.get(status='in_progress')
+            task.save()
+        self.assertEqual(self.get_counters(), {'to_do': 2, 'in_progress': 1, 'done': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                reverse('tasks_api:bulk_task_status'),
+                data=[{'id': 3, 'status': 'in_progress'}, {'id': 1, 'status': 'done'}],
+                content_type='application/json',
+                HTTP_AUTHORIZATION='Bearer %s' % self.token,
+            )
+        # Пользователь не участник задач: статусы не изменились.
+        self.assertEqual(self.get_counters(), {'to_do': 2, 'in_progress': 1, 'done': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.get(pk=5).delete()
+        self.assertEqual(self.get_counters(), {'to_do': 1, 'in_progress': 1, 'done': 0})
+
+    def test_stale_instances_are_counted_from_stored_row(self):
+
+        statuses = dict(Status.objects.values_list('status', 'pk'))
+        first, second, third = (Task.objects.get(pk=1) for _ in range(3))
+
+        first.status_id = statuses['in_progress']
+        first.save()
+        # Снимок second устарел: задача уже в in_progress, а не в to_do.
+        second.status_id = statuses['done']
+        second.save()
+        self.assertEqual(second.previous_status_id, statuses['in_progress'])
+
+        # Устаревший статус third не записывается и не меняет счетчики.
+        third.title = 'Renamed task'
+        third.save()
+
+        self.assertEqual(Task.objects.get(pk=1).status_id, statuses['done'])
+        counts = BoardStatusCounter.objects.get_counts(1)
+        self.assertEqual(
+            [counts.get(statuses[name], 0) for name in ('to_do', 'in_progress', 'done')],
+            [2, 0, 1],
+        )
+        self.assertEqual(
+            list(TaskHistory.objects.filter(task_id=1).order_by('id').values_list('previous_status', 'current_status')),
+            [('to_do', 'in_progress'), ('in_progress', 'done')],
+        )
+
+    def test_reconcile_repairs_drift(self):
+
+        BoardStatusCounter.objects.filter(board_id=1).update(count=42)
+        BoardStatusCounter.objects.filter(board_id=2).delete()
+
+        self.assertEqual(BoardStatusCounter.objects.reconcile(), 2)
+        self.assertEqual(BoardStatusCounter.objects.get_counts(1), {1: 3})
+        self.assertEqual(BoardStatusCounter.objects.get_counts(2), {1: 2})
+
+
+class BoardTasksExportTestCase(AuthenticatedApiTestCase):
+
+    def export(self, query=''):
+        response = self.client.get(
+            reverse('tasks_api:board_tasks_export', kwargs={'pk': 1}) + query,
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+
+        import json
+
+        Task.objects.filter(pk=3).update(status_id=2)
+
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual(sorted(row['id'] for row in rows), [1, 3, 5])
+        self.assertEqual(sorted(next(row for row in rows if row['id'] == 1)['participants']), ['user2', 'user3', 'user4'])
+
+        rows = [json.loads(line) for line in self.export('?status=2').splitlines()]
+        self.assertEqual([row['id'] for row in rows], [3])
+        self.assertEqual(rows[0]['status'], 'in_progress')
+
+    def test_export_csv(self):
+
+        import csv
+        import io
+
+        rows = list(csv.DictReader(io.StringIO(self.export('?output=csv'))))
+        self.assertEqual(sorted(int(row['id']) for row in rows), [1, 3, 5])
+        self.assertEqual(rows[0]['status'], 'to_do')
+
+        response = self.client.get(
+            reverse('tasks_api:board_tasks_export', kwargs={'pk': 1}) + '?output=xml',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_is_described_in_schema(self):
+
+        with self.assertNoLogs('drf_yasg', 'WARNING'):
+            response = self.client.get(reverse('tasks_api:schema-json', kwargs={'format': '.json'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/board/{id}/tasks/export/', response.json()['paths'])
+
+
+class BoardTasksSearchTestCase(AuthenticatedApiTestCase):
+
+    def search(self, url):
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def create_task(self, title, description, board_id=1):
+        return Task.objects.create(
+            board_id_id=board_id,
+            title=title,
+            description=description,
+            priority_id=1,
+            status_id=1,
+            due_to='2024-12-24',
+        )
+
+    def test_repeated_install_keeps_index(self):
+
+        from .search import install_search_index
+
+        task = self.create_task('Quarterly report', 'Numbers for the board.')
+
+        with CaptureQueriesContext(connection) as context:
+            install_search_index(None)
+        self.assertFalse(
+            [query['sql'] for query in context.captured_queries if 'rebuild' in query['sql'] or query['sql'].startswith('UPDATE')],
+            'Повторная миграция не должна перестраивать индекс.',
+        )
+
+        url = reverse('tasks_api:board_tasks_search', kwargs={'pk': 1})
+        self.assertEqual([row['id'] for row in self.search(url + '?q=quarterly')['results']], [task.pk])
+
+    def test_search_is_ranked_and_scoped_to_board(self):
+
+        in_description = self.create_task('Weekly sync', 'Prepare the quarterly report.')
+        in_title = self.create_task('Quarterly report', 'Numbers for the board.')
+        self.create_task('Quarterly report', 'Other board.', board_id=2)
+
+        url = reverse('tasks_api:board_tasks_search', kwargs={'pk': 1})
+        body = self.search(url + '?q=quarterly report')
+        self.assertEqual([task['id'] for task in body['results']], [in_title.pk, in_description.pk])
+
+        # Индекс следует за изменениями задач.
+        task = Task.objects.get(pk=1)
+        task.title = 'Quarterly homework'
+        task.save()
+        in_title.delete()
+        body = self.search(url + '?q=quarterly')
+        self.assertEqual({task['id'] for task in body['results']}, {1, in_description.pk})
+
+        response = self.client.get(url + '?q=%20', HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_cursor_pagination(self):
+
+        created = {self.create_task('Release %s' % i, 'Release checklist.').pk for i in range(12)}
+
+        url = reverse('tasks_api:board_tasks_search', kwargs={'pk': 1}) + '?q=release'
+        seen = []
+        while url:
+            body = self.search(url)
+            seen.extend(task['id'] for task in body['results'])
+            url = body['next']
+
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), created)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Ранг ts_rank_cd есть только в PostgreSQL.')
+    def test_search_cursor_pagination_with_equal_ranks(self):
+
+        # Совпадение только в описании (вес B): ранг 0.4 не представим точно во float.
+        created = {self.create_task('Task %s' % i, 'Rollout plan.').pk for i in range(15)}
+
+        url = reverse('tasks_api:board_tasks_search', kwargs={'pk': 1}) + '?q=rollout'
+        pages = []
+        while url:
+            body = self.search(url)
+            pages.append([task['id'] for task in body['results']])
+            url = body['next']
+
+        seen = [task_id for page in pages for task_id in page]
+        self.assertGreater(len(pages), 1)
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), created)
+        self.assertEqual(seen, sorted(seen, reverse=True), 'Строки с равным рангом упорядочиваются по id.')
+
+
+class SparseFieldsTestCase(AuthenticatedApiTestCase):
+
+    def test_board_tasks_fields(self):
+
+        url = reverse('tasks_api:board_tasks', kwargs={'pk': 1}) + '?fields=id,title,status'
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title', 'status'})
+
+        tasks_sql = next(query['sql'] for query in context.captured_queries if 'FROM "tasks_api_task"' in query['sql'] and 'COUNT' not in query['sql'])
+        self.assertNotIn('"description"', tasks_sql)
+        self.assertFalse(
+            any('tasks_api_task_participants' in query['sql'] for query in context.captured_queries),
+            'Участники не запрошены и не должны загружаться.',
+        )
+
+        response = self.client.get(url + ',unknown', HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        self.assertEqual(response.status_code, 400)
+
+    def test_task_and_board_fields(self):
+
+        task_url = reverse('tasks_api:task', kwargs={'pk': 1})
+        full = self.client.get(task_url, HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        sparse = self.client.get(task_url + '?fields=title', HTTP_AUTHORIZATION='Bearer %s' % self.token)
+
+        self.assertEqual(sparse.json(), {'title': 'Do homework!'})
+        self.assertIn('description', full.json())
+        self.assertNotEqual(full['ETag'], sparse['ETag'])
+
+        board = self.client.get(
+            reverse('tasks_api:board', kwargs={'pk': 1}) + '?fields=title',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+        self.assertEqual(board.json(), {'title': 'Development backend.'})
+
+
+class TaskRowSerializerTestCase(TestCase):
+
+    fixtures = ['test_data.json']
+
+    def test_rows_match_task_serializer(self):
+
+        from rest_framework.renderers import JSONRenderer
+
+        from .lookups import statuses
+        from .renderers import FastJSONRenderer
+        from .rows import TaskRowSerializer
+        from .serializers import TaskSerializer
+
+        Task.objects.filter(pk=1).update(attachment='media/01/01/2024/report.pdf', description='Line break «кавычки»')
+        queryset = Task.objects.with_related().order_by('-id')
+
+        expected = JSONRenderer().render(TaskSerializer(queryset, many=True).data)
+
+        serializer = TaskRowSerializer()
+        statuses.all()
+        with self.assertNumQueries(3):
+            rows = serializer.serialize(serializer.get_queryset(queryset))
+
+        self.assertEqual(FastJSONRenderer().render(rows), expected)
+        self.assertEqual(JSONRenderer().render(rows), expected)
+
+        sparse = TaskRowSerializer(['title', 'tags']).serialize(TaskRowSerializer(['title', 'tags']).get_queryset(queryset))
+        self.assertEqual(sparse, TaskSerializer(queryset, many=True, fields=['title', 'tags']).data)
+
+
+class AsyncApiViewTestCase(AuthenticatedApiTestCase):
+
+    def get(self, name, pk, query='', **headers):
+        return self.client.get(
+            reverse('tasks_api:%s' % name, kwargs={'pk': pk}) + query,
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+            **headers,
+        )
+
+    def test_async_views_match_sync_views(self):
+
+        for sync_name, async_name, query in (
+            ('board', 'async_board', ''),
+            ('task', 'async_task', ''),
+            ('task', 'async_task', '?fields=title,status'),
+            ('board_tasks', 'async_board_tasks', '?pagination=cursor&status=1'),
+        ):
+            cache.clear()
+            sync_response = self.get(sync_name, 1, query)
+            cache.clear()
+            async_response = self.get(async_name, 1, query)
+
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual(async_response.json(), sync_response.json(), async_name)
+            self.assertEqual(async_response.get('ETag'), sync_response.get('ETag'))
+
+        etag = self.get('async_task', 1)['ETag']
+        self.assertEqual(self.get('async_task', 1, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get('async_task', 999).status_code, 404)
+
+    def test_async_views_require_authentication(self):
+
+        response = self.client.get(reverse('tasks_api:async_task', kwargs={'pk': 1}))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'detail': 'Authentication credentials were not provided.'})
+
+        response = self.client.get(reverse('tasks_api:async_task', kwargs={'pk': 1}), HTTP_AUTHORIZATION='Bearer broken')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+
+        response = self.get('async_board_tasks', 1, '?status=42')
+        self.assertEqual(response.status_code, 400)
+
+
+class ClaimsAuthenticationTestCase(AuthenticatedApiTestCase):
+
+    def get_task(self, name='task'):
+        return self.client.get(reverse('tasks_api:%s' % name, kwargs={'pk': 1}), HTTP_AUTHORIZATION='Bearer %s' % self.token)
+
+    def test_user_changes_override_claims(self):
+
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        token = AccessToken(self.token)
+        self.assertEqual((token['username'], token['is_staff']), (self.username, False))
+
+        # Пользователь не участник задачи: изменить статус может только сотрудник.
+        url = reverse('tasks_api:task', kwargs={'pk': 1})
+        data = {'status': 'in_progress'}
+        response = self.client.put(url, data=data, content_type='application/json', HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        self.assertEqual(response.status_code, 403)
+
+        user = User.objects.get(username=self.username)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_staff = True
+            user.save()
+
+        with mock.patch('tasks_api.notifications.send_bulk_email_notifications'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(url, data=data, content_type='application/json', HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(TaskHistory.objects.filter(task_id=1, user=user).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+
+        self.assertEqual(self.get_task().status_code, 401)
+        self.assertEqual(self.get_task('async_task').status_code, 401)
+
+    def test_missing_state_is_read_from_database(self):
+
+        # Изменение в обход сигналов: кэш состояния пуст, утверждения токена устарели.
+        User.objects.filter(username=self.username).update(is_active=False)
+        cache.clear()
+
+        self.assertEqual(self.get_task().status_code, 401)
+        self.assertEqual(self.get_task('async_task').status_code, 401)
+
+        User.objects.filter(username=self.username).update(is_active=True, is_staff=True)
+        cache.clear()
+
+        response = self.get_task()
+        self.assertEqual(response.status_code, 200)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.get_task().status_code, 200)
+        self.assertNotIn('auth_user', ' '.join(query['sql'] for query in context.captured_queries))
+
+    def test_refresh_reads_claims_from_database(self):
+
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        tokens = self.client.post(
+            reverse('tasks_api:token_get'),
+            data={'username': self.username, 'password': self.password},
+            content_type='application/json',
+        ).json()
+
+        User.objects.filter(username=self.username).update(is_staff=True)
+        response = self.client.post(reverse('tasks_api:token_refresh'), data={'refresh': tokens['refresh']}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(AccessToken(response.json()['access'])['is_staff'])
+
+        User.objects.filter(username=self.username).update(is_active=False)
+        response = self.client.post(reverse('tasks_api:token_refresh'), data={'refresh': tokens['refresh']}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+
+class MembershipIndexTestCase(AuthenticatedApiTestCase):
+
+    def test_membership_follows_participants(self):
+
+        from .membership import membership
+
+        url = reverse('tasks_api:task', kwargs={'pk': 1})
+        data = {'status': 'in_progress'}
+
+        def put():
+            return self.client.put(url, data=data, content_type='application/json', HTTP_AUTHORIZATION='Bearer %s' % self.token)
+
+        self.assertEqual(membership.get_participant_ids(1), {2, 3, 4})
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(put().status_code, 403)
+        self.assertFalse(any('tasks_api_task_participants' in query['sql'] for query in context.captured_queries))
+
+        user = User.objects.get(username=self.username)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.task_set.add(1)
+        self.assertIn(user.pk, membership.get_participant_ids(1))
+
+        with mock.patch('tasks_api.notifications.send_bulk_email_notifications'), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(put().status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.get(pk=1).participants.remove(user)
+        self.assertEqual(membership.filter_member_tasks([1, 2, 3], user.pk), set())
+
+
+class AttachmentUploadTestCase(AuthenticatedApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        media = override_settings(MEDIA_ROOT=self.directory.name, ATTACHMENT_ACCEL_REDIRECT_PREFIX=None)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        user = User.objects.get(username=self.username)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.task_set.add(1, 3)
+
+    def upload(self, task_id, content, part_size):
+        auth = 'Bearer %s' % self.token
+        response = self.client.post(
+            reverse('tasks_api:attachment_uploads', kwargs={'pk': task_id}),
+            data={'filename': 'report.txt', 'size': len(content)},
+            content_type='application/json',
+            HTTP_AUTHORIZATION=auth,
+        )
+        self.assertEqual(response.status_code, 201)
+        url = response.json()['url']
+
+        for offset in range(0, len(content), part_size):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    url, data=content[offset:offset + part_size], content_type='application/offset+octet-stream',
+                    HTTP_AUTHORIZATION=auth, HTTP_UPLOAD_OFFSET=str(offset),
+                )
+            self.assertEqual(response.status_code, 200)
+
+        return url, response
+
+    def test_resumable_upload_is_deduplicated(self):
+
+        content = b'0123456789' * 100
+        url, response = self.upload(1, content, 300)
+        self.assertTrue(response.json()['completed'])
+
+        # Повторная отправка части после завершения - конфликт смещений.
+        response = self.client.patch(
+            url, data=b'x', content_type='application/offset+octet-stream',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token, HTTP_UPLOAD_OFFSET='0',
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], str(len(content)))
+
+        self.upload(3, content, 1000)
+
+        first, second = Task.objects.filter(pk__in=[1, 3]).order_by('id')
+        self.assertEqual(first.attachment.name, second.attachment.name)
+        self.assertEqual(first.attachment.read(), content)
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, 'uploads')), [])
+
+    def test_range_download(self):
+
+        content = bytes(range(256)) * 4
+        self.upload(1, content, 512)
+        url = reverse('tasks_api:task_attachment', kwargs={'pk': 1})
+        auth = 'Bearer %s' % self.token
+
+        response = self.client.get(url, HTTP_AUTHORIZATION=auth, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/1024')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(b''.join(response.streaming_content), content[100:200])
+
+        response = self.client.get(url, HTTP_AUTHORIZATION=auth, HTTP_RANGE='bytes=-24')
+        self.assertEqual(b''.join(response.streaming_content), content[-24:])
+
+        response = self.client.get(url, HTTP_AUTHORIZATION=auth, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get(url, HTTP_AUTHORIZATION=auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('report.txt', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content), content)
+
+        with override_settings(ATTACHMENT_ACCEL_REDIRECT_PREFIX='/protected/'):
+            response = self.client.get(url, HTTP_AUTHORIZATION=auth)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/%s' % Task.objects.get(pk=1).attachment.name)
+
+    def test_failed_completion_keeps_uploaded_file(self):
+
+        from django.db import DatabaseError
+
+        content = b'0123456789' * 10
+        with mock.patch.object(Task, 'save', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            self.upload(1, content, 100)
+
+        upload = AttachmentUpload.objects.get(task_id=1)
+        self.assertIsNone(upload.completed_at)
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, 'uploads')), ['%s.part' % upload.pk])
+
+    def test_attachment_is_stored_before_commit(self):
+
+        from .attachments import append_chunk, create_upload
+
+        content = b'0123456789' * 10
+        upload = create_upload(Task.objects.get(pk=1), User.objects.get(username=self.username), 'report.txt', len(content))
+
+        # Обработчики on_commit не выполняются: задача уже ссылается на файл, и он на месте.
+        with self.captureOnCommitCallbacks(execute=False):
+            append_chunk(upload.pk, 0, io.BytesIO(content), len(content))
+
+        response = self.client.get(reverse('tasks_api:task_attachment', kwargs={'pk': 1}), HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), content)
+
+    def test_legacy_attachment_etag_follows_content(self):
+
+        name = 'media/01/01/2024/report.txt'
+        path = os.path.join(self.directory.name, name)
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as file:
+            file.write(b'first version')
+        Task.objects.filter(pk=1).update(attachment=name)
+
+        url = reverse('tasks_api:task_attachment', kwargs={'pk': 1})
+        etag = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token)['ETag']
+        self.assertNotIn('report.txt', etag)
+
+        with open(path, 'wb') as file:
+            file.write(b'second, longer version')
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token, HTTP_RANGE='bytes=0-5', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 200, 'Диапазон по устаревшему ETag не отдается.')
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CeleryQueuesTestCase(TestCase):
+
+    def test_tasks_are_routed_by_queue_and_priority(self):
+
+        from tmanager.celery import app
+
+        routes = {
+            'tasks_api.tasks.flush_notifications': ('notifications', 0),
+            'tasks_api.tasks.send_daily_digest_batch': ('digest', 5),
+            'maintain_task_history': ('maintenance', None),
+        }
+        for name, (queue, priority) in routes.items():
+            options = app.amqp.router.route({}, name, (), {})
+            self.assertEqual(options['queue'].name, queue)
+            self.assertEqual(options.get('priority'), priority)
+
+    def test_metrics_endpoint(self):
+
+        from .tasks import send_daily_digest_batch
+
+        send_daily_digest_batch.apply(args=[[]])
+
+        with mock.patch('tasks_api.metrics.get_queue_depths', return_value={'digest': 3, 'notifications': 0}):
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+
+        body = response.content.decode()
+        self.assertIn('tasks_manager_celery_queue_depth{queue="digest"} 3.0', body)
+        self.assertIn('tasks_manager_celery_broker_up 1.0', body)
+        self.assertIn('tasks_manager_celery_task_runtime_seconds_count{queue="digest",task="tasks_api.tasks.send_daily_digest_batch"}', body)
+
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 404)
+
+
+class MetricsMiddlewareTestCase(AuthenticatedApiTestCase):
+
+    @staticmethod
+    def sample_value(metric, name, labels):
+        for family in metric.collect():
+            for sample in family.samples:
+                if sample.name == name and sample.labels == labels:
+                    return sample.value
+        return 0
+
+    def test_requests_are_measured_by_url_name(self):
+
+        from .metrics import HTTP_DB_QUERIES, HTTP_REQUESTS
+
+        labels = {'view': 'tasks_api:task', 'method': 'GET'}
+        requests_before = self.sample_value(HTTP_REQUESTS, 'tasks_manager_http_requests_total', dict(labels, status='200'))
+        queries_before = self.sample_value(HTTP_DB_QUERIES, 'tasks_manager_http_db_queries_sum', labels)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('tasks_api:task', kwargs={'pk': 1}), HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.sample_value(HTTP_REQUESTS, 'tasks_manager_http_requests_total', dict(labels, status='200')), requests_before + 1)
+        self.assertEqual(self.sample_value(HTTP_DB_QUERIES, 'tasks_manager_http_db_queries_sum', labels), queries_before + len(context))
+
+        with mock.patch('tasks_api.metrics.get_queue_depths', return_value={}):
+            body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('tasks_manager_http_request_duration_seconds_count{method="GET",view="tasks_api:task"}', body)
+        self.assertIn('tasks_manager_http_response_size_bytes_count{method="GET",view="tasks_api:task"}', body)
+
+    def test_nested_tracking_counts_in_outer_block(self):
+
+        from .metrics import track_queries
+
+        with track_queries() as outer:
+            response = self.client.get(reverse('tasks_api:board', kwargs={'pk': 1}), HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(outer.count, 0)
+
+
+
+class SQLProfilingTestCase(AuthenticatedApiTestCase):
+
+    @override_settings(SQL_PROFILING_REPEATED_THRESHOLD=3, SQL_SLOW_QUERY_MS=0)
+    def test_repeated_and_slow_queries_are_logged(self):
+
+        from .profiling import profile_queries
+
+        with self.assertLogs('tasks_api.profiling', 'WARNING') as logs, profile_queries('test') as profile:
+            boards = [task.board_id.title for task in Task.objects.order_by('id')]
+
+        self.assertEqual(len(profile.queries), len(boards) + 1)
+        repeated = [message for message in logs.output if 'possible N+1' in message]
+        self.assertEqual(len(repeated), 1)
+        self.assertIn('%s queries' % len(boards), repeated[0])
+        self.assertIn('tests.py', repeated[0])
+        self.assertTrue(any('slow query' in message and 'tasks_api_board' in message for message in logs.output))
+
+    @override_settings(SQL_PROFILING_TOKEN='secret')
+    def test_profiling_is_requested_with_header(self):
+
+        url = reverse('tasks_api:task', kwargs={'pk': 1})
+        auth = 'Bearer %s' % self.token
+
+        response = self.client.get(url, HTTP_AUTHORIZATION=auth, HTTP_X_PROFILE_SQL='wrong')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+        with self.assertLogs('tasks_api.profiling', 'INFO'):
+            response = self.client.get(url, HTTP_AUTHORIZATION=auth, HTTP_X_PROFILE_SQL='secret')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries"$')
+
+
+class SeedDataTestCase(TestCase):
+
+    def test_small_dataset_is_seeded(self):
+
+        from django.core.management import call_command
+        from io import StringIO
+
+        call_command(
+            'seed_data', boards=2, tasks=30, users=5, history=20, days=10, batch_size=7, stdout=StringIO(),
+        )
+
+        tasks = Task.objects.filter(board_id__title__startswith='seed board')
+        self.assertEqual(tasks.count(), 30)
+        self.assertEqual(Task.participants.through.objects.filter(task__in=tasks).count(), 90)
+        self.assertEqual(TaskHistory.objects.filter(task__in=tasks).count(), 20)
+        self.assertEqual(
+            sum(BoardStatusCounter.objects.filter(board__title__startswith='seed board').values_list('count', flat=True)),
+            30,
+        )
+
+
+class TaskImportTestCase(AuthenticatedApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        media = override_settings(MEDIA_ROOT=self.directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    @staticmethod
+    def make_csv(count, board_id=1):
+        lines = ['board_id,title,description,status,priority,participants,tags,due_to']
+        for i in range(count):
+            lines.append('%s,Imported %s,"Line one\nline two",to_do,urgently,user2;user3,backend;testing,2030-01-01' % (board_id, i))
+        return ('\n'.join(lines) + '\n').encode()
+
+    def test_file_is_imported_in_background(self):
+
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .tasks import import_tasks
+
+        rows = [
+            {'board_id': 1, 'title': 'Imported', 'description': 'From NDJSON', 'status': 'in_progress',
+             'priority': 2, 'participants': ['user2', 3], 'tags': ['deploy'], 'due_to': '2030-01-01'},
+            {'board_id': 99, 'title': '', 'description': 'x', 'status': 'lost', 'priority': 'urgently',
+             'participants': ['nobody'], 'tags': [], 'due_to': '2030-01-01'},
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+        counters = BoardStatusCounter.objects.filter(board_id=1, status__status='in_progress').values_list('count', flat=True)
+        counter = counters.first() or 0
+        auth = 'Bearer %s' % self.token
+
+        with mock.patch.object(import_tasks, 'delay', side_effect=import_tasks) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse('tasks_api:task_imports'),
+                    data={'file': SimpleUploadedFile('tasks.ndjson', content.encode())},
+                    HTTP_AUTHORIZATION=auth,
+                )
+        self.assertEqual(response.status_code, 202)
+        delay.assert_called_once()
+
+        response = self.client.get(response.json()['url'], HTTP_AUTHORIZATION=auth)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result['state'], result['processed'], result['created'], result['failed']), ('done', 3, 1, 2))
+        self.assertEqual([error['line'] for error in result['errors']], [2, 3])
+        self.assertEqual(
+            set(result['errors'][0]['errors']), {'board_id', 'title', 'status', 'participants'},
+        )
+
+        task = Task.objects.get(title='Imported')
+        self.assertEqual(sorted(task.participants.values_list('username', flat=True)), ['user2', 'user3'])
+        self.assertEqual([str(tag) for tag in task.tags.all()], ['deploy'])
+        self.assertEqual(counters.first(), counter + 1)
+
+        other = User.objects.create_user('other_user', password='other_password')
+        self.client.force_login(other)
+        other_token = self.client.post(
+            reverse('tasks_api:token_get'),
+            data={'username': 'other_user', 'password': 'other_password'},
+            content_type='application/json',
+        ).json()['access']
+        response = self.client.get(reverse('tasks_api:task_import', kwargs={'pk': result['id']}), HTTP_AUTHORIZATION='Bearer %s' % other_token)
+        self.assertEqual(response.status_code, 404)
+
+    def test_import_accepts_only_multipart(self):
+
+        response = self.client.post(
+            reverse('tasks_api:task_imports'),
+            data={'file': 'tasks.csv'},
+            content_type='application/json',
+            HTTP_AUTHORIZATION='Bearer %s' % self.token,
+        )
+        self.assertEqual(response.status_code, 415)
+
+    def test_queries_do_not_depend_on_rows(self):
+
+        from .imports import IMPORT_READERS, TaskImporter
+
+        def run(count):
+            with CaptureQueriesContext(connection) as context:
+                importer = TaskImporter(batch_size=1000).run(IMPORT_READERS['csv'](io.BytesIO(self.make_csv(count))))
+            self.assertEqual((importer.created, importer.failed), (count, 0))
+            return len(context)
+
+        # Первый прогон загружает кэши справочников.
+        run(1)
+        self.assertEqual(run(5), run(50))
+        task = Task.objects.filter(title='Imported 0').last()
+        self.assertEqual(task.description, 'Line one\nline two')
+        self.assertEqual(sorted(task.participants.values_list('username', flat=True)), ['user2', 'user3'])
+
+    def test_command_imports_to_board(self):
+
+        from django.core.management import call_command
+
+        path = os.path.join(self.directory.name, 'tasks.csv')
+        with open(path, 'wb') as file:
+            file.write(self.make_csv(3, board_id=99))
+
+        output = io.StringIO()
+        call_command('import_tasks', path, board=2, batch_size=2, stdout=output)
+
+        self.assertIn('Imported 3 of 3 rows', output.getvalue())
+        self.assertEqual(Task.objects.filter(board_id=2, title__startswith='Imported').count(), 3)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Plans are checked in SQLite EXPLAIN QUERY PLAN format.')
+class QueryPlanTestCase(AuthenticatedApiTestCase):
+
+    def get_task_plans(self, url):
+        """
+        Returns EXPLAIN output of task table queries an endpoint runs.
+        """
+        from .profiling import explain, profile_queries
+
+        with profile_queries('plan', report=False) as profile:
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer %s' % self.token)
+        self.assertEqual(response.status_code, 200)
+
+        return [explain(query) for query in profile.queries if 'FROM "tasks_api_task"' in query.sql and 'ORDER BY' in query.sql]
+
+    def assertUsesIndex(self, plan, index):
+        self.assertIn('USING INDEX %s' % index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('tasks_api_board', plan)
+
+    def test_board_tasks_are_read_in_index_order(self):
+
+        url = reverse('tasks_api:board_tasks', kwargs={'pk': 1})
+        cases = [
+            ('', 'task_board_idx'),
+            ('?pagination=cursor', 'task_board_idx'),
+            ('?status=1&start=2020-01-01', 'task_board_status_idx'),
+            ('?priority=1', 'task_board_prio_idx'),
+        ]
+        for query, index in cases:
+            with self.subTest(query=query):
+                plans = self.get_task_plans(url + query)
+                self.assertTrue(plans)
+                for plan in plans:
+                    self.assertUsesIndex(plan, index)
+
+    def test_default_ordering_needs_no_sort(self):
+
+        plan = Task.objects.all()[:10].explain()
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('tasks_api_board', plan)
+
+    def test_digest_finds_open_tasks_by_index(self):
+
+        import datetime
+        from .tasks import get_digest_rows
+
+        plan = get_digest_rows(datetime.date(2030, 1, 1)).explain()
+        self.assertIn('USING INDEX task_status_due_to_idx', plan)
+        self.assertNotIn('tasks_api_status', plan)
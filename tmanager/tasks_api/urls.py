@@ -3,6 +3,7 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from .async_views import *
 from .views import *
 
 app_name = 'tasks_api'
@@ -27,11 +28,32 @@ urlpatterns = [
     path('board/<int:pk>/', RetrieveUpdateDestroyBoardApiView.as_view(), name='board'),
     path('task/<int:pk>/', RetrieveUpdateDestroyTaskApiView.as_view(), name='task'),
     path('board/<int:pk>/tasks/', BoardTasksApiView.as_view(), name='board_tasks'),
+    path('board/<int:pk>/tasks/search/', BoardTasksSearchApiView.as_view(), name='board_tasks_search'),
+    path('board/<int:pk>/tasks/export/', BoardTasksExportApiView.as_view(), name='board_tasks_export'),
+    path('task/<int:pk>/attachment/', TaskAttachmentApiView.as_view(), name='task_attachment'),
+
+    # Async GET methods (ASGI)
+    path('async/board/<int:pk>/', AsyncBoardApiView.as_view(), name='async_board'),
+    path('async/task/<int:pk>/', AsyncTaskApiView.as_view(), name='async_task'),
+    path('async/board/<int:pk>/tasks/', AsyncBoardTasksApiView.as_view(), name='async_board_tasks'),
 
     # POST methods
     path('board/create/', CreateBoardApiView.as_view(), name='create_board'),
     path('task/create/', CreateTaskApiView.as_view(), name='create_task'),
     path('register/', UserRegistrationApiView.as_view(), name='user-register'),
+    path('task/<int:pk>/attachment/uploads/', AttachmentUploadCreateApiView.as_view(), name='attachment_uploads'),
+
+    # PATCH methods (resumable uploads)
+    path('attachment/uploads/<uuid:pk>/', AttachmentUploadApiView.as_view(), name='attachment_upload'),
+
+    # BULK methods
+    path('task/bulk/create/', BulkCreateTaskApiView.as_view(), name='bulk_create_tasks'),
+    path('task/bulk/update/', BulkUpdateTaskApiView.as_view(), name='bulk_update_tasks'),
+    path('task/bulk/status/', BulkTaskStatusApiView.as_view(), name='bulk_task_status'),
+
+    # IMPORT (background)
+    path('task/imports/', TaskImportCreateApiView.as_view(), name='task_imports'),
+    path('task/imports/<uuid:pk>/', TaskImportApiView.as_view(), name='task_import'),
 
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
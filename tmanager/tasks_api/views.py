@@ -1,26 +1,50 @@
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import content_disposition_header
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.generics import ListAPIView, CreateAPIView, RetrieveUpdateDestroyAPIView, get_object_or_404
+from rest_framework.generics import GenericAPIView, ListAPIView, CreateAPIView, RetrieveUpdateDestroyAPIView, get_object_or_404
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework_simplejwt.authentication import JWTAuthentication
-
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.views import APIView
+
+from .attachments import *
+from .authentication import ClaimsJWTAuthentication
+from .bulk import bulk_create_tasks, bulk_update_tasks
+from .export import EXPORT_FORMATS, iter_task_rows
+from .filters import TaskFilterSet
+from .imports import IMPORT_READERS
+from .membership import membership
+from .mixins import SparseFieldsMixin, only_columns
 from .models import *
-from .pagination import ApiViewPaginator
+from .pagination import ApiViewPaginator, ApiViewCursorPaginator, SearchCursorPaginator
+from .response_cache import TASK_DEPENDENCIES, response_cache
+from .rows import TaskRowSerializer
+from .search import search_tasks
 from .serializers import *
-from .signals import update_task_history
+from .tasks import import_tasks
 
 
-class BaseRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
+class BaseRetrieveUpdateDestroyAPIView(SparseFieldsMixin, RetrieveUpdateDestroyAPIView):
 
     serializer_class = None
     model = None
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
+    cache_dependencies = ()
 
     def get_queryset(self):
-        return self.model.objects.all()
+        return self.only_requested_fields(self.model.objects.all())
 
     def get_object(self):
         queryset = self.get_queryset()
@@ -29,14 +53,27 @@ class BaseRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
 
     def get(self, request, *args, **kwargs):
         """
-        Get object by its unique identifier.
+        Get object by its unique identifier. Serialized object is cached until
+        the object changes; response carries ETag and If-None-Match is honored.
+        ?fields=a,b limits the response (and columns read) to the listed fields.
             :param request: HTTP GET request.
             :returns Response: REST API response.
             :raises NotFound: if object with pk has not been found.
         """
-        obj = self.get_object()
-        serializer = self.serializer_class(obj)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        fields = self.get_requested_fields()
+        entry = response_cache.get_or_set(
+            self.model,
+            self.kwargs.get(self.lookup_field),
+            lambda: self.serializer_class(self.get_object(), fields=fields).data,
+            dependencies=self.cache_dependencies,
+            salt=request.accepted_renderer.format,
+            variant=','.join(sorted(fields)) if fields is not None else '',
+        )
+
+        if response_cache.etag_matches(request, entry.etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entry.etag})
+
+        return Response(entry.data, status=status.HTTP_200_OK, headers={'ETag': entry.etag})
 
     def put(self, request, *args, **kwargs):
         """
@@ -97,6 +134,10 @@ class RetrieveUpdateDestroyBoardApiView(BaseRetrieveUpdateDestroyAPIView):
 class RetrieveUpdateDestroyTaskApiView(BaseRetrieveUpdateDestroyAPIView):
     model = Task
     serializer_class = TaskSerializer
+    cache_dependencies = TASK_DEPENDENCIES
+
+    def get_queryset(self):
+        return self.only_requested_fields(Task.objects.with_related(self.get_requested_fields()))
 
     def put(self, request, *args, **kwargs):
         """
@@ -105,12 +146,14 @@ class RetrieveUpdateDestroyTaskApiView(BaseRetrieveUpdateDestroyAPIView):
             :returns Response: REST API response.
             :raises Validation or Permission error.
         """
-        instance = self.get_object()
-        if instance.participants.filter(id=request.user.id).exists() or request.user.is_staff:
+        instance = get_object_or_404(Task.objects.select_related('status'), pk=self.kwargs.get(self.lookup_field))
+        # is_staff берется из токена, участники - из индекса членства без запроса к M2M таблице.
+        if request.user.is_staff or membership.is_participant(instance.pk, request.user.pk):
             serializer = self.serializer_class(instance, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
+            # Автор перехода попадает в историю через сигнал post_save.
+            instance._history_user = request.user
             serializer.save()
-            update_task_history(self.model, instance, False, user=request.user)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(
@@ -123,25 +166,26 @@ class CreateBoardApiView(BaseCreateApiView):
     model = Board
     serializer_class = BoardSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
 
 class CreateTaskApiView(BaseCreateApiView):
     model = Task
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
 
-class BoardTasksApiView(ListAPIView):
+class BoardTasksMixin(SparseFieldsMixin):
+    """
+    Board lookup and task filters (status, priority, start, end) shared by
+    board task listing, search and export.
+    """
 
-    model = Board
-    serializer_class = TaskSerializer
-    pagination_class = ApiViewPaginator
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['status', 'priority']
+    filterset_class = TaskFilterSet
 
     def get_queryset(self):
         return Task.objects.all()
@@ -152,15 +196,11 @@ class BoardTasksApiView(ListAPIView):
         obj = get_object_or_404(queryset, pk=pk)
         return obj
 
-    def get(self, request, *args, **kwargs):
-        """
-        Retrieves all task connected with specified board.
-            :param request: HTTP POST request.
-            :returns Response: REST API response.
-        """
-
-        instance = self.get_object()
-        queryset = instance.tasks.all()
+    def get_board_tasks(self, board, fields=None):
+        # Порядок по id совпадает с хвостом индексов task_board_*: сортировки нет.
+        queryset = board.tasks.with_related(fields).order_by('-id')
+        if fields is not None:
+            queryset = queryset.only(*only_columns(Task, fields))
         filtered_queryset = self.filter_queryset(queryset)
 
         start = self.request.query_params.get('start')
@@ -171,14 +211,415 @@ class BoardTasksApiView(ListAPIView):
         if end:
             filtered_queryset = filtered_queryset.filter(created_at__lte=end)
 
-        page = self.paginate_queryset(filtered_queryset)
+        return filtered_queryset
+
+
+class BoardTasksApiView(BoardTasksMixin, ListAPIView):
+
+    model = Board
+    serializer_class = TaskSerializer
+    pagination_class = ApiViewPaginator
+    cursor_pagination_class = ApiViewCursorPaginator
+
+    @property
+    def paginator(self):
+        """
+        Keyset pagination is used when client asks for it with ?pagination=cursor
+        or continues with a ?cursor= obtained from a previous page.
+        """
+        if not hasattr(self, '_paginator'):
+            query_params = self.request.query_params
+            if query_params.get('pagination') == 'cursor' or 'cursor' in query_params:
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    @property
+    def paginator_key(self):
+        # Поля ключа курсорной пагинации нужны в строках .values().
+        return getattr(self.paginator, 'ordering', ())
+
+    def get(self, request, *args, **kwargs):
+        """
+        Retrieves all task connected with specified board.
+        ?fields=a,b limits tasks (and columns read) to the listed fields.
+            :param request: HTTP POST request.
+            :returns Response: REST API response.
+        """
+
+        fields = self.get_requested_fields()
+        instance = self.get_object()
+        filtered_queryset = self.get_board_tasks(instance, fields)
+
+        # Только чтение: строки .values() вместо экземпляров TaskSerializer.
+        serializer = TaskRowSerializer(fields)
+        rows = serializer.get_queryset(filtered_queryset, extra=self.paginator_key)
+
+        page = self.paginate_queryset(rows)
 
         if page is not None:
-            serializer = self.serializer_class(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            return self.get_paginated_response(serializer.serialize(page))
+
+        return Response(serializer.serialize(rows))
+
+
+class BoardTasksSearchApiView(BoardTasksMixin, ListAPIView):
+
+    model = Board
+    serializer_class = TaskSerializer
+    pagination_class = SearchCursorPaginator
+
+    def get(self, request, *args, **kwargs):
+        """
+        Full-text search over titles and descriptions of board tasks, ?q=<query>.
+        Results are ordered by rank and cursor-paginated; board task filters apply.
+            :param request: HTTP GET request.
+            :returns Response: REST API response.
+            :raises ValidationError: if query is empty.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not any(char.isalnum() for char in query):
+            raise ValidationError({'q': 'Search query is required.'})
+
+        fields = self.get_requested_fields()
+        instance = self.get_object()
+        queryset = search_tasks(self.get_board_tasks(instance, fields), query)
+
+        serializer = TaskRowSerializer(fields)
+        page = self.paginate_queryset(serializer.get_queryset(queryset, extra=self.paginator.ordering))
+        return self.get_paginated_response(serializer.serialize(page))
+
+
+class BoardTasksExportApiView(BoardTasksMixin, GenericAPIView):
+
+    model = Board
+    serializer_class = TaskSerializer
+
+    def get(self, request, *args, **kwargs):
+        """
+        Streams all tasks of board as NDJSON (default) or CSV, chosen with
+        ?output=ndjson|csv. Accepts the same filters as board tasks listing.
+            :param request: HTTP GET request.
+            :returns StreamingHttpResponse: encoded tasks, one per line.
+            :raises ValidationError: if output format or filters are invalid.
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({'output': 'Expected one of: %s.' % ', '.join(EXPORT_FORMATS)})
+
+        instance = self.get_object()
+        queryset = self.get_board_tasks(instance)
+        content_type, encode = EXPORT_FORMATS[output]
+
+        response = StreamingHttpResponse(encode(iter_task_rows(queryset)), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="board-%s-tasks.%s"' % (instance.pk, output)
+        return response
+
+
+class BaseBulkTaskApiView(APIView):
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+    max_items = 500
+
+    def get_items(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError({'error': 'Expected non-empty list of tasks.'})
+        if len(items) > self.max_items:
+            raise ValidationError({'error': 'Could not process more than %s tasks at once.' % self.max_items})
+        return items
+
+    def make_response(self, results):
+        succeeded = any(result['status'] != 'error' for result in results)
+        return Response(
+            {'results': results},
+            status=status.HTTP_200_OK if succeeded else status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class BulkCreateTaskApiView(BaseBulkTaskApiView):
+
+    def post(self, request, *args, **kwargs):
+        """
+        Creates many tasks at once.
+            :param request: HTTP POST request with list of tasks.
+            :returns Response: REST API response with per-task results.
+        """
+        results = bulk_create_tasks(self.get_items(request))
+        return self.make_response(results)
+
+
+class BulkUpdateTaskApiView(BaseBulkTaskApiView):
+
+    allowed_fields = None
+
+    def put(self, request, *args, **kwargs):
+        """
+        Updates many tasks at once. Every item must contain task id.
+            :param request: HTTP PUT request with list of tasks.
+            :returns Response: REST API response with per-task results.
+        """
+        results = bulk_update_tasks(self.get_items(request), request.user, allowed_fields=self.allowed_fields)
+        return self.make_response(results)
+
+
+class BulkTaskStatusApiView(BulkUpdateTaskApiView):
+
+    allowed_fields = ['status']
+
+
+class AttachmentUploadCreateApiView(APIView):
 
-        serializer = self.serializer_class(filtered_queryset, many=True)
-        return Response(serializer.data)
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Starts resumable upload of task attachment. Parts are sent afterwards
+        with PATCH requests to the returned upload url.
+            :param request: HTTP POST request with `filename` and `size` in bytes.
+            :returns Response: upload id, url and current offset.
+            :raises ValidationError: if filename or size are invalid.
+        """
+        task = get_object_or_404(Task.objects.only('id'), pk=self.kwargs.get('pk'))
+        if not (request.user.is_staff or membership.is_participant(task.pk, request.user.pk)):
+            return Response(
+                {'error': 'Only participants or staff can upload attachments.'},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        filename = request.data.get('filename')
+        size = request.data.get('size')
+        if not isinstance(filename, str) or not os.path.basename(filename):
+            raise ValidationError({'filename': 'This field is required.'})
+        if not isinstance(size, int) or isinstance(size, bool) or not 0 < size <= settings.ATTACHMENT_MAX_SIZE:
+            raise ValidationError({'size': 'Expected size from 1 to %s bytes.' % settings.ATTACHMENT_MAX_SIZE})
+
+        upload = create_upload(task, request.user, filename, size)
+        url = reverse('tasks_api:attachment_upload', kwargs={'pk': upload.pk})
+
+        return Response(
+            {'id': upload.pk, 'url': url, 'offset': upload.offset, 'size': upload.size},
+            status=status.HTTP_201_CREATED,
+            headers={'Location': url, 'Upload-Offset': upload.offset},
+        )
+
+
+class AttachmentUploadApiView(APIView):
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def get_upload(self):
+        return get_object_or_404(AttachmentUpload, pk=self.kwargs.get('pk'), user_id=self.request.user.pk)
+
+    def make_response(self, upload, response_status=status.HTTP_200_OK):
+        return Response(
+            {
+                'id': upload.pk,
+                'offset': upload.offset,
+                'size': upload.size,
+                'completed': upload.completed_at is not None,
+            },
+            status=response_status,
+            headers={'Upload-Offset': upload.offset},
+        )
+
+    def get(self, request, *args, **kwargs):
+        """
+        Returns number of received bytes, the offset to resume upload from
+        (also answers HEAD requests).
+            :param request: HTTP GET request.
+            :returns Response: upload state.
+        """
+        return self.make_response(self.get_upload())
+
+    def patch(self, request, *args, **kwargs):
+        """
+        Appends next part of file. Body is raw bytes of the part, its offset is
+        given in Upload-Offset header. The part is written to disk as it is read
+        from the request, the last part completes the upload.
+            :param request: HTTP PATCH request.
+            :returns Response: upload state, 409 if offset is not the expected one.
+            :raises ValidationError: if offset or length of the part are invalid.
+        """
+        upload = self.get_upload()
+
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            raise ValidationError({'error': 'Upload-Offset and Content-Length headers are required.'})
+
+        if length <= 0:
+            raise ValidationError({'error': 'Part is empty.'})
+        if length > settings.ATTACHMENT_CHUNK_MAX_SIZE:
+            return Response(
+                {'error': 'Part could not be larger than %s bytes.' % settings.ATTACHMENT_CHUNK_MAX_SIZE},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        try:
+            # Тело читается напрямую из потока запроса, минуя парсеры DRF.
+            upload = append_chunk(upload.pk, offset, request._request, length)
+        except UploadOffsetMismatch as exc:
+            upload.offset = exc.offset
+            return self.make_response(upload, status.HTTP_409_CONFLICT)
+        except ValueError as exc:
+            raise ValidationError({'error': str(exc)})
+
+        return self.make_response(upload)
+
+
+class TaskAttachmentApiView(APIView):
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Downloads task attachment. Supports single byte Range requests; with
+        ATTACHMENT_ACCEL_REDIRECT_PREFIX set the file is sent by nginx.
+            :param request: HTTP GET request.
+            :returns HttpResponse: file (200), its part (206) or 416 for invalid range.
+            :raises Http404: if task has no attachment.
+        """
+        task = get_object_or_404(Task.objects.only('id', 'attachment'), pk=self.kwargs.get('pk'))
+        if not task.attachment:
+            raise Http404
+
+        name = task.attachment.name
+        filename = get_attachment_filename(task)
+
+        prefix = settings.ATTACHMENT_ACCEL_REDIRECT_PREFIX
+        if prefix:
+            try:
+                etag = get_attachment_etag(name)
+            except FileNotFoundError:
+                raise Http404
+            response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+            response['X-Accel-Redirect'] = '%s/%s' % (prefix.rstrip('/'), quote(name))
+            response['Content-Disposition'] = content_disposition_header(True, filename)
+            response['ETag'] = etag
+            return response
+
+        try:
+            file = open(default_storage.path(name), 'rb')
+        except FileNotFoundError:
+            raise Http404
+        stat = os.fstat(file.fileno())
+        size = stat.st_size
+        etag = get_attachment_etag(name, stat)
+
+        byte_range = None
+        if request.headers.get('If-Range', etag) == etag:
+            try:
+                byte_range = parse_range(request.headers.get('Range'), size)
+            except UnsatisfiableRange:
+                file.close()
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = 'bytes */%s' % size
+                return response
+
+        if byte_range is None:
+            response = FileResponse(file, as_attachment=True, filename=filename)
+        else:
+            start, end = byte_range
+            response = FileResponse(
+                RangeFile(file, start, end - start + 1),
+                as_attachment=True,
+                filename=filename,
+                status=status.HTTP_206_PARTIAL_CONTENT,
+            )
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = 'bytes %s-%s/%s' % (start, end, size)
+
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        return response
+
+
+class TaskImportCreateApiView(APIView):
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+    # Файл принимается только multipart-формой, независимо от DEFAULT_PARSER_CLASSES.
+    parser_classes = [MultiPartParser]
+    extensions = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+    def post(self, request, *args, **kwargs):
+        """
+        Uploads CSV or NDJSON file with tasks (columns as in export) and starts
+        its import in background. Progress and rejected rows are returned by
+        the import url.
+            :param request: HTTP POST multipart request with `file`, optional
+                `format` (by default from file extension) and `board` to create
+                all tasks on.
+            :returns Response: import id, url and state (202).
+            :raises ValidationError: if file, format or board are invalid.
+        """
+        file = request.FILES.get('file')
+        if file is None:
+            raise ValidationError({'file': 'This field is required.'})
+        if file.size > settings.IMPORT_MAX_SIZE:
+            return Response(
+                {'error': 'File could not be larger than %s bytes.' % settings.IMPORT_MAX_SIZE},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        file_format = request.data.get('format') or self.extensions.get(os.path.splitext(file.name)[1].lower())
+        if file_format not in IMPORT_READERS:
+            raise ValidationError({'format': 'Expected one of: %s.' % ', '.join(IMPORT_READERS)})
+
+        board = None
+        board_id = str(request.data.get('board') or '')
+        if board_id:
+            if board_id.isdigit():
+                board = Board.objects.filter(pk=board_id).only('id').first()
+            if board is None:
+                raise ValidationError({'board': 'Board not found.'})
+
+        task_import = TaskImport.objects.create(user=request.user, board=board, file=file, format=file_format)
+        transaction.on_commit(lambda: import_tasks.delay(str(task_import.pk)))
+
+        url = reverse('tasks_api:task_import', kwargs={'pk': task_import.pk})
+        return Response(
+            {'id': task_import.pk, 'url': url, 'state': task_import.state},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': url},
+        )
+
+
+class TaskImportApiView(APIView):
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Returns progress of task import and its rejected rows.
+            :param request: HTTP GET request.
+            :returns Response: import state, counters and row errors.
+        """
+        imports = TaskImport.objects.all() if request.user.is_staff else TaskImport.objects.filter(user_id=request.user.pk)
+        task_import = get_object_or_404(imports, pk=self.kwargs.get('pk'))
+
+        return Response({
+            'id': task_import.pk,
+            'state': task_import.state,
+            'format': task_import.format,
+            'board': task_import.board_id,
+            'processed': task_import.processed,
+            'created': task_import.created,
+            'failed': task_import.failed,
+            'errors': task_import.errors,
+            'message': task_import.message,
+            'created_at': task_import.created_at,
+            'started_at': task_import.started_at,
+            'finished_at': task_import.finished_at,
+        })
 
 
 class UserRegistrationApiView(CreateAPIView):
@@ -201,5 +642,15 @@ __all__ = [
     'CreateTaskApiView',
     'RetrieveUpdateDestroyTaskApiView',
     'BoardTasksApiView',
+    'BoardTasksSearchApiView',
+    'BoardTasksExportApiView',
+    'BulkCreateTaskApiView',
+    'BulkUpdateTaskApiView',
+    'BulkTaskStatusApiView',
+    'AttachmentUploadCreateApiView',
+    'AttachmentUploadApiView',
+    'TaskAttachmentApiView',
+    'TaskImportCreateApiView',
+    'TaskImportApiView',
     'UserRegistrationApiView',
 ]
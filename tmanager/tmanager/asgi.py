@@ -2,6 +2,7 @@
 ASGI config for tmanager project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with run_asgi.sh (gunicorn with uvicorn workers).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -9,8 +10,9 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tmanager.settings')
 
-application = get_asgi_application()
+application = ASGIStaticFilesHandler(get_asgi_application())
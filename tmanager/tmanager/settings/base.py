@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 
 from celery.schedules import crontab
+from kombu import Queue
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
@@ -28,7 +29,27 @@ INSTALLED_APPS = [
     'drf_yasg',
 ]
 
+SIMPLE_JWT = {
+    # Токены содержат username и is_staff, при обновлении они перечитываются из базы.
+    'TOKEN_OBTAIN_SERIALIZER': 'tasks_api.serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'tasks_api.serializers.ClaimsTokenRefreshSerializer',
+}
+
+# Сколько секунд состояние пользователя (is_staff, is_active) берется из кэша
+# без чтения из базы (см. ClaimsJWTAuthentication).
+AUTH_USER_STATE_TIMEOUT = 300
+
+REST_FRAMEWORK = {
+    # Тот же JSON, что и у JSONRenderer, но кодируется orjson, если он установлен.
+    'DEFAULT_RENDERER_CLASSES': [
+        'tasks_api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 MIDDLEWARE = [
+    'tasks_api.middleware.MetricsMiddleware',
+    'tasks_api.middleware.SQLProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,10 +118,58 @@ MEDIA_ROOT = 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# CACHE conf
+
+# Как часто (в секундах) процесс сверяет версии своих копий справочников
+# Status, Tag и Priority с версиями в общем кэше.
+LOOKUP_CACHE_CHECK_INTERVAL = 5
+
+# Кэш сериализованных бордов и задач (см. tasks_api/response_cache.py).
+# Локально используется LocMemCache по умолчанию, в проде - Redis.
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 60
+
 # CELERY conf
 
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', "redis://127.0.0.1:6379/0")
 
+# Очереди: уведомления обслуживаются отдельными воркерами и не ждут утреннюю
+# рассылку и обслуживание истории (см. run.sh, concurrency задается там).
+CELERY_TASK_QUEUES = (
+    Queue('notifications'),
+    Queue('digest'),
+    Queue('maintenance'),
+)
+CELERY_TASK_DEFAULT_QUEUE = 'notifications'
+
+# Приоритет внутри очереди: 0 - наивысший (так считает транспорт Redis).
+CELERY_TASK_ROUTES = {
+    'tasks_api.tasks.send_email_notifications': {'queue': 'notifications', 'priority': 0},
+    'tasks_api.tasks.flush_notifications': {'queue': 'notifications', 'priority': 0},
+    'tasks_api.tasks.send_bulk_email_notifications': {'queue': 'notifications', 'priority': 3},
+    'send_daily_project_notification': {'queue': 'digest', 'priority': 0},
+    'tasks_api.tasks.send_daily_digest_batch': {'queue': 'digest', 'priority': 5},
+    'maintain_task_history': {'queue': 'maintenance'},
+    'tasks_api.tasks.import_tasks': {'queue': 'maintenance'},
+}
+CELERY_TASK_QUEUE_MAX_PRIORITY = 9
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'sep': ':',
+}
+
+# Воркер берет следующую задачу только после завершения текущей: иначе
+# приоритеты не работают, а длинные задачи копятся у одного процесса.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Ограничение частоты на процесс воркера: пачки рассылки не должны упираться
+# в лимиты SMTP сервера, на котором работают и уведомления.
+CELERY_TASK_ANNOTATIONS = {
+    'tasks_api.tasks.send_daily_digest_batch': {'rate_limit': os.getenv('DAILY_DIGEST_RATE_LIMIT', '30/m')},
+}
+
 # CELERY beat conf
 
 CELERY_BEAT_SCHEDULE = {
@@ -108,8 +177,72 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'send_daily_project_notification',
         'schedule': crontab(hour='9', minute='15'),
     },
+    'maintain_task_history': {
+        'task': 'maintain_task_history',
+        'schedule': crontab(hour='3', minute='0'),
+    },
 }
 
+# История задач: сколько полных месяцев хранить в базе, на сколько месяцев
+# вперед создавать секции и куда складывать архивы старых секций.
+TASK_HISTORY_RETENTION_MONTHS = 12
+TASK_HISTORY_PARTITIONS_AHEAD = 3
+TASK_HISTORY_ARCHIVE_DIR = BASE_DIR / 'archive'
+
+# Ежедневная рассылка: размер пачки писем на одну celery задачу,
+# размер чанка серверного курсора и максимум задач в одном письме.
+DAILY_DIGEST_BATCH_SIZE = 100
+DAILY_DIGEST_CHUNK_SIZE = 2000
+DAILY_DIGEST_MAX_TASKS = 100
+
+# Конфигурация полнотекстового поиска PostgreSQL: 'simple' не зависит
+# от языка, задачи пишутся и на русском, и на английском.
+TASK_SEARCH_CONFIG = 'simple'
+
+# Время жизни записей индекса участников задач (проверки прав).
+MEMBERSHIP_CACHE_TIMEOUT = 300
+
+# Размер чанка серверного курсора при потоковой выгрузке задач борда.
+EXPORT_CHUNK_SIZE = 2000
+
+# Загрузка вложений частями (см. tasks_api/attachments.py): предельный размер
+# файла и одной части в байтах.
+ATTACHMENT_MAX_SIZE = 1024 * 1024 * 1024
+ATTACHMENT_CHUNK_MAX_SIZE = 16 * 1024 * 1024
+
+# Префикс internal location в nginx. Если задан, файл отдает nginx по заголовку
+# X-Accel-Redirect (вместе с Range), иначе - Django через sendfile сервера.
+ATTACHMENT_ACCEL_REDIRECT_PREFIX = os.getenv('ATTACHMENT_ACCEL_REDIRECT_PREFIX')
+
+# Импорт задач из файлов (см. tasks_api/imports.py): строк в одной пачке
+# (одна транзакция), сколько ошибок строк хранить, предельный размер файла
+# и запись через COPY на PostgreSQL.
+IMPORT_BATCH_SIZE = 2000
+IMPORT_MAX_ERRORS = 1000
+IMPORT_MAX_SIZE = 512 * 1024 * 1024
+IMPORT_USE_COPY = True
+
+# Окно (в секундах), в течение которого уведомления об изменениях задач
+# копятся и отправляются получателю одним письмом. 0 - отправлять сразу.
+# Отметки о запланированной отправке хранятся в кэше, поэтому окно требует
+# общего для веб-процессов и воркеров кэша (см. tasks_api/checks.py).
+NOTIFICATION_COALESCE_WINDOW = 0
+
+# Соединение с почтовым сервером, простаивавшее дольше этого
+# времени (в секундах), проверяется командой NOOP перед отправкой.
+MAIL_HEALTHCHECK_INTERVAL = 30
+
+# Адреса, с которых доступен /metrics (Prometheus).
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(',')
+
+# Профилирование SQL (см. tasks_api/profiling.py): доля профилируемых запросов
+# и задач, токен для заголовка X-Profile-SQL вне DEBUG, порог медленного
+# запроса (мс) и число одинаковых запросов с одной строки кода, считающееся N+1.
+SQL_PROFILING_SAMPLE_RATE = float(os.getenv('SQL_PROFILING_SAMPLE_RATE', 0))
+SQL_PROFILING_TOKEN = os.getenv('SQL_PROFILING_TOKEN')
+SQL_SLOW_QUERY_MS = 100
+SQL_PROFILING_REPEATED_THRESHOLD = 5
+
 # LOGGING conf
 
 LOGGING = {
@@ -124,4 +257,9 @@ LOGGING = {
         "handlers": ["console"],
         "level": "WARNING",
     },
+    "loggers": {
+        "tasks_api.profiling": {
+            "level": "INFO",
+        },
+    },
 }
@@ -13,18 +13,33 @@ EMAIL_USE_TLS = True
 
 # REST FRAMEWORK configuration
 
+# Дополняет настройки из base, а не заменяет их.
 REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'tasks_api.renderers.FastJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
     ],
 }
 
+# Cache
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', 'redis://127.0.0.1:6379/1'),
+    }
+}
+
+# Notifications
+
+NOTIFICATION_COALESCE_WINDOW = 60
+
 # Database
 
 DATABASES = {